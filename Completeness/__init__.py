@@ -3,3 +3,8 @@
 from .field_matching_utils import *
 from .io_utils import *
 from .score_utils import *
+from .cache_utils import *
+from .batch_utils import *
+from .profiling_utils import *
+from .report_utils import *
+from .render_utils import *
@@ -0,0 +1,237 @@
+import os
+import io
+import contextlib
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+from Completeness.io_utils import *
+from Completeness.score_utils import *
+
+# Functions for scoring many metadata files against one reference dictionary
+
+# Set once per worker process by init_batch_worker so that the reference dictionary
+# is not sent along with every file
+_batch_worker_config = {}
+
+
+def get_batch_file_paths(data_path, extensions=('csv','xls','xlsx','parquet','feather')):
+    """
+    Get the list of metadata files to be scored in a batch.
+    If data_path is a directory, all files inside it with a supported extension are returned.
+    Otherwise data_path is read as a manifest file listing one metadata file path per line.
+    Relative paths in a manifest are resolved relative to the manifest location.
+
+    :param data_path: Path to a directory of metadata files or to a manifest file
+    :type data_path: str
+    :param extensions: Metadata file types picked up from a directory (see get_metadata_file_type)
+    :type extensions: tuple(str)
+    :return: List of metadata file paths
+    :rtype: List[str]
+
+    """
+
+    assert os.path.exists(data_path), "Batch data path not found."
+
+    if os.path.isdir(data_path):
+        file_paths = [os.path.join(data_path, f) for f in sorted(os.listdir(data_path)) if get_metadata_file_type(f) in extensions]
+    else:
+        manifest_dir = os.path.dirname(os.path.abspath(data_path))
+        with open(data_path, 'r') as f:
+            lines = [line.strip() for line in f]
+        file_paths = [line if os.path.isabs(line) else os.path.join(manifest_dir, line) for line in lines if line and not line.startswith('#')]
+
+    return file_paths
+
+
+def init_batch_worker(required_fields, field_matching_methods, chunksize=None, cache_dir=None, coverage_params_list=None):
+    """
+    Initializer for batch worker processes. Stores the required fields and matching configuration for the worker.
+
+    :param required_fields: List of all required metadata fields.
+    :type required_fields: List[str]
+    :param field_matching_methods: Dictionary with names of field matching methods to be used and parameters for each method
+    :type field_matching_methods: Dictionary
+    :param chunksize: Number of rows per chunk for record-level checks, defaults to None which loads files whole
+    :type chunksize: int
+    :param cache_dir: Directory for the header map cache, defaults to None which disables caching
+    :type cache_dir: str
+    :param coverage_params_list: List of coverage parameter dictionaries (see get_coverage_params), defaults to None which skips the coverage check
+    :type coverage_params_list: List[Dictionary]
+
+    """
+
+    _batch_worker_config['required_fields'] = required_fields
+    _batch_worker_config['field_matching_methods'] = field_matching_methods
+    _batch_worker_config['chunksize'] = chunksize
+    _batch_worker_config['cache_dir'] = cache_dir
+    _batch_worker_config['coverage_params_list'] = coverage_params_list
+
+
+def get_percentage_dict(percentages):
+    """
+    Convert a series of percentages into a JSON serializable dictionary rounded to two decimals.
+    Percentages that are not defined (e.g. for a file with a header but no records) are stored as None.
+
+    :param percentages: Series with the field names as index and the percentages as values
+    :type percentages: pd.Series
+    :return: Dictionary with the field names as keys and the percentages as values
+    :rtype: Dictionary
+
+    """
+    return {k: (float(v) if np.isfinite(v) else None) for k, v in percentages.round(2).items()}
+
+
+def get_coverage_dict(coverage_summary_df):
+    """
+    Convert a coverage summary table (see multi_coverage_check) into a JSON serializable dictionary.
+    Divergences that are not defined (e.g. for a field that is not found) are stored as None.
+
+    :param coverage_summary_df: Dataframe with the target fields as index and one row of coverage results per field
+    :type coverage_summary_df: pd.DataFrame
+    :return: Dictionary with the target fields as keys and the coverage results of each field as values
+    :rtype: Dictionary
+
+    """
+    return {target_field: {
+                'metric': row['metric'],
+                'reference': row['reference'],
+                'records': int(row['records']),
+                'unique_values': int(row['unique_values']),
+                'divergence': float(row['divergence']) if np.isfinite(row['divergence']) else None,
+                'status': row['status'],
+            } for target_field, row in coverage_summary_df.iterrows()}
+
+
+def score_metadata_file(file_path, required_fields=None, field_matching_methods=None, chunksize=None, cache_dir=None, coverage_params_list=None):
+    """
+    Perform dataset-level and record-level completeness checks on one metadata file, and optionally a coverage check
+    of several target fields against a uniform distribution.
+    Terminal output of the checks is suppressed and errors are recorded in the result instead of being raised,
+    so that one bad file does not stop a batch.
+    In a batch worker process, arguments that are not provided are taken from the values set by init_batch_worker.
+
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :param required_fields: List of all required metadata fields.
+    :type required_fields: List[str]
+    :param field_matching_methods: Dictionary with names of field matching methods to be used and parameters for each method
+    :type field_matching_methods: Dictionary
+    :param chunksize: Number of rows per chunk for record-level checks, defaults to None which loads files whole
+    :type chunksize: int
+    :param cache_dir: Directory for the header map cache, defaults to None which disables caching
+    :type cache_dir: str
+    :param coverage_params_list: List of coverage parameter dictionaries (see get_coverage_params), defaults to None which skips the coverage check.
+        The coverage check needs whole columns, so with a chunksize the matched columns of the file are loaded whole for it.
+    :type coverage_params_list: List[Dictionary]
+    :return: JSON serializable dictionary with the completeness (and coverage) results for the file
+    :rtype: Dictionary
+
+    """
+
+    if _batch_worker_config:
+        if required_fields is None:
+            required_fields = _batch_worker_config['required_fields']
+        if field_matching_methods is None:
+            field_matching_methods = _batch_worker_config['field_matching_methods']
+        if chunksize is None:
+            chunksize = _batch_worker_config['chunksize']
+        if cache_dir is None:
+            cache_dir = _batch_worker_config['cache_dir']
+        if coverage_params_list is None:
+            coverage_params_list = _batch_worker_config['coverage_params_list']
+
+    file_result = {
+        'file': file_path,
+        'status': 'ok',
+    }
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if chunksize is None:
+                metadata_df = load_metadata_file(file_path)
+                assert metadata_df is not None, "Metadata file could not be loaded."
+                metadata_header = metadata_df
+            else:
+                metadata_header = read_metadata_header(file_path)
+                assert metadata_header is not None, "Metadata file could not be loaded."
+
+            completeness_report = dataset_level_completeness_check(metadata_header, required_fields, field_matching_methods, cache_dir=cache_dir)
+            available_header_map = completeness_report['available_header_map']
+
+            if chunksize is not None:
+                metadata_df = load_metadata_file(file_path, chunksize=chunksize)
+            record_report = record_level_completeness_check(metadata_df, required_fields, available_header_map, visualize=False)
+
+            if coverage_params_list:
+                from Coverage.compute_coverage import multi_coverage_check
+
+                if chunksize is not None:
+                    target_fields = [coverage_params['target_field'] for coverage_params in coverage_params_list]
+                    metadata_df = load_metadata_file(file_path, usecols=get_target_usecols(available_header_map, target_fields))
+                    assert metadata_df is not None, "Metadata file could not be loaded."
+                coverage_summary_df, _ = multi_coverage_check(metadata_df, required_fields, available_header_map, coverage_params_list)
+
+        file_result.update({
+            'completeness_score': completeness_report['completeness_score'],
+            'available_header_map': available_header_map,
+            'missing_headers': completeness_report['missing_headers'],
+            'unexpected_headers': completeness_report['unexpected_headers'],
+            'total_records': int(record_report['total_records']),
+            'complete_records': int(record_report['complete_records']),
+            'column_available_percentage': get_percentage_dict(record_report['column_completeness']['Available (%)']),
+        })
+        if record_report['required_column_completeness'] is not None:
+            file_result['required_field_available_percentage'] = get_percentage_dict(record_report['required_column_completeness']['Available (%)'])
+        if coverage_params_list:
+            file_result['coverage'] = get_coverage_dict(coverage_summary_df)
+    except Exception as e:
+        file_result['status'] = 'error'
+        file_result['error'] = f"{type(e).__name__}: {e}"
+
+    return file_result
+
+
+def batch_completeness_check(file_paths, required_fields, field_matching_methods, num_workers=None, chunksize=None, cache_dir=None, coverage_params_list=None):
+    """
+    Score a list of metadata files against one set of required fields using a pool of worker processes.
+    Each worker imports the package and receives the required fields and matching configuration once,
+    after which files are distributed over the pool.
+    User-assisted matching is interactive and is therefore disabled for batch runs.
+
+    :param file_paths: List of metadata file paths
+    :type file_paths: List[str]
+    :param required_fields: List of all required metadata fields.
+    :type required_fields: List[str]
+    :param field_matching_methods: Dictionary with names of field matching methods to be used and parameters for each method
+    :type field_matching_methods: Dictionary
+    :param num_workers: Number of worker processes, defaults to None which uses the number of CPUs.
+        With a single worker the files are scored in the current process.
+    :type num_workers: int
+    :param chunksize: Number of rows per chunk for record-level checks, defaults to None which loads files whole
+    :type chunksize: int
+    :param cache_dir: Directory for the header map cache, defaults to None which disables caching
+    :type cache_dir: str
+    :param coverage_params_list: List of coverage parameter dictionaries (see get_coverage_params), defaults to None which skips the coverage check
+    :type coverage_params_list: List[Dictionary]
+    :return: List of per-file result dictionaries in the same order as file_paths
+    :rtype: List[Dictionary]
+
+    """
+
+    if 'UA' in field_matching_methods and field_matching_methods['UA'][0]:
+        warnings.warn("User-assisted matching is not available in batch mode and has been disabled.")
+        field_matching_methods = dict(field_matching_methods)
+        field_matching_methods['UA'] = (False, field_matching_methods['UA'][1])
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_workers = max(1, min(num_workers, len(file_paths)))
+
+    if num_workers == 1:
+        return [score_metadata_file(file_path, required_fields, field_matching_methods, chunksize, cache_dir, coverage_params_list) for file_path in file_paths]
+
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=init_batch_worker,
+                             initargs=(required_fields, field_matching_methods, chunksize, cache_dir, coverage_params_list)) as executor:
+        batch_results = list(executor.map(score_metadata_file, file_paths))
+
+    return batch_results
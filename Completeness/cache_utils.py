@@ -0,0 +1,182 @@
+import os
+import json
+import hashlib
+import threading
+
+# Functions for caching matched header maps on disk.
+# A header map is stored under a key made from the dataset header list, the required fields
+# and the field matching configuration, so files resubmitted with the same columns are matched instantly.
+# Answers given in user-assisted matching are stored per reference configuration and reused for any file.
+
+
+def get_object_hash(obj):
+    """
+    Compute a stable hash of a JSON serializable object.
+
+    :param obj: Object to hash. Dictionary keys are sorted and non-serializable values are converted to strings.
+    :type obj: object
+    :return: Hexadecimal SHA-256 hash
+    :rtype: str
+
+    """
+
+    serialized = json.dumps(obj, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def get_reference_signature(required_fields, field_matching_methods):
+    """
+    Compute the signature of a reference dictionary level and field matching configuration.
+    User-assisted matching settings are not part of the signature, so stored answers remain valid
+    when the ranking method is changed.
+
+    :param required_fields: List of required fields
+    :type required_fields: List[str]
+    :param field_matching_methods: Dictionary with names of field matching methods to be used and parameters for each method
+    :type field_matching_methods: Dictionary
+    :return: Reference signature
+    :rtype: str
+
+    """
+
+    automatic_methods = {k:v for k,v in field_matching_methods.items() if k != 'UA'}
+    return get_object_hash({'required_fields': list(required_fields), 'field_matching_methods': automatic_methods})
+
+
+def get_header_map_cache_key(dataset_headers, required_fields, field_matching_methods):
+    """
+    Compute the cache key of a header map from the dataset headers, the required fields and the field matching configuration.
+
+    :param dataset_headers: Header fields present in dataset metadata.
+    :type dataset_headers: List[str]
+    :param required_fields: List of required fields
+    :type required_fields: List[str]
+    :param field_matching_methods: Dictionary with names of field matching methods to be used and parameters for each method
+    :type field_matching_methods: Dictionary
+    :return: Cache key
+    :rtype: str
+
+    """
+
+    headers_hash = get_object_hash([str(header) for header in dataset_headers])
+    reference_hash = get_reference_signature(required_fields, field_matching_methods)
+    methods_hash = get_object_hash(field_matching_methods.get('UA'))
+    return get_object_hash([headers_hash, reference_hash, methods_hash])
+
+
+def _read_cache_file(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading cache file {path}: {e}")
+        return None
+
+
+def write_file_atomic(path, write_function, suffix=''):
+    """
+    Write a file through a temporary file in the same directory, which replaces the file once it is complete,
+    so that concurrent readers never see a partial file.
+
+    :param path: Path of the file
+    :type path: str
+    :param write_function: Function writing the file contents, called with the path of the temporary file
+    :type write_function: Callable
+    :param suffix: Suffix of the temporary file, for writers that add an extension to paths without it (e.g. '.npz' for numpy.savez)
+    :type suffix: str
+
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp{suffix}"
+    try:
+        write_function(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _write_cache_file(path, data):
+    def write_json(temp_path):
+        with open(temp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    write_file_atomic(path, write_json)
+
+
+def load_cached_header_map(cache_dir, cache_key):
+    """
+    Load a stored header map.
+
+    :param cache_dir: Cache directory
+    :type cache_dir: str
+    :param cache_key: Cache key from get_header_map_cache_key
+    :type cache_key: str
+    :return: Dictionary with the required field names as keys and the matched dataset field names as values, or None if not cached
+    :rtype: Dictionary
+
+    """
+
+    cache_entry = _read_cache_file(os.path.join(cache_dir, 'header_maps', cache_key+'.json'))
+    if cache_entry is None:
+        return None
+    return cache_entry['available_header_map']
+
+
+def save_cached_header_map(cache_dir, cache_key, available_header_map):
+    """
+    Store a header map.
+
+    :param cache_dir: Cache directory
+    :type cache_dir: str
+    :param cache_key: Cache key from get_header_map_cache_key
+    :type cache_key: str
+    :param available_header_map: Dictionary with the required field names as keys and the matched dataset field names as values
+    :type available_header_map: Dictionary
+
+    """
+
+    _write_cache_file(os.path.join(cache_dir, 'header_maps', cache_key+'.json'), {'available_header_map': available_header_map})
+
+
+def load_user_answers(cache_dir, reference_signature):
+    """
+    Load the answers previously given in user-assisted matching for a reference configuration.
+
+    :param cache_dir: Cache directory
+    :type cache_dir: str
+    :param reference_signature: Reference signature from get_reference_signature
+    :type reference_signature: str
+    :return: Dictionary with required field names as keys and the list of dataset field names chosen for them as values
+    :rtype: Dictionary
+
+    """
+
+    user_answers = _read_cache_file(os.path.join(cache_dir, 'user_answers', reference_signature+'.json'))
+    return user_answers if user_answers is not None else {}
+
+
+def save_user_answers(cache_dir, reference_signature, new_answers):
+    """
+    Add answers given in user-assisted matching to the stored answers for a reference configuration.
+
+    :param cache_dir: Cache directory
+    :type cache_dir: str
+    :param reference_signature: Reference signature from get_reference_signature
+    :type reference_signature: str
+    :param new_answers: Dictionary with required field names as keys and the chosen dataset field names as values
+    :type new_answers: Dictionary
+
+    """
+
+    if not new_answers:
+        return
+    user_answers = load_user_answers(cache_dir, reference_signature)
+    for required_field, dataset_field in new_answers.items():
+        chosen_fields = user_answers.setdefault(required_field, [])
+        if dataset_field not in chosen_fields:
+            chosen_fields.append(dataset_field)
+    _write_cache_file(os.path.join(cache_dir, 'user_answers', reference_signature+'.json'), user_answers)
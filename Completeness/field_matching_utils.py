@@ -1,9 +1,13 @@
 import os
 import numpy as np
-from rapidfuzz import fuzz, process
-from sentence_transformers import SentenceTransformer, util
 import re
 import warnings
+from collections import deque
+
+from Completeness.cache_utils import write_file_atomic
+
+# rapidfuzz and sentence_transformers are imported inside the functions that use them,
+# so that strict, soft and dictionary matching do not pay their import cost.
 
 def clean_string(s):
     """Cleans an input string by replacing all non-alphanumeric characters with "space".
@@ -35,11 +39,74 @@ def strict_field_matching(dataset_fields, required_fields):
             field_mappings[field] = field
     return field_mappings
 
+def build_substring_automaton(patterns):
+    """Builds an Aho-Corasick automaton for finding all occurrences of a set of patterns in a text in one pass.
+
+    :param patterns: Patterns to search for.
+    :type patterns: List[str]
+    :return: Tuple with the goto transitions, failure links and pattern indices found at each state
+    :rtype: tuple(List[dict], List[int], List[List[int]])
+    """
+    goto = [{}]
+    fail = [0]
+    output = [[]]
+
+    for pattern_idx, pattern in enumerate(patterns):
+        state = 0
+        for ch in pattern:
+            next_state = goto[state].get(ch)
+            if next_state is None:
+                next_state = len(goto)
+                goto[state][ch] = next_state
+                goto.append({})
+                fail.append(0)
+                output.append([])
+            state = next_state
+        output[state].append(pattern_idx)
+
+    # Breadth-first pass to set the failure links and merge the outputs of suffix states
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for ch, next_state in goto[state].items():
+            queue.append(next_state)
+            fail_state = fail[state]
+            while fail_state and ch not in goto[fail_state]:
+                fail_state = fail[fail_state]
+            fail[next_state] = goto[fail_state].get(ch, 0)
+            output[next_state] = output[next_state] + output[fail[next_state]]
+
+    return goto, fail, output
+
+def find_substring_matches(automaton, text):
+    """Finds the patterns of an Aho-Corasick automaton that occur in a text.
+
+    :param automaton: Automaton returned by build_substring_automaton.
+    :type automaton: tuple(List[dict], List[int], List[List[int]])
+    :param text: Text to search.
+    :type text: str
+    :return: Indices of the patterns found in the text
+    :rtype: set[int]
+    """
+    goto, fail, output = automaton
+    found = set(output[0])
+    state = 0
+    for ch in text:
+        while state and ch not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(ch, 0)
+        if output[state]:
+            found.update(output[state])
+    return found
+
 def soft_field_matching(dataset_fields, required_fields):
     """
     Given lists of required fields and dataset fields, returns a mapping from
     each required field to a dataset field if the cleaned required field name is found 
     in the cleaned dataset field name.
+    All cleaned required field names are searched for in a single pass over each dataset field.
+    When several dataset fields contain a required field, the dataset field with the shortest
+    cleaned name (i.e. the closest match) is used, and ties go to the first such dataset field.
     
     :param dataset_fields: Header fields present in dataset metadata.
     :type dataset_fields: List[str]
@@ -49,23 +116,56 @@ def soft_field_matching(dataset_fields, required_fields):
     :rtype: Dictionary
 
     """
-    cleaned_dataset_fields = [(clean_string(item), item) for item in dataset_fields]
+    cleaned_required_fields = list(dict.fromkeys(clean_string(field) for field in required_fields))
+    automaton = build_substring_automaton(cleaned_required_fields)
+
+    best_matches = {}
+    for dataset_field in dataset_fields:
+        cleaned_dataset_field = clean_string(dataset_field)
+        for pattern_idx in find_substring_matches(automaton, cleaned_dataset_field):
+            best_match = best_matches.get(pattern_idx)
+            if best_match is None or len(cleaned_dataset_field) < best_match[0]:
+                best_matches[pattern_idx] = (len(cleaned_dataset_field), dataset_field)
+
+    pattern_lookup = {pattern: idx for idx, pattern in enumerate(cleaned_required_fields)}
     field_mappings = {}
     for field in required_fields:
-        cleaned_field = clean_string(field)
-        for cleaned_dataset_field, dataset_field in cleaned_dataset_fields:
-            if cleaned_field in cleaned_dataset_field:
-                field_mappings[field] = dataset_field
+        pattern_idx = pattern_lookup[clean_string(field)]
+        if pattern_idx in best_matches:
+            field_mappings[field] = best_matches[pattern_idx][1]
     return field_mappings
 
-def dictionary_field_matching(dataset_fields, required_fields, field_dictionary=None):
+def compile_alias_index(field_dictionary):
+
+    """
+    Builds an index from cleaned aliases to the fields they refer to. Each field name is also
+    included as an alias of itself. The index only depends on the reference dictionary, so it can be
+    built once and reused with dictionary_field_matching for every metadata file.
+
+    :param field_dictionary: A dictionary with the required_fields as keys and a list of common variations for each required field as values.
+    :type field_dictionary: dict[str]
+    :return: Dictionary with cleaned aliases as keys and the list of fields with that alias as values
+    :rtype: dict[str]
+
+    """
+
+    alias_index = {}
+    for field, aliases in field_dictionary.items():
+        for alias in list(aliases) + [field]:
+            alias_fields = alias_index.setdefault(clean_string(alias), [])
+            if field not in alias_fields:
+                alias_fields.append(field)
+    return alias_index
+
+def dictionary_field_matching(dataset_fields, required_fields, field_dictionary=None, alias_index=None):
 
     """
     Given lists of required fields and dataset fields, returns a mapping from
     each required field to a dataset field if the required field name is found 
     in the dataset field name. If a field alias dictionary is provided, all cleaned
     aliases for each required field are checked against each dataset field to
-    find possible matches.
+    find possible matches. The first dataset field matching an alias is used for each required field.
+    A precompiled alias index (see compile_alias_index) can be provided instead of the field alias dictionary.
 
     :param dataset_fields: Header fields present in dataset metadata.
     :type dataset_fields: List[str]
@@ -73,34 +173,128 @@ def dictionary_field_matching(dataset_fields, required_fields, field_dictionary=
     :type required_fields: List[str]
     :param field_dictionary: A dictionary with the required_fields as keys and a list of common variations for each required field as values.
     :type field_dictionary: dict[str]
+    :param alias_index: A dictionary with cleaned aliases as keys and the list of fields with that alias as values.
+    :type alias_index: dict[str]
     :return: Dictionary with required_fields present in dataset_fields as keys and the corresponding dataset fields as values
     :rtype: dict[str]
 
     """
     
-    if field_dictionary is not None:
-        field_mappings = {}
-
-        dataset_fields_cleaned = [(clean_string(item), item) for item in dataset_fields]     
-
-        for field in required_fields:
-            if field in field_dictionary:
-                possible_matches = field_dictionary[field]
-                possible_matches.append(field)
-                possible_matches_cleaned = [clean_string(item) for item in possible_matches]
-                match = next((header for clean_header,header in dataset_fields_cleaned if clean_header in possible_matches_cleaned), None)
-                if match:
-                    field_mappings[field] = match
+    if alias_index is None and field_dictionary is not None:
+        alias_index = compile_alias_index(field_dictionary)
+
+    if alias_index is not None:
+        required_field_set = set(required_fields)
+        matched_fields = {}
+
+        for header in dataset_fields:
+            for field in alias_index.get(clean_string(header), ()):
+                if field in required_field_set and field not in matched_fields:
+                    matched_fields[field] = header
+
+        field_mappings = {field: matched_fields[field] for field in required_fields if matched_fields.get(field)}
     else:
         warnings.warn("Metadata field mapping dictionary path not provided.\nReturning strict matching results")
         field_mappings = strict_field_matching(dataset_fields, required_fields)
         
     return field_mappings
 
-def fuzzy_field_matching(dataset_fields, required_fields, similarity_threshold=70):
+def get_fuzzy_score_matrix(dataset_fields, required_fields, workers=-1):
+
+    """Computes the fuzzy similarity scores between every required field and every dataset field in a single call.
+    
+    :param dataset_fields: Header fields present in dataset metadata.
+    :type dataset_fields: List[str]
+    :param required_fields: Fields of interest.
+    :type required_fields: List[str]
+    :param workers: Number of threads used to compute the scores, -1 uses all available cores
+    :type workers: int
+    :return: Matrix of fuzzy scores (0-100) with one row per required field and one column per dataset field
+    :rtype: np.ndarray
+
+    """
+
+    from rapidfuzz import fuzz, process
+
+    if len(dataset_fields) == 0 or len(required_fields) == 0:
+        return np.zeros((len(required_fields), len(dataset_fields)))
+
+    return process.cdist(required_fields, dataset_fields, scorer=fuzz.ratio, dtype=np.float64, workers=workers)
+
+def select_fuzzy_field_mappings(score_matrix, dataset_fields, required_fields, similarity_threshold=70, one_to_one=False):
+
+    """Given a fuzzy score matrix, returns a mapping from each required field to a dataset field.
+    By default the best scoring dataset field is chosen for each required field independently, so a dataset field
+    may be matched to several required fields. With one_to_one, a globally optimal assignment maximizing the
+    total score is used so that each dataset field is matched at most once.
+    
+    :param score_matrix: Fuzzy scores with one row per required field and one column per dataset field (see get_fuzzy_score_matrix).
+    :type score_matrix: np.ndarray
+    :param dataset_fields: Header fields present in dataset metadata.
+    :type dataset_fields: List[str]
+    :param required_fields: Fields of interest.
+    :type required_fields: List[str]
+    :param similarity_threshold: Fuzzy score threshold which determines if a match is acceptable or not.
+    :type similarity_threshold: int
+    :param one_to_one: Flag to use a one-to-one assignment between required fields and dataset fields.
+    :type one_to_one: bool
+    :return: Dictionary with required_fields present in dataset_fields as keys and the corresponding dataset fields as values
+    :rtype: Dictionary
+
+    """
+
+    field_mappings = {}
+    if score_matrix.size == 0:
+        return field_mappings
+
+    if one_to_one:
+        from scipy.optimize import linear_sum_assignment
+
+        row_idx, col_idx = linear_sum_assignment(score_matrix, maximize=True)
+        matched = dict(zip(row_idx, col_idx))
+        for idx, required_field in enumerate(required_fields):
+            if idx in matched and score_matrix[idx, matched[idx]] >= similarity_threshold:
+                field_mappings[required_field] = dataset_fields[matched[idx]]
+    else:
+        best_idx = score_matrix.argmax(axis=1)
+        best_scores = score_matrix[np.arange(len(required_fields)), best_idx]
+        for idx, required_field in enumerate(required_fields):
+            if best_scores[idx] >= similarity_threshold:
+                field_mappings[required_field] = dataset_fields[best_idx[idx]]
+
+    return field_mappings
+
+def rank_fuzzy_matches(score_matrix, dataset_fields, required_fields, limit = 5):
+
+    """Given a fuzzy score matrix, returns the top N matches from dataset fields for each required field.
+    
+    :param score_matrix: Fuzzy scores with one row per required field and one column per dataset field (see get_fuzzy_score_matrix).
+    :type score_matrix: np.ndarray
+    :param dataset_fields: Header fields present in dataset metadata.
+    :type dataset_fields: List[str]
+    :param required_fields: Fields of interest.
+    :type required_fields: List[str]
+    :param limit: Number of matches to return
+    :type limit: int
+    :return: Dictionary with required_fields as keys and the N most similar dataset_fields along with similarity scores as values
+    :rtype: Dictionary
+
+    """
+
+    # Stable sort keeps the dataset field order for equal scores
+    top_n = np.argsort(-score_matrix, axis=1, kind='stable')[:, :limit]
+
+    matches = {}
+    for idx, required_field in enumerate(required_fields):
+        matches[required_field] = [(dataset_fields[match_idx], float(score_matrix[idx, match_idx])) for match_idx in top_n[idx]]
+
+    return matches
+
+def fuzzy_field_matching(dataset_fields, required_fields, similarity_threshold=70, use_score_matrix=False, one_to_one=False, workers=-1, score_matrix=None):
 
     """Given lists of required fields and dataset fields, returns a mapping from
     each required field to a dataset field using fuzzy scoring.
+    With use_score_matrix, all scores are computed in a single multi-threaded call instead of one call per required field.
     
     :param dataset_fields: Header fields present in dataset metadata.
     :type dataset_fields: List[str]
@@ -108,11 +302,26 @@ def fuzzy_field_matching(dataset_fields, required_fields, similarity_threshold=7
     :type required_fields: List[str]
     :param similarity_threshold: Fuzzy score threshold which determines if the match returned through fuzzy matching is acceptable or not.
     :type similarity_threshold: int
+    :param use_score_matrix: Flag to compute the full score matrix in one call.
+    :type use_score_matrix: bool
+    :param one_to_one: Flag to use a globally optimal one-to-one assignment between required fields and dataset fields. Implies use_score_matrix.
+    :type one_to_one: bool
+    :param workers: Number of threads used to compute the score matrix, -1 uses all available cores
+    :type workers: int
+    :param score_matrix: Precomputed score matrix (see get_fuzzy_score_matrix), used instead of computing the scores, defaults to None
+    :type score_matrix: np.ndarray
     :return: Dictionary with required_fields present in dataset_fields as keys and the corresponding dataset fields as values
     :rtype: Dictionary
 
     """
 
+    if score_matrix is not None or use_score_matrix or one_to_one:
+        if score_matrix is None:
+            score_matrix = get_fuzzy_score_matrix(dataset_fields, required_fields, workers=workers)
+        return select_fuzzy_field_mappings(score_matrix, dataset_fields, required_fields, similarity_threshold, one_to_one)
+
+    from rapidfuzz import fuzz, process
+
     field_mappings = {}
 
     # Perform fuzzy matching
@@ -128,11 +337,12 @@ def fuzzy_field_matching(dataset_fields, required_fields, similarity_threshold=7
 
 
 
-def get_fuzzy_matches(dataset_fields, required_fields, limit = 5):
+def get_fuzzy_matches(dataset_fields, required_fields, limit = 5, use_score_matrix=False, workers=-1, score_matrix=None):
 
     
     """Given lists of required fields and dataset fields, returns the top N
-    matches from dataset fields for each required field using fuzzy scoring
+    matches from dataset fields for each required field using fuzzy scoring.
+    With use_score_matrix, all scores are computed in a single multi-threaded call instead of one call per required field.
 
     :param dataset_fields: Header fields present in dataset metadata.
     :type dataset_fields: List[str]
@@ -140,10 +350,23 @@ def get_fuzzy_matches(dataset_fields, required_fields, limit = 5):
     :type required_fields: List[str]
     :param limit: Number of matches to return
     :type limit: int
+    :param use_score_matrix: Flag to compute the full score matrix in one call.
+    :type use_score_matrix: bool
+    :param workers: Number of threads used to compute the score matrix, -1 uses all available cores
+    :type workers: int
+    :param score_matrix: Precomputed score matrix (see get_fuzzy_score_matrix), used instead of computing the scores, defaults to None
+    :type score_matrix: np.ndarray
     :return: Dictionary with required_fields as keys and the N most similar dataset_fields along with similarity scores as values
     :rtype: Dictionary
     """
 
+    if score_matrix is not None or use_score_matrix:
+        if score_matrix is None:
+            score_matrix = get_fuzzy_score_matrix(dataset_fields, required_fields, workers=workers)
+        return rank_fuzzy_matches(score_matrix, dataset_fields, required_fields, limit)
+
+    from rapidfuzz import fuzz, process
+
     matches = {}
 
     for required_field in required_fields:
@@ -152,11 +375,113 @@ def get_fuzzy_matches(dataset_fields, required_fields, limit = 5):
 
     return matches
 
-def get_LM_matches(dataset_fields, required_fields, limit = 5):
+# Sentence transformer models and field embeddings are kept for the lifetime of the process
+# so that repeated calls (e.g. for every file in a batch) load each model only once.
+_LM_MODELS = {}
+_LM_EMBEDDINGS = {}
+
+def normalize_field_string(s):
+    """Normalizes a field name for embedding lookups by stripping and collapsing whitespace.
+    Case and punctuation are kept, since they are part of the text the model encodes and change its embedding.
+
+    :param s: Input field name
+    :type s: str
+    :return: Normalized field name
+    :rtype: str
+    """
+    return ' '.join(str(s).split())
+
+def get_LM_model(model_name='sentence-transformers/all-MiniLM-L6-v2'):
+    """Returns a SentenceTransformer model, loading it on the first call for each model name.
+
+    :param model_name: Name or path of the SentenceTransformer model
+    :type model_name: str
+    :return: Loaded model
+    :rtype: SentenceTransformer
+    """
+    if model_name not in _LM_MODELS:
+        from sentence_transformers import SentenceTransformer
+
+        _LM_MODELS[model_name] = SentenceTransformer(model_name)
+    return _LM_MODELS[model_name]
+
+def load_embedding_cache(cache_path, model_name):
+    """Loads field embeddings stored on disk into the in-memory embedding cache of a model.
+
+    :param cache_path: Path to a .npz embedding cache file
+    :type cache_path: str
+    :param model_name: Name of the model the embeddings were computed with
+    :type model_name: str
+    :return: In-memory embedding cache of the model, with normalized field names as keys
+    :rtype: Dictionary
+    """
+    model_embeddings = _LM_EMBEDDINGS.setdefault(model_name, {})
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            with np.load(cache_path, allow_pickle=False) as cache_file:
+                if str(cache_file['model_name']) == model_name:
+                    for key, embedding in zip(cache_file['keys'], cache_file['embeddings']):
+                        model_embeddings.setdefault(str(key), embedding)
+        except Exception as e:
+            warnings.warn(f"Could not read embedding cache {cache_path}: {e}")
+    return model_embeddings
+
+def save_embedding_cache(cache_path, model_name):
+    """Writes the in-memory embedding cache of a model to disk.
+
+    :param cache_path: Path to a .npz embedding cache file
+    :type cache_path: str
+    :param model_name: Name of the model the embeddings were computed with
+    :type model_name: str
+    """
+    model_embeddings = _LM_EMBEDDINGS.get(model_name, {})
+    if not model_embeddings:
+        return
+    keys = list(model_embeddings.keys())
+    # Written atomically so that concurrent readers never see a partial cache
+    write_file_atomic(cache_path, lambda temp_path: np.savez(temp_path, model_name=np.array(model_name), keys=np.array(keys),
+                                                             embeddings=np.stack([model_embeddings[k] for k in keys])), suffix='.npz')
+
+def get_LM_embeddings(fields, model_name='sentence-transformers/all-MiniLM-L6-v2', cache_path=None):
+    """Returns normalized SentenceTransformer embeddings for a list of field names.
+    Embeddings are cached by normalized field name (see normalize_field_string), so only fields that have not been seen before are encoded.
+    The normalized name only differs from the field name in whitespace, which the model tokenizer ignores, so the embeddings
+    are the same as for the field names themselves.
+    If a cache path is provided, the cache is also loaded from and saved to disk.
+
+    :param fields: Field names to embed
+    :type fields: List[str]
+    :param model_name: Name or path of the SentenceTransformer model
+    :type model_name: str
+    :param cache_path: Path to a .npz embedding cache file, defaults to None which only caches in memory
+    :type cache_path: str
+    :return: Matrix of unit-norm embeddings with one row per field
+    :rtype: np.ndarray
+    """
+    model_embeddings = _LM_EMBEDDINGS.setdefault(model_name, {})
+    keys = [normalize_field_string(field) for field in fields]
+    new_keys = list(dict.fromkeys(k for k in keys if k not in model_embeddings))
+    if new_keys and cache_path is not None:
+        model_embeddings = load_embedding_cache(cache_path, model_name)
+        new_keys = [k for k in new_keys if k not in model_embeddings]
+
+    if new_keys:
+        model = get_LM_model(model_name)
+        new_embeddings = model.encode(new_keys, convert_to_numpy=True, normalize_embeddings=True)
+        for key, embedding in zip(new_keys, new_embeddings):
+            model_embeddings[key] = embedding.astype(np.float32)
+        if cache_path is not None:
+            save_embedding_cache(cache_path, model_name)
+
+    return np.stack([model_embeddings[k] for k in keys])
+
+def get_LM_matches(dataset_fields, required_fields, limit = 5, model_name='sentence-transformers/all-MiniLM-L6-v2', embedding_cache_path=None):
 
     """Given lists of required fields and dataset fields, returns the top N
     matches from dataset fields for each required field using cosine-similarity
     score calculated on SentenceTransformer embeddings for the fields.
+    The model is loaded once per process and field embeddings are cached by normalized field name.
+    Similarities for all required fields are computed as a single matrix product.
     
     :param dataset_fields: Header fields present in dataset metadata.
     :type dataset_fields: List[str]
@@ -164,29 +489,20 @@ def get_LM_matches(dataset_fields, required_fields, limit = 5):
     :type required_fields: List[str]
     :param limit: Number of matches to return
     :type limit: int
+    :param model_name: Name or path of the SentenceTransformer model
+    :type model_name: str
+    :param embedding_cache_path: Path to a .npz file used to store field embeddings across runs, defaults to None
+    :type embedding_cache_path: str
     :return: Dictionary with required_fields as keys and the N most similar dataset_fields along with similarity scores as values
     :rtype: Dictionary
 
     """
+    if len(dataset_fields) == 0 or len(required_fields) == 0:
+        return {required_field: [] for required_field in required_fields}
+
     try:
-        model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-        matches = {}
-    
-        dataset_embeddings = model.encode(dataset_fields, convert_to_tensor=True)
-        required_embeddings = model.encode(required_fields, convert_to_tensor=True)
-    
-        # Calculate similarity scores and determine matches
-        for idx, required_field in enumerate(required_fields):
-            similarities = util.pytorch_cos_sim(required_embeddings[idx], dataset_embeddings).cpu().numpy()
-            top_n = np.argpartition(similarities[0], -limit)[-limit:]
-            top_n = top_n[np.argsort(similarities[0][top_n])]
-            top_n = top_n[::-1]
-            results = []
-            for i, sim_idx in enumerate(top_n):
-                sim = float(similarities[0][sim_idx])
-                results.append((dataset_fields[sim_idx],100*float(sim)))
-            matches[required_field] = results
-            
+        dataset_embeddings = get_LM_embeddings(dataset_fields, model_name, embedding_cache_path)
+        required_embeddings = get_LM_embeddings(required_fields, model_name, embedding_cache_path)
     except Exception as e:
         print(f'Could not load LM. Using fuzzy matching. Error {e}')
 
@@ -194,9 +510,21 @@ def get_LM_matches(dataset_fields, required_fields, limit = 5):
 
         return matches
 
+    # Embeddings are unit-norm, so the matrix product gives the cosine similarities
+    similarities = required_embeddings @ dataset_embeddings.T
+
+    limit = min(limit, len(dataset_fields))
+    top_n = np.argpartition(-similarities, limit-1, axis=1)[:, :limit]
+    top_n_order = np.argsort(-np.take_along_axis(similarities, top_n, axis=1), axis=1, kind='stable')
+    top_n = np.take_along_axis(top_n, top_n_order, axis=1)
+
+    matches = {}
+    for idx, required_field in enumerate(required_fields):
+        matches[required_field] = [(dataset_fields[sim_idx],100*float(similarities[idx, sim_idx])) for sim_idx in top_n[idx]]
+
     return matches
 
-def ranked_field_matching(dataset_fields, required_fields, ranking_method='fuzzy', limit = 5):
+def ranked_field_matching(dataset_fields, required_fields, ranking_method='fuzzy', limit = 5, embedding_cache_path=None, use_score_matrix=False, workers=-1, score_matrix=None):
 
     """Given lists of required fields and dataset fields, performs
     user-assisted field matching. For each required field, the top N
@@ -211,6 +539,14 @@ def ranked_field_matching(dataset_fields, required_fields, ranking_method='fuzzy
     :type ranking_method: str
     :param limit: Number of matches to return
     :type limit: int
+    :param embedding_cache_path: Path to a .npz file used by the 'LM' ranking method to store field embeddings across runs, defaults to None
+    :type embedding_cache_path: str
+    :param use_score_matrix: Flag for the 'fuzzy' ranking method to compute the full score matrix in one call.
+    :type use_score_matrix: bool
+    :param workers: Number of threads used by the 'fuzzy' ranking method to compute the score matrix, -1 uses all available cores
+    :type workers: int
+    :param score_matrix: Precomputed fuzzy score matrix between required_fields and dataset_fields (see get_fuzzy_score_matrix), used by the 'fuzzy' ranking method instead of computing the scores, defaults to None
+    :type score_matrix: np.ndarray
     :return: Dictionary with required_fields present in dataset_fields as keys and the corresponding dataset fields as values
     :rtype: Dictionary
 
@@ -226,6 +562,10 @@ def ranked_field_matching(dataset_fields, required_fields, ranking_method='fuzzy
         'required_fields': required_fields,
         'limit':limit
     }
+    if ranking_method == 'LM':
+        ranking_function_arguments['embedding_cache_path'] = embedding_cache_path
+    elif ranking_method == 'fuzzy':
+        ranking_function_arguments.update({'use_score_matrix':use_score_matrix, 'workers':workers, 'score_matrix':score_matrix})
 
     print('Using user-assisted ranked matching for umatched headers.')
     if ranking_method == 'fuzzy':
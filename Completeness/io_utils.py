@@ -1,24 +1,41 @@
 import time
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
 import json
 import re
 import warnings
 import numpy as np
 import os
 import pandas as pd
+
+from Completeness.profiling_utils import *
 # Functions for metadata file and dictionary I/O
 
-def load_metadata_file(file_path=None,sep=None):
+def load_metadata_file(file_path=None,sep=None,usecols=None,chunksize=None,memory_map=False,categorical_threshold=None,dtype_hints=None):
     """Reads a metadata file into a pandas dataframe. Automatically infers filetype from extension.
-    Works with CSV, XLS, and XLSX files.
+    Works with CSV (optionally compressed, e.g. csv.gz or csv.zst), XLS, XLSX, Parquet and Feather/Arrow IPC files.
+    Columnar files keep Arrow-backed dtypes.
+    If a chunksize is provided, the file is not loaded whole. Instead, an iterator yielding
+    dataframes of at most chunksize rows is returned so that large metadata files can be processed
+    in a streaming fashion.
 
     :param file_path: Path to metadata file, defaults to None which prompts user to enter file path.
     :type file_path: str
     :param sep: Field separator in metadata file, defaults to None
     :type sep: str
-    :return: Pandas dataframe with the loaded metadata
-    :rtype: pd.DataFrame
+    :param usecols: Subset of dataset columns to read, defaults to None which reads all columns.
+        The columns for a matched header map can be obtained with get_header_columns.
+    :type usecols: List[str]
+    :param chunksize: Number of rows per chunk, defaults to None which loads the full file
+    :type chunksize: int
+    :param memory_map: Flag to memory-map the file instead of reading it into memory. Supported for CSV, Parquet and Feather files and ignored for XLS/XLSX files.
+    :type memory_map: bool
+    :param categorical_threshold: If provided, text columns with a ratio of distinct values to records at or below this threshold
+        are converted to the category dtype (see convert_categorical_columns), defaults to None which keeps the loaded dtypes
+    :type categorical_threshold: float
+    :param dtype_hints: Dictionary with dataset column names as keys and reference dictionary dtypes as values (see get_dtype_hints).
+        Only columns without a hint or with a 'string' hint are converted to the category dtype.
+    :type dtype_hints: Dictionary
+    :return: Pandas dataframe with the loaded metadata, or an iterator of dataframes if chunksize is provided
+    :rtype: pd.DataFrame or Iterator[pd.DataFrame]
 
     """
 
@@ -27,46 +44,473 @@ def load_metadata_file(file_path=None,sep=None):
 
     assert os.path.exists(file_path), "File not found."
     
-    meta_file_type = file_path.split('.')[-1]
+    meta_file_type = get_metadata_file_type(file_path)
     # To include a new metadata file type, add the file extension as a key to the function map
     # and as the value add the name of the function which will open the metadata file of the new type
-    # and return a pandas dataframe with the metadata
-    function_map = {
-        'csv' : load_dataset_csv,
-        'xls' : load_dataset_xls,
-        'xlsx' : load_dataset_xls,
-    }
+    # and return a pandas dataframe with the metadata.
+    # Chunked loaders are listed separately and should yield dataframes of at most chunksize rows.
+    if chunksize is None:
+        function_map = {
+            'csv' : load_dataset_csv,
+            'xls' : load_dataset_xls,
+            'xlsx' : load_dataset_xls,
+            'parquet' : load_dataset_parquet,
+            'feather' : load_dataset_feather,
+        }
+    else:
+        function_map = {
+            'csv' : iter_dataset_csv,
+            'xls' : iter_dataset_xls,
+            'xlsx' : iter_dataset_xls,
+            'parquet' : iter_dataset_parquet,
+            'feather' : iter_dataset_feather,
+        }
     function_args = {
         'file_path':file_path,
     }
     if sep is not None:
         function_args['sep']=sep
-    df_metadata = function_map.get(meta_file_type, lambda: "Invalid metadata file type.")(**function_args)
+    if usecols is not None:
+        function_args['usecols']=usecols
+    if chunksize is not None:
+        function_args['chunksize']=chunksize
+    # Excel files cannot be memory-mapped, so the flag is ignored for them
+    if memory_map and meta_file_type in ('csv', 'parquet', 'feather'):
+        function_args['memory_map']=memory_map
+    # With a chunksize, only opening the file is profiled here. The chunks are read by the stage consuming them.
+    with profile_stage('load_metadata_file', file_type=meta_file_type) as span:
+        df_metadata = function_map.get(meta_file_type, lambda: "Invalid metadata file type.")(**function_args)
+
+        # Loaders print their error and return None if the file cannot be read
+        if categorical_threshold is not None and meta_file_type in function_map and df_metadata is not None:
+            if chunksize is None:
+                df_metadata = convert_categorical_columns(df_metadata, categorical_threshold, dtype_hints)
+            else:
+                df_metadata = (convert_categorical_columns(chunk_df, categorical_threshold, dtype_hints) for chunk_df in df_metadata)
+        span.set_shape(df_metadata)
 
     return df_metadata
 
 
-def load_dataset_csv(file_path,sep=','):
+def convert_categorical_columns(dataset_df, categorical_threshold=0.5, dtype_hints=None):
+    """
+    Converts low-cardinality text columns of a metadata dataframe to the category dtype.
+    A text column is converted if its ratio of distinct values to records is at or below categorical_threshold.
+    Columns matched to reference dictionary fields with a dtype other than 'string' (e.g. 'int') are left as they are.
+    Categories are sorted, so value counts and sorted outputs are the same as for the text columns.
+
+    :param dataset_df: Dataframe with dataset metadata
+    :type dataset_df: pd.DataFrame
+    :param categorical_threshold: Maximum ratio of distinct values to records for a column to be converted
+    :type categorical_threshold: float
+    :param dtype_hints: Dictionary with dataset column names as keys and reference dictionary dtypes as values, defaults to None
+    :type dtype_hints: Dictionary
+    :return: Dataframe with the low-cardinality text columns converted to the category dtype
+    :rtype: pd.DataFrame
+
+    """
+
+    if dtype_hints is None:
+        dtype_hints = {}
+    if not dataset_df.columns.is_unique:
+        warnings.warn("Metadata has duplicate column names. Columns were not converted to the category dtype.")
+        return dataset_df
+
+    record_num = len(dataset_df)
+    # Shallow copy, so the caller's dataframe keeps its columns and unconverted columns are not copied
+    dataset_df = dataset_df.copy(deep=False)
+    for column_name in list(dataset_df.columns):
+        column = dataset_df[column_name]
+        if dtype_hints.get(column_name, 'string') != 'string':
+            continue
+        if not pd.api.types.is_string_dtype(column.dtype) or isinstance(column.dtype, pd.CategoricalDtype):
+            continue
+        if column.nunique(dropna=True) <= categorical_threshold*record_num:
+            dataset_df[column_name] = column.astype('category')
+
+    return dataset_df
+
+
+def get_dtype_hints(metadata_dictionary, available_headers):
+    """
+    Get the reference dictionary dtype of each matched dataset column.
+
+    :param metadata_dictionary: Metadata dictionary with the field names as keys
+    :type metadata_dictionary: Dictionary
+    :param available_headers: Dictionary with the required field names as keys and the matched dataset field names as values
+    :type available_headers: Dictionary
+    :return: Dictionary with the matched dataset column names as keys and the reference dictionary dtypes as values
+    :rtype: Dictionary
+
+    """
+
+    dtype_hints = {}
+    if available_headers is None:
+        return dtype_hints
+    for field, dataset_field in available_headers.items():
+        if field in metadata_dictionary and 'dtype' in metadata_dictionary[field]:
+            dtype_hints[dataset_field] = metadata_dictionary[field]['dtype']
+    return dtype_hints
+
+
+def get_metadata_file_type(file_path):
+    """
+    Infer the metadata file type from the file extension.
+    Compression extensions are skipped, so 'metadata.csv.gz' is a 'csv' file.
+    Parquet ('parquet', 'pq') and Feather/Arrow IPC ('feather', 'arrow', 'ipc') extensions are mapped to 'parquet' and 'feather'.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :return: Metadata file type
+    :rtype: str
+
+    """
+
+    extensions = os.path.basename(file_path).lower().split('.')
+    if len(extensions) > 2 and extensions[-1] in ('gz', 'zst', 'bz2', 'xz', 'zip'):
+        extensions = extensions[:-1]
+    extension_map = {
+        'pq' : 'parquet',
+        'arrow' : 'feather',
+        'ipc' : 'feather',
+    }
+    return extension_map.get(extensions[-1], extensions[-1])
+
+
+def load_dataset_csv(file_path,sep=',',usecols=None,memory_map=False):
     """
     Load a CSV file containing the dataset metadata.
+    Compressed files are decompressed based on their extension.
     
     :param file_path: Path to metadata file
     :type file_path: str
     :param sep: Field separator in metadata file, defaults to ','
     :type sep: str
+    :param usecols: Subset of columns to read, defaults to None which reads all columns
+    :type usecols: List[str]
+    :param memory_map: Flag to memory-map the file, defaults to False
+    :type memory_map: bool
     :return: Pandas dataframe with the loaded metadata
     :rtype: pd.DataFrame
 
     """
 
     try:
-        data = pd.read_csv(file_path,sep=sep)
+        data = pd.read_csv(file_path,sep=sep,usecols=usecols,memory_map=memory_map)
         return data
     except Exception as e:
         print(f"Error loading dataset CSV: {e}")
         return None
 
 
+def iter_dataset_csv(file_path,chunksize,sep=',',usecols=None,memory_map=False):
+    """
+    Stream a CSV file containing the dataset metadata in chunks of rows.
+    Only one chunk is held in memory at a time.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :param chunksize: Number of rows per chunk
+    :type chunksize: int
+    :param sep: Field separator in metadata file, defaults to ','
+    :type sep: str
+    :param usecols: Subset of columns to read, defaults to None which reads all columns
+    :type usecols: List[str]
+    :param memory_map: Flag to memory-map the file, defaults to False
+    :type memory_map: bool
+    :return: Iterator yielding pandas dataframes with at most chunksize rows
+    :rtype: Iterator[pd.DataFrame]
+
+    """
+
+    try:
+        reader = pd.read_csv(file_path,sep=sep,usecols=usecols,chunksize=chunksize,memory_map=memory_map)
+    except Exception as e:
+        print(f"Error loading dataset CSV: {e}")
+        return
+
+    with reader:
+        try:
+            for chunk in reader:
+                yield chunk
+        except pd.errors.ParserError as e:
+            # Malformed rows are only found while reading, after the previous chunks have been yielded
+            print(f"Error loading dataset CSV: {e}")
+
+
+def load_dataset_parquet(file_path,usecols=None,memory_map=False):
+    """
+    Load a Parquet file containing the dataset metadata. Only the requested columns are read from the file
+    and Arrow-backed dtypes are kept.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :param usecols: Subset of columns to read, defaults to None which reads all columns
+    :type usecols: List[str]
+    :param memory_map: Flag to memory-map the file, defaults to False
+    :type memory_map: bool
+    :return: Pandas dataframe with the loaded metadata
+    :rtype: pd.DataFrame
+
+    """
+
+    try:
+        data = pd.read_parquet(file_path,columns=usecols,dtype_backend='pyarrow',memory_map=memory_map)
+        return data
+    except Exception as e:
+        print(f"Error loading dataset Parquet: {e}")
+        return None
+
+
+def iter_dataset_parquet(file_path,chunksize,usecols=None,memory_map=False):
+    """
+    Stream a Parquet file containing the dataset metadata in chunks of rows.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :param chunksize: Number of rows per chunk
+    :type chunksize: int
+    :param usecols: Subset of columns to read, defaults to None which reads all columns
+    :type usecols: List[str]
+    :param memory_map: Flag to memory-map the file, defaults to False
+    :type memory_map: bool
+    :return: Iterator yielding pandas dataframes with at most chunksize rows
+    :rtype: Iterator[pd.DataFrame]
+
+    """
+
+    try:
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(file_path,memory_map=memory_map)
+    except Exception as e:
+        print(f"Error loading dataset Parquet: {e}")
+        return
+
+    with parquet_file:
+        for batch in parquet_file.iter_batches(batch_size=chunksize,columns=usecols):
+            yield batch.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def load_dataset_feather(file_path,usecols=None,memory_map=False):
+    """
+    Load a Feather/Arrow IPC file containing the dataset metadata. Only the requested columns are read
+    and Arrow-backed dtypes are kept.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :param usecols: Subset of columns to read, defaults to None which reads all columns
+    :type usecols: List[str]
+    :param memory_map: Flag to memory-map the file, defaults to False
+    :type memory_map: bool
+    :return: Pandas dataframe with the loaded metadata
+    :rtype: pd.DataFrame
+
+    """
+
+    try:
+        import pyarrow.feather as feather
+
+        table = feather.read_table(file_path,columns=usecols,memory_map=memory_map)
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    except Exception as e:
+        print(f"Error loading dataset Feather: {e}")
+        return None
+
+
+def iter_dataset_feather(file_path,chunksize,usecols=None,memory_map=False):
+    """
+    Stream a Feather/Arrow IPC file containing the dataset metadata in chunks of rows.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :param chunksize: Number of rows per chunk
+    :type chunksize: int
+    :param usecols: Subset of columns to read, defaults to None which reads all columns
+    :type usecols: List[str]
+    :param memory_map: Flag to memory-map the file, defaults to False
+    :type memory_map: bool
+    :return: Iterator yielding pandas dataframes with at most chunksize rows
+    :rtype: Iterator[pd.DataFrame]
+
+    """
+
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+
+        source = pa.memory_map(file_path) if memory_map else pa.OSFile(file_path)
+        try:
+            reader = pa.ipc.open_file(source)
+        except pa.ArrowInvalid:
+            # Feather V1 files are not Arrow IPC files and have no record batches, so they are read whole and sliced into chunks
+            source.close()
+            table = feather.read_table(file_path,columns=usecols,memory_map=memory_map)
+            reader = None
+    except Exception as e:
+        print(f"Error loading dataset Feather: {e}")
+        return
+
+    if reader is None:
+        for start in range(0, table.num_rows, chunksize):
+            yield table.slice(start, chunksize).to_pandas(types_mapper=pd.ArrowDtype)
+        return
+
+    with source:
+        for batch_idx in range(reader.num_record_batches):
+            batch = reader.get_batch(batch_idx)
+            if usecols is not None:
+                batch = batch.select(usecols)
+            for start in range(0, batch.num_rows, chunksize):
+                yield batch.slice(start, chunksize).to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def read_metadata_header(file_path,sep=None):
+    """
+    Read the list of column names of a metadata file without loading its records.
+    Only the header row of CSV and XLS/XLSX files is parsed, and the column names of Parquet and
+    Feather/Arrow IPC files are read from the file schema. Column names are the same as the ones
+    produced by load_metadata_file.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :param sep: Field separator in metadata file, defaults to None
+    :type sep: str
+    :return: List of column names
+    :rtype: List[str]
+
+    """
+
+    assert os.path.exists(file_path), "File not found."
+
+    meta_file_type = get_metadata_file_type(file_path)
+    # To add header reading for a new metadata file type, add the file type as a key to the function map
+    # and as the value add the name of the function which returns the list of column names of the file
+    function_map = {
+        'csv' : read_header_csv,
+        'xls' : read_header_xls,
+        'xlsx' : read_header_xls,
+        'parquet' : read_header_parquet,
+        'feather' : read_header_feather,
+    }
+    assert meta_file_type in function_map, f"Header-only reading is not supported for '{meta_file_type}' files."
+    function_args = {
+        'file_path':file_path,
+    }
+    if sep is not None:
+        function_args['sep']=sep
+
+    try:
+        with profile_stage('read_metadata_header', file_type=meta_file_type) as span:
+            dataset_headers = function_map[meta_file_type](**function_args)
+            span.set(columns=len(dataset_headers))
+        return dataset_headers
+    except Exception as e:
+        print(f"Error reading metadata header: {e}")
+        return None
+
+
+def read_header_csv(file_path,sep=','):
+    """
+    Read the column names of a CSV file from its header row.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :param sep: Field separator in metadata file, defaults to ','
+    :type sep: str
+    :return: List of column names
+    :rtype: List[str]
+
+    """
+
+    return pd.read_csv(file_path,sep=sep,nrows=0).columns.tolist()
+
+
+def read_header_xls(file_path):
+    """
+    Read the column names of an xls/xlsx file from the header row of its first sheet.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :return: List of column names
+    :rtype: List[str]
+
+    """
+
+    if get_metadata_file_type(file_path) == 'xlsx':
+        # Only the first row of the sheet is streamed from the workbook
+        rows = iter_xlsx_rows(file_path)
+        try:
+            header = next(rows, None)
+        finally:
+            rows.close()
+        if header is None:
+            return []
+        return parse_excel_rows(header, []).columns.tolist()
+
+    return pd.read_excel(file_path,nrows=0,engine=get_excel_engine()).columns.tolist()
+
+
+def read_header_parquet(file_path):
+    """
+    Read the column names of a Parquet file from its schema.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :return: List of column names
+    :rtype: List[str]
+
+    """
+
+    import pyarrow.parquet as pq
+
+    return pq.read_schema(file_path).names
+
+
+def read_header_feather(file_path):
+    """
+    Read the column names of a Feather/Arrow IPC file from its schema.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :return: List of column names
+    :rtype: List[str]
+
+    """
+
+    import pyarrow as pa
+
+    with pa.memory_map(file_path) as source:
+        try:
+            return pa.ipc.open_file(source).schema.names
+        except pa.ArrowInvalid:
+            pass
+
+    # Feather V1 files are not Arrow IPC files. The memory-mapped table is only used for its schema.
+    import pyarrow.feather as feather
+    return feather.read_table(file_path, memory_map=True).schema.names
+
+
+def get_target_usecols(available_headers, target_fields):
+    """
+    Get the dataset columns to read for checks on a set of target fields.
+    If all target fields are matched required fields, only the matched columns are needed.
+    Otherwise a target refers to a dataset column by name and None is returned so that all columns are read.
+    
+    :param available_headers: Dictionary with the required field names as keys and the matched dataset field names as values
+    :type available_headers: Dictionary
+    :param target_fields: Names of the target fields of the checks
+    :type target_fields: List[str]
+    :return: List of dataset columns to read, or None to read all columns
+    :rtype: List[str]
+
+    """
+
+    if available_headers and all(field in available_headers for field in target_fields):
+        return get_header_columns(available_headers)
+    return None
+
+
 def load_json(file_path):
     """
     Load a JSON file from the provided path
@@ -88,26 +532,247 @@ def load_json(file_path):
         return None
         
 
-def load_dataset_xls(file_path):
+def load_dataset_xls(file_path,usecols=None,sheet_name=0):
 
     """
     Load an xls/xlsx file containing the dataset metadata.
+    The calamine engine is used if python-calamine is installed (see get_excel_engine).
     
     :param file_path: Path to metadata file
     :type file_path: str
+    :param usecols: Subset of columns to read, defaults to None which reads all columns
+    :type usecols: List[str]
+    :param sheet_name: Name or index of the sheet to read, defaults to 0 which reads the first sheet
+    :type sheet_name: str or int
     :return: Pandas dataframe with the loaded metadata
     :rtype: pd.DataFrame
 
     """
 
     try:
-        data = pd.read_excel(file_path)
+        data = pd.read_excel(file_path,usecols=usecols,sheet_name=sheet_name,engine=get_excel_engine())
         return data
     except Exception as e:
         print(f"Error loading dataset XLS: {e}")
         return None
 
 
+def iter_dataset_xls(file_path,chunksize,usecols=None,sheet_name=0):
+
+    """
+    Stream an xls/xlsx file containing the dataset metadata in chunks of rows.
+    XLSX sheets are read row by row with a read-only workbook, so only one chunk of rows is held in memory at a time.
+    Values are parsed in the same way as pd.read_excel. Empty rows at the end of the sheet are dropped.
+    The legacy xls format cannot be streamed, so xls files are loaded before being split into chunks.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :param chunksize: Number of rows per chunk
+    :type chunksize: int
+    :param usecols: Subset of columns to read, defaults to None which reads all columns
+    :type usecols: List[str]
+    :param sheet_name: Name or index of the sheet to read, defaults to 0 which reads the first sheet
+    :type sheet_name: str or int
+    :return: Iterator yielding pandas dataframes with at most chunksize rows
+    :rtype: Iterator[pd.DataFrame]
+
+    """
+
+    if get_metadata_file_type(file_path) != 'xlsx':
+        data = load_dataset_xls(file_path,usecols=usecols,sheet_name=sheet_name)
+        if data is None:
+            return
+
+        for start in range(0, len(data), chunksize):
+            yield data.iloc[start:start+chunksize]
+        return
+
+    rows = iter_xlsx_rows(file_path, sheet_name=sheet_name)
+    try:
+        header = next(rows, None)
+        if header is None:
+            return
+
+        chunk_rows = []
+        empty_rows = []
+        start = 0
+        for row in rows:
+            # Empty rows are held back until a row with data follows, so that trailing empty rows are dropped
+            if all(value == '' for value in row):
+                empty_rows.append(row)
+                continue
+            chunk_rows.extend(empty_rows)
+            empty_rows = []
+            chunk_rows.append(row)
+            while len(chunk_rows) >= chunksize:
+                yield parse_excel_rows(header, chunk_rows[:chunksize], usecols=usecols, start=start)
+                chunk_rows = chunk_rows[chunksize:]
+                start += chunksize
+        if chunk_rows:
+            yield parse_excel_rows(header, chunk_rows, usecols=usecols, start=start)
+    except Exception as e:
+        print(f"Error loading dataset XLS: {e}")
+        return
+    finally:
+        rows.close()
+
+
+def get_excel_engine():
+    """
+    Get the pandas engine used to read Excel files.
+    The Rust-based calamine engine is much faster than openpyxl and is used if the python-calamine package is installed.
+
+    :return: 'calamine' if python-calamine is installed, otherwise None which uses the pandas default engine
+    :rtype: str
+
+    """
+
+    import importlib.util
+    if importlib.util.find_spec('python_calamine') is not None:
+        return 'calamine'
+    return None
+
+
+def iter_xlsx_rows(file_path, sheet_name=0):
+    """
+    Stream the rows of an xlsx sheet from a read-only workbook.
+    Cell values are converted in the same way as pd.read_excel: empty cells become empty strings,
+    error cells become NaN and integral numbers become integers.
+
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :param sheet_name: Name or index of the sheet to read, defaults to 0 which reads the first sheet
+    :type sheet_name: str or int
+    :return: Iterator yielding the rows of the sheet as lists of values
+    :rtype: Iterator[List]
+
+    """
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        worksheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+        for row in worksheet.iter_rows():
+            values = [_convert_excel_cell(cell) for cell in row]
+            # Trailing empty cells are not part of the row
+            while values and values[-1] == '':
+                values.pop()
+            yield values
+    finally:
+        workbook.close()
+
+
+def _convert_excel_cell(cell):
+    if cell.value is None:
+        return ''
+    if cell.data_type == 'e':
+        return np.nan
+    if cell.data_type == 'n':
+        value = int(cell.value)
+        if value == cell.value:
+            return value
+        return float(cell.value)
+    return cell.value
+
+
+def parse_excel_rows(header, rows, usecols=None, start=0):
+    """
+    Parse rows of Excel cell values into a dataframe, with the same type inference and missing value handling as pd.read_excel.
+
+    :param header: Header row
+    :type header: List
+    :param rows: Data rows
+    :type rows: List[List]
+    :param usecols: Subset of columns to read, defaults to None which reads all columns
+    :type usecols: List[str]
+    :param start: Position of the first row in the sheet (excluding the header), used as the first index value
+    :type start: int
+    :return: Pandas dataframe with the parsed rows
+    :rtype: pd.DataFrame
+
+    """
+
+    from pandas.io.parsers import TextParser
+
+    width = max([len(header)] + [len(row) for row in rows])
+    padded_rows = [list(row) + ['']*(width-len(row)) for row in [header] + list(rows)]
+    data = TextParser(padded_rows, header=0, usecols=usecols).read()
+    data.index = pd.RangeIndex(start, start+len(data))
+    return data
+
+
+def get_excel_sheet_names(file_path):
+    """
+    Get the names of the sheets of an xls/xlsx file.
+
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :return: List of sheet names
+    :rtype: List[str]
+
+    """
+
+    if get_metadata_file_type(file_path) == 'xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, keep_links=False)
+        try:
+            return list(workbook.sheetnames)
+        finally:
+            workbook.close()
+    with pd.ExcelFile(file_path, engine=get_excel_engine()) as excel_file:
+        return list(excel_file.sheet_names)
+
+
+def load_dataset_xls_sheets(file_path,sheet_names=None,usecols=None,num_workers=None):
+
+    """
+    Load several sheets of an xls/xlsx file in parallel worker processes.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :param sheet_names: Names of the sheets to read, defaults to None which reads all sheets
+    :type sheet_names: List[str]
+    :param usecols: Subset of columns to read from each sheet, defaults to None which reads all columns
+    :type usecols: List[str]
+    :param num_workers: Number of worker processes, defaults to None which uses one process per sheet up to the number of CPUs
+    :type num_workers: int
+    :return: Dictionary with the sheet names as keys and pandas dataframes with the loaded metadata as values
+    :rtype: Dictionary
+
+    """
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    if sheet_names is None:
+        sheet_names = get_excel_sheet_names(file_path)
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_workers = max(1, min(num_workers, len(sheet_names)))
+
+    if num_workers == 1:
+        return {sheet_name: load_dataset_xls(file_path, usecols, sheet_name) for sheet_name in sheet_names}
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        sheet_data = executor.map(load_dataset_xls, [file_path]*len(sheet_names), [usecols]*len(sheet_names), sheet_names)
+        return dict(zip(sheet_names, sheet_data))
+
+
+def get_header_columns(available_headers):
+    """
+    Get the list of dataset columns used by a matched header map, in order and without duplicates.
+    The list can be passed as usecols to load_metadata_file so that only matched columns are read.
+    
+    :param available_headers: Dictionary with the required field names as keys and the matched dataset field names as values
+    :type available_headers: Dictionary
+    :return: List of matched dataset columns
+    :rtype: List[str]
+
+    """
+
+    return list(dict.fromkeys(available_headers.values()))
+
+
 def get_field_item(metadata_dictionary,item_key="aliases"):
     """
     For an input metadata dictionary where each top level key is a field name,
@@ -195,7 +860,7 @@ def find_key_path(d, target_key=None, key_path=None):
                 return result
     return None
 
-def plot_completeness_barchart(df_plot, available_list = None, plot_title='Completeness', plot_colors=['#5577DD','#DD3333'], add_text=True, savefig=False):
+def plot_completeness_barchart(df_plot, available_list = None, plot_title='Completeness', plot_colors=['#5577DD','#DD3333'], add_text=True, savefig=False, max_columns=50):
 
     """
     Plot completeness visualization barchart from dataframe
@@ -213,11 +878,24 @@ def plot_completeness_barchart(df_plot, available_list = None, plot_title='Compl
     :type add_text: bool
     :param savefig: Flag to save the plot as a png.
     :type add_text: bool
+    :param max_columns: Maximum number of columns per chart. Wider charts are split into several pages,
+        each plotted as a separate figure. Set to None to plot all columns in one chart.
+    :type max_columns: int
     :return: 0
     :rtype: int
 
     """
 
+    if max_columns is not None and len(df_plot) > max_columns:
+        num_pages = -(-len(df_plot) // max_columns)
+        for page in range(num_pages):
+            plot_completeness_barchart(df_plot.iloc[page*max_columns:(page+1)*max_columns], available_list=available_list, plot_title=f'{plot_title} (page {page+1} of {num_pages})',
+                                       plot_colors=plot_colors, add_text=add_text, savefig=savefig, max_columns=None)
+        return 0
+
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as mpatches
+
     fig,ax = plt.subplots(figsize=(16,4))
     df_plot.plot(ax=ax,kind='bar', stacked=True, figsize=(12,6), color=plot_colors,edgecolor='k')
     if add_text:
@@ -229,8 +907,8 @@ def plot_completeness_barchart(df_plot, available_list = None, plot_title='Compl
     plt.grid(axis='y', linestyle='--', alpha=0.7)
     
     if available_list is not None:
-        for i, abar in enumerate(ax.containers[1]):
-            tick_label = ax.get_xticklabels()[i].get_text()
+        tick_labels = [tick_label.get_text() for tick_label in ax.get_xticklabels()]
+        for abar, tick_label in zip(ax.containers[1], tick_labels):
             if tick_label not in available_list:
                 abar.set_color('#FFFFFF')
                 abar.set_edgecolor('k')
@@ -255,7 +933,8 @@ def plot_completeness_barchart(df_plot, available_list = None, plot_title='Compl
 
 def add_text_sbarchart(ax, df_plot, fontsize=8):
     """
-    Add text labels inside the bars of a completeness visualization barchart
+    Add text labels inside the bars of a completeness visualization barchart.
+    The labels of each bar segment series are added in one call with bar_label.
     
     :param ax: A matplotlib axis object of the barchart on which to plot the text labels
     :type ax: Axes
@@ -267,17 +946,11 @@ def add_text_sbarchart(ax, df_plot, fontsize=8):
     :rtype: int
 
     """
-    bars = ax.patches
-    bar_width = bars[0].get_width()
-
-    for i, (index, row) in enumerate(df_plot.iterrows()):
-        avail = row.iloc[0]
-        missing = row.iloc[1]
-        x_pos = i
+    values = df_plot.iloc[:, :2].to_numpy(dtype=float)
+    # Bars are only labelled if both the available and missing levels are known
+    labelled = ~np.isnan(values).any(axis=1)
 
-        if not (pd.isna(avail) or pd.isna(missing)):
-            if avail > 0:
-                ax.text(x_pos, avail/2, f'{avail:.1f}%', ha='center', va='center', rotation=90, color='white', fontsize=fontsize)
-            if missing > 0:
-                ax.text(x_pos, avail + (missing/2), f'{missing:.1f}%', ha='center', va='center', rotation=90, color='white', fontsize=fontsize)
+    for container, column_values in zip(ax.containers[:2], values.T):
+        labels = np.where(labelled & (column_values > 0), np.char.mod('%.1f%%', column_values), '')
+        ax.bar_label(container, labels=labels, label_type='center', rotation=90, color='white', fontsize=fontsize)
     return 0
\ No newline at end of file
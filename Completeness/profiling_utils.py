@@ -0,0 +1,377 @@
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+
+from Completeness.cache_utils import write_file_atomic
+
+# Functions for opt-in profiling of the assessment pipelines.
+# Pipeline stages are wrapped in spans with profile_stage. While profiling is disabled, profile_stage returns
+# a shared no-op span, so instrumented code only pays for one function call per stage.
+# While enabled, each span records its wall time, the peak traced memory (with track_memory), the peak
+# resident set size of the process and the number of rows and columns processed.
+
+_profiler = None
+
+
+class StageSpan:
+    """
+    Timed span of a pipeline stage, used as a context manager. Attributes such as the number of
+    rows and columns processed can be added while the span is open.
+
+    :param profiler: Profiler the span is recorded in
+    :type profiler: StageProfiler
+    :param name: Stage name
+    :type name: str
+    :param attributes: Additional attributes of the stage
+    :type attributes: Dictionary
+
+    """
+
+    def __init__(self, profiler, name, attributes):
+        self.profiler = profiler
+        self.name = name
+        self.attributes = attributes
+        self.parent = None
+        self.start_time = None
+        self.peak_memory = 0
+
+    def __enter__(self):
+        self.profiler._open_span(self)
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start_time
+        self.profiler._close_span(self, duration, exc_type)
+        return False
+
+    def set(self, **attributes):
+        """
+        Add attributes to the span.
+
+        """
+        self.attributes.update(attributes)
+
+    def set_shape(self, data):
+        """
+        Record the number of rows and columns of a dataframe, series or array processed in the stage.
+        Other objects (e.g. iterators of chunks) are ignored.
+
+        :param data: Data processed in the stage
+        :type data: pd.DataFrame or pd.Series or numpy.ndarray
+
+        """
+        shape = getattr(data, 'shape', None)
+        if shape is None:
+            return
+        self.attributes['rows'] = int(shape[0])
+        if len(shape) > 1:
+            self.attributes['columns'] = int(shape[1])
+
+
+class _NullSpan:
+    # Span returned while profiling is disabled
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def set_shape(self, data):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class StageProfiler:
+    """
+    Collects the spans of the pipeline stages of one run.
+    Spans opened while another span is open in the same thread are recorded as its children.
+    Peak traced memory is process-wide, so the peaks of spans running concurrently in different threads overlap.
+
+    :param track_memory: Flag to trace Python memory allocations with tracemalloc, which slows down the run
+    :type track_memory: bool
+
+    """
+
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.spans = []
+        self.start_time = time.perf_counter()
+        self.start_timestamp = time.time()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _get_stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _update_peak_memory(self, stack):
+        # The tracemalloc peak is reset for every new span, so the peak reached so far is passed on to the open spans first
+        _, peak_memory = tracemalloc.get_traced_memory()
+        for open_span in stack:
+            open_span.peak_memory = max(open_span.peak_memory, peak_memory)
+
+    def _open_span(self, span):
+        stack = self._get_stack()
+        if stack:
+            span.parent = stack[-1].name
+        if self.track_memory:
+            self._update_peak_memory(stack)
+            tracemalloc.reset_peak()
+        stack.append(span)
+
+    def _close_span(self, span, duration, exc_type=None):
+        stack = self._get_stack()
+        if self.track_memory:
+            self._update_peak_memory(stack)
+        stack.remove(span)
+
+        span_record = {
+            'name': span.name,
+            'parent': span.parent,
+            'thread': threading.current_thread().name,
+            'start': span.start_time - self.start_time,
+            'duration': duration,
+            'max_rss_bytes': get_max_rss(),
+        }
+        if self.track_memory:
+            span_record['peak_traced_bytes'] = span.peak_memory
+        if exc_type is not None:
+            span_record['error'] = exc_type.__name__
+        span_record.update(span.attributes)
+        with self._lock:
+            self.spans.append(span_record)
+
+    def span(self, name, **attributes):
+        """
+        Create a span for a pipeline stage.
+
+        :param name: Stage name
+        :type name: str
+        :return: Span to be used as a context manager
+        :rtype: StageSpan
+
+        """
+        return StageSpan(self, name, attributes)
+
+    def get_stage_summary(self):
+        """
+        Aggregate the spans by stage name.
+
+        :return: Dictionary with the stage names as keys and dictionaries with the number of calls, the total duration,
+            the largest number of rows and the largest peak memory of the stage as values
+        :rtype: Dictionary
+
+        """
+        stage_summary = {}
+        for span_record in self.spans:
+            stage = stage_summary.setdefault(span_record['name'], {'calls': 0, 'duration': 0.0, 'rows': None, 'max_rss_bytes': 0})
+            stage['calls'] += 1
+            stage['duration'] += span_record['duration']
+            stage['max_rss_bytes'] = max(stage['max_rss_bytes'], span_record['max_rss_bytes'] or 0)
+            if 'rows' in span_record:
+                stage['rows'] = max(stage['rows'] or 0, span_record['rows'])
+            if 'peak_traced_bytes' in span_record:
+                stage['peak_traced_bytes'] = max(stage.get('peak_traced_bytes', 0), span_record['peak_traced_bytes'])
+        return stage_summary
+
+    def get_trace(self):
+        """
+        Get the trace of the run with all recorded spans in the order they finished.
+
+        :return: JSON serializable dictionary with the run information and the list of spans
+        :rtype: Dictionary
+
+        """
+        return {
+            'start_timestamp': self.start_timestamp,
+            'duration': time.perf_counter() - self.start_time,
+            'max_rss_bytes': get_max_rss(),
+            'track_memory': self.track_memory,
+            'spans': list(self.spans),
+        }
+
+    def write_json_trace(self, file_path, labels=None):
+        """
+        Write the trace of the run as a JSON file.
+
+        :param file_path: Path of the JSON trace
+        :type file_path: str
+        :param labels: Labels of the run added to the trace, e.g. {'script': 'coverage'}
+        :type labels: Dictionary
+
+        """
+        trace = self.get_trace()
+        if labels is not None:
+            trace['labels'] = labels
+        _write_text_file(file_path, json.dumps(trace, indent=2, default=str))
+
+    def write_prometheus_metrics(self, file_path, labels=None):
+        """
+        Write the per-stage metrics of the run in the Prometheus text format, e.g. for the textfile collector of the node exporter.
+        Stage durations and call counts are summed over all spans of a stage, and memory and row counts are the largest values.
+
+        :param file_path: Path of the metrics file. The textfile collector only reads files with a .prom extension.
+        :type file_path: str
+        :param labels: Labels added to every metric, e.g. {'script': 'coverage'}
+        :type labels: Dictionary
+
+        """
+        labels = labels if labels is not None else {}
+        stage_summary = self.get_stage_summary()
+        trace = self.get_trace()
+
+        metric_lines = []
+
+        def add_metric(metric_name, help_text, samples):
+            metric_lines.append(f'# HELP {metric_name} {help_text}')
+            metric_lines.append(f'# TYPE {metric_name} gauge')
+            for sample_labels, value in samples:
+                metric_lines.append(f'{metric_name}{_format_prometheus_labels({**labels, **sample_labels})} {value}')
+
+        add_metric('dcard_run_duration_seconds', 'Wall time of the run.', [({}, trace['duration'])])
+        add_metric('dcard_run_timestamp_seconds', 'Start time of the run since the epoch.', [({}, trace['start_timestamp'])])
+        if trace['max_rss_bytes'] is not None:
+            add_metric('dcard_run_max_rss_bytes', 'Peak resident set size of the process.', [({}, trace['max_rss_bytes'])])
+        add_metric('dcard_stage_duration_seconds', 'Total wall time of a pipeline stage.',
+                   [({'stage': name}, stage['duration']) for name, stage in stage_summary.items()])
+        add_metric('dcard_stage_calls', 'Number of times a pipeline stage was run.',
+                   [({'stage': name}, stage['calls']) for name, stage in stage_summary.items()])
+        add_metric('dcard_stage_rows', 'Largest number of rows processed by a pipeline stage.',
+                   [({'stage': name}, stage['rows']) for name, stage in stage_summary.items() if stage['rows'] is not None])
+        add_metric('dcard_stage_max_rss_bytes', 'Peak resident set size of the process at the end of a pipeline stage.',
+                   [({'stage': name}, stage['max_rss_bytes']) for name, stage in stage_summary.items() if stage['max_rss_bytes']])
+        if self.track_memory:
+            add_metric('dcard_stage_peak_traced_bytes', 'Peak memory allocated by Python during a pipeline stage.',
+                       [({'stage': name}, stage['peak_traced_bytes']) for name, stage in stage_summary.items()])
+
+        _write_text_file(file_path, '\n'.join(metric_lines) + '\n')
+
+
+def _format_prometheus_labels(labels):
+    if not labels:
+        return ''
+    escaped_labels = []
+    for k, v in labels.items():
+        v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped_labels.append(f'{k}="{v}"')
+    return '{' + ','.join(escaped_labels) + '}'
+
+
+def _write_text_file(path, text):
+    def write_text(temp_path):
+        with open(temp_path, 'w') as f:
+            f.write(text)
+
+    # Written atomically so that scrapers never read a partial file
+    write_file_atomic(path, write_text)
+
+
+def get_max_rss():
+    """
+    Get the peak resident set size of the current process.
+
+    :return: Peak resident set size in bytes, or None if it is not available on the platform
+    :rtype: int
+
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in kilobytes on Linux
+    return max_rss if sys.platform == 'darwin' else max_rss*1024
+
+
+def enable_profiling(track_memory=False):
+    """
+    Enable profiling of the pipeline stages for the rest of the run.
+
+    :param track_memory: Flag to trace Python memory allocations with tracemalloc, which slows down the run
+    :type track_memory: bool
+    :return: Profiler collecting the spans
+    :rtype: StageProfiler
+
+    """
+    global _profiler
+    _profiler = StageProfiler(track_memory=track_memory)
+    return _profiler
+
+
+def disable_profiling():
+    """
+    Disable profiling of the pipeline stages.
+
+    :return: Profiler that was collecting the spans, or None if profiling was not enabled
+    :rtype: StageProfiler
+
+    """
+    global _profiler
+    profiler = _profiler
+    _profiler = None
+    if profiler is not None and profiler.track_memory:
+        tracemalloc.stop()
+    return profiler
+
+
+def get_profiler():
+    """
+    Get the active profiler.
+
+    :return: Active profiler, or None if profiling is disabled
+    :rtype: StageProfiler
+
+    """
+    return _profiler
+
+
+def profile_stage(name, **attributes):
+    """
+    Create a span for a pipeline stage, to be used as a context manager:
+
+        with profile_stage('load_metadata_file') as span:
+            metadata_df = load_metadata_file(file_path)
+            span.set_shape(metadata_df)
+
+    :param name: Stage name
+    :type name: str
+    :param attributes: Additional attributes of the stage
+    :return: Span of the stage, or a no-op span if profiling is disabled
+    :rtype: StageSpan
+
+    """
+    if _profiler is None:
+        return _NULL_SPAN
+    return _profiler.span(name, **attributes)
+
+
+def write_profile(profile_path, script_name=None):
+    """
+    Write the trace of the active profiler as a JSON file and its per-stage metrics as a Prometheus text-format file
+    with the same name and a .prom extension.
+
+    :param profile_path: Path of the JSON trace
+    :type profile_path: str
+    :param script_name: Name of the entry point, added as a label to the trace and the metrics
+    :type script_name: str
+
+    """
+    if _profiler is None:
+        return
+    labels = {'script': script_name} if script_name is not None else None
+    _profiler.write_json_trace(profile_path, labels=labels)
+    _profiler.write_prometheus_metrics(os.path.splitext(profile_path)[0] + '.prom', labels=labels)
@@ -0,0 +1,106 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from Completeness.profiling_utils import *
+
+# Functions for rendering figures in the background while the assessment continues.
+# Plot functions submitted to a RenderQueue run in worker processes with the non-interactive Agg backend,
+# so the figures have to be saved to file (savefig=True) to be kept.
+# The profiling spans of the plot functions are recorded in the worker processes and are not part of the run profile.
+
+
+def init_render_worker():
+    """
+    Initializer for render worker processes. Selects the Agg backend so that figures are drawn without a display.
+
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def render_figure(plot_function, args, kwargs):
+    """
+    Run a plot function and close its figures afterwards, so that worker processes do not accumulate figures.
+
+    :param plot_function: Plot function, e.g. plot_coverage
+    :type plot_function: Callable
+    :param args: Positional arguments of the plot function
+    :type args: tuple
+    :param kwargs: Keyword arguments of the plot function
+    :type kwargs: Dictionary
+    :return: Return value of the plot function
+
+    """
+    import matplotlib.pyplot as plt
+
+    try:
+        return plot_function(*args, **kwargs)
+    finally:
+        plt.close('all')
+
+
+class RenderQueue:
+    """
+    Queue of figures rendered by a pool of worker processes while the main process continues.
+    The worker processes are only started when the first figure is submitted.
+    With num_workers set to 0, figures are rendered in the main process when they are submitted,
+    which keeps the figures open, e.g. for display in notebooks.
+
+    :param num_workers: Number of render worker processes, defaults to 1
+    :type num_workers: int
+
+    """
+
+    def __init__(self, num_workers=1):
+        self.num_workers = max(0, min(num_workers, os.cpu_count() or 1))
+        self.executor = None
+        self.futures = []
+
+    def submit(self, plot_function, *args, **kwargs):
+        """
+        Add a figure to the queue. The plot function and its arguments must be picklable
+        (module-level functions with dataframes, series and dictionaries as arguments).
+
+        :param plot_function: Plot function, e.g. plot_coverage
+        :type plot_function: Callable
+
+        """
+        if self.num_workers == 0:
+            plot_function(*args, **kwargs)
+            return
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.num_workers, initializer=init_render_worker)
+        self.futures.append(self.executor.submit(render_figure, plot_function, args, kwargs))
+
+    def wait(self):
+        """
+        Wait for all submitted figures to be rendered and stop the worker processes.
+        Errors raised while rendering a figure are raised again here.
+
+        :return: Number of figures rendered by the worker processes
+        :rtype: int
+
+        """
+        with profile_stage('render_queue.wait', figures=len(self.futures)):
+            try:
+                for future in self.futures:
+                    future.result()
+            finally:
+                if self.executor is not None:
+                    self.executor.shutdown(cancel_futures=True)
+                    self.executor = None
+        num_rendered = len(self.futures)
+        self.futures = []
+        return num_rendered
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self.executor is not None:
+            # Figures that have not been rendered yet are dropped if the assessment failed
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+            self.futures = []
+        self.wait()
+        return False
@@ -0,0 +1,151 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# Functions for writing and reading structured assessment reports.
+# A report is a nested dictionary of check results (header maps, scores, count tables, divergences).
+# Dataframes and series are stored inline in the JSON report, or as Parquet files next to it that the JSON report refers to.
+# Table labels are stored as strings, so reports can be read back without the original dtypes of the metadata.
+
+
+def _get_table_frame(table):
+    # Dataframe with string labels and JSON/Parquet compatible values for a dataframe or series
+    table_df = table.to_frame() if isinstance(table, pd.Series) else table.copy()
+    table_df.index = table_df.index.map(str)
+    table_df.columns = table_df.columns.map(str)
+    for column in table_df.columns:
+        if not (pd.api.types.is_numeric_dtype(table_df[column]) or pd.api.types.is_bool_dtype(table_df[column])):
+            table_df[column] = table_df[column].map(lambda v: None if pd.isna(v) else str(v))
+    return table_df
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+
+def serialize_report(report, table_dir=None, table_format='json', key_path=()):
+    """
+    Convert a structured report into a JSON serializable dictionary.
+    Dataframes and series are replaced with table entries, which either contain the table values (table_format 'json')
+    or the path of a Parquet file with the table (table_format 'parquet').
+
+    :param report: Structured report
+    :type report: Dictionary
+    :param table_dir: Directory of the Parquet tables, needed for table_format 'parquet'
+    :type table_dir: str
+    :param table_format: 'json' to store tables inline or 'parquet' to store them as Parquet files
+    :type table_format: str
+    :param key_path: Keys leading to the report, used to name Parquet tables
+    :type key_path: tuple(str)
+    :return: JSON serializable report
+    :rtype: Dictionary
+
+    """
+
+    if isinstance(report, dict):
+        return {str(k): serialize_report(v, table_dir, table_format, key_path+(str(k),)) for k, v in report.items()}
+    if isinstance(report, (list, tuple)):
+        return [serialize_report(v, table_dir, table_format, key_path+(str(i),)) for i, v in enumerate(report)]
+    if isinstance(report, (pd.DataFrame, pd.Series)):
+        table_df = _get_table_frame(report)
+        table_entry = {
+            '__table__': 'series' if isinstance(report, pd.Series) else 'dataframe',
+            'index_name': None if report.index.name is None else str(report.index.name),
+        }
+        if table_format == 'parquet':
+            table_name = '.'.join(key_path).replace(os.sep, '_') + '.parquet'
+            table_df.to_parquet(os.path.join(table_dir, table_name))
+            table_entry['path'] = os.path.join(os.path.basename(table_dir), table_name)
+        else:
+            table_entry['index'] = table_df.index.tolist()
+            table_entry['columns'] = table_df.columns.tolist()
+            table_entry['data'] = table_df.astype(object).where(table_df.notna(), None).values.tolist()
+        return table_entry
+    if isinstance(report, np.ndarray):
+        return [serialize_report(v, table_dir, table_format, key_path) for v in report.tolist()]
+    if isinstance(report, (float, np.floating)) and not np.isfinite(report):
+        return None
+    return report
+
+
+def deserialize_report(report, report_dir=''):
+    """
+    Rebuild the dataframes and series of a report read from a JSON file.
+
+    :param report: JSON report
+    :type report: Dictionary
+    :param report_dir: Directory of the JSON report, used to resolve the paths of Parquet tables
+    :type report_dir: str
+    :return: Structured report
+    :rtype: Dictionary
+
+    """
+
+    if isinstance(report, list):
+        return [deserialize_report(v, report_dir) for v in report]
+    if not isinstance(report, dict):
+        return report
+    if '__table__' not in report:
+        return {k: deserialize_report(v, report_dir) for k, v in report.items()}
+
+    if 'path' in report:
+        table_df = pd.read_parquet(os.path.join(report_dir, report['path']))
+    else:
+        table_df = pd.DataFrame(report['data'], index=report['index'], columns=report['columns'])
+        for column in table_df.columns:
+            # Columns with missing values are read back as object columns
+            if table_df[column].dtype == object:
+                table_df[column] = table_df[column].infer_objects()
+    table_df.index.name = report['index_name']
+    if report['__table__'] == 'series':
+        return table_df.iloc[:, 0]
+    return table_df
+
+
+def write_structured_report(report, report_path, table_format='json'):
+    """
+    Write a structured report as a JSON file. With table_format 'parquet', the tables of the report are written as
+    Parquet files to a directory next to the JSON file, named after the report with a '_tables' suffix.
+
+    :param report: Structured report
+    :type report: Dictionary
+    :param report_path: Path of the JSON report
+    :type report_path: str
+    :param table_format: 'json' to store tables inline or 'parquet' to store them as Parquet files
+    :type table_format: str
+
+    """
+
+    assert table_format in ('json', 'parquet'), f"Unknown report table format '{table_format}'."
+    report_dir = os.path.dirname(os.path.abspath(report_path))
+    os.makedirs(report_dir, exist_ok=True)
+    table_dir = None
+    if table_format == 'parquet':
+        table_dir = os.path.splitext(os.path.abspath(report_path))[0] + '_tables'
+        os.makedirs(table_dir, exist_ok=True)
+
+    serialized_report = serialize_report(report, table_dir, table_format)
+    with open(report_path, 'w') as f:
+        json.dump(serialized_report, f, indent=2, default=_json_default)
+
+
+def load_structured_report(report_path):
+    """
+    Read a structured report written with write_structured_report.
+
+    :param report_path: Path of the JSON report
+    :type report_path: str
+    :return: Structured report with the tables as dataframes and series
+    :rtype: Dictionary
+
+    """
+
+    assert os.path.exists(report_path), "Report file not found."
+    with open(report_path, 'r') as f:
+        serialized_report = json.load(f)
+    return deserialize_report(serialized_report, os.path.dirname(os.path.abspath(report_path)))
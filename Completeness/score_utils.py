@@ -5,20 +5,27 @@ import numpy as np
 
 from Completeness.field_matching_utils import *
 from Completeness.io_utils import *
+from Completeness.cache_utils import *
 
 
 
-def dataset_level_completeness_check(dataset_df, required_fields, field_matching_methods):
+def dataset_level_completeness_check(dataset_df, required_fields, field_matching_methods, cache_dir=None):
 
     """
     Perform a dataset-level completeness check to verify that the dataset header contains all required fields.
+    Only the dataset header is used, so a list of column names (e.g. from read_metadata_header) can be provided instead of the dataset.
+    If a cache directory is provided, the matched header map is stored on disk and reused for any dataset with the same
+    header, required fields and matching configuration. Answers given in user-assisted matching are also stored and
+    applied automatically to later datasets before the user is prompted.
     
-    :param dataset_df: Nested dictionary containing dataset metadata
-    :type dataset_df: Dictionary
+    :param dataset_df: Dataframe containing dataset metadata, or list of dataset column names
+    :type dataset_df: pd.DataFrame or List[str]
     :param required_fields: List of required fields
     :type required_fields: List[str]
     :param field_matching_methods: Dictionary with names of field matching methods to be used and parameters for each method
     :type field_matching_methods: Dictionary
+    :param cache_dir: Directory for the header map cache, defaults to None which disables caching
+    :type cache_dir: str
     :return: Dictionary containing missing fields and unexpected fields
     :rtype: Dictionary
 
@@ -32,9 +39,93 @@ def dataset_level_completeness_check(dataset_df, required_fields, field_matching
         'UA': ranked_field_matching
     }
  
-    dataset_headers = dataset_df.columns.tolist()  # Extract the headers from the dataset
+    if isinstance(dataset_df, pd.DataFrame):
+        dataset_headers = dataset_df.columns.tolist()  # Extract the headers from the dataset
+    else:
+        dataset_headers = list(dataset_df)
+
+    # With user-assisted matching, header maps with missing required fields are not cached, so that the user
+    # is prompted again for the fields that were skipped. Confirmed answers are stored separately (see save_user_answers).
+    user_assisted = 'UA' in field_matching_methods and field_matching_methods['UA'][0]
+
+    with profile_stage('dataset_level_completeness_check', columns=len(dataset_headers), required_fields=len(required_fields)) as span:
+        cached_header_map = None
+        if cache_dir is not None:
+            cache_key = get_header_map_cache_key(dataset_headers, required_fields, field_matching_methods)
+            cached_header_map = load_cached_header_map(cache_dir, cache_key)
+            if cached_header_map is not None and user_assisted and any(field not in cached_header_map for field in required_fields):
+                cached_header_map = None
+
+        if cached_header_map is not None:
+            available_header_map = {k:v for k,v in cached_header_map.items() if k in required_fields and v in dataset_headers}
+        else:
+            available_header_map = match_dataset_headers(dataset_headers, required_fields, field_matching_methods, matching_function_map, cache_dir)
+            if cache_dir is not None and not (user_assisted and any(field not in available_header_map for field in required_fields)):
+                save_cached_header_map(cache_dir, cache_key, available_header_map)
+        span.set(cached=cached_header_map is not None, matched_fields=len(available_header_map))
+    
+    missing_headers = [field for field in required_fields if field not in available_header_map.keys()]
+    unexpected_headers = [field for field in dataset_headers if field not in available_header_map.values()]
+
+    completeness_report = {
+        "available_header_map": available_header_map,
+        "missing_headers": missing_headers,
+        "unexpected_headers": unexpected_headers,
+        "completeness_score": compute_completeness_score(missing_headers, required_fields)
+    }
+
+    return completeness_report
+
+def header_completeness_check(file_path, required_fields, field_matching_methods, sep=None, cache_dir=None):
+
+    """
+    Perform a dataset-level completeness check on a metadata file using only its header.
+    The records of the file are not loaded (see read_metadata_header), so large files can be triaged quickly.
+    
+    :param file_path: Path to metadata file
+    :type file_path: str
+    :param required_fields: List of required fields
+    :type required_fields: List[str]
+    :param field_matching_methods: Dictionary with names of field matching methods to be used and parameters for each method
+    :type field_matching_methods: Dictionary
+    :param sep: Field separator in metadata file, defaults to None
+    :type sep: str
+    :param cache_dir: Directory for the header map cache, defaults to None which disables caching
+    :type cache_dir: str
+    :return: Dictionary containing missing fields and unexpected fields, or None if the header could not be read
+    :rtype: Dictionary
+
+    """
+
+    dataset_headers = read_metadata_header(file_path, sep=sep)
+    if dataset_headers is None:
+        return None
+
+    return dataset_level_completeness_check(dataset_headers, required_fields, field_matching_methods, cache_dir=cache_dir)
+
+def match_dataset_headers(dataset_headers, required_fields, field_matching_methods, matching_function_map, cache_dir=None):
+
+    """
+    Run the enabled field matching methods in order and return the matched header map.
+    User-assisted matching is run last on the fields that could not be matched automatically.
+    
+    :param dataset_headers: Header fields present in dataset metadata.
+    :type dataset_headers: List[str]
+    :param required_fields: List of required fields
+    :type required_fields: List[str]
+    :param field_matching_methods: Dictionary with names of field matching methods to be used and parameters for each method
+    :type field_matching_methods: Dictionary
+    :param matching_function_map: Dictionary with names of field matching methods as keys and matching functions as values
+    :type matching_function_map: Dictionary
+    :param cache_dir: Directory where user-assisted matching answers are stored, defaults to None
+    :type cache_dir: str
+    :return: Dictionary with the required field names as keys and the matched dataset field names as values
+    :rtype: Dictionary
+
+    """
 
     available_header_map = {}
+    fuzzy_score_matrix = None
 
     for method, params in field_matching_methods.items():
         if params[0] and method != 'UA':
@@ -44,7 +135,12 @@ def dataset_level_completeness_check(dataset_df, required_fields, field_matching
             }
             if params[1] is not None and isinstance(params[1], dict):
                 matching_function_arguments.update(params[1])
-            matched_header_map = matching_function_map.get(method, lambda: "Invalid matching method specified")(**matching_function_arguments)
+            with profile_stage('match_headers.'+method):
+                if method == 'fuzzy' and (matching_function_arguments.get('use_score_matrix') or matching_function_arguments.get('one_to_one')):
+                    # The score matrix is kept so that user-assisted fuzzy ranking reuses it for the unmatched fields
+                    fuzzy_score_matrix = get_fuzzy_score_matrix(dataset_headers, required_fields, workers=matching_function_arguments.get('workers', -1))
+                    matching_function_arguments['score_matrix'] = fuzzy_score_matrix
+                matched_header_map = matching_function_map.get(method, lambda: "Invalid matching method specified")(**matching_function_arguments)
 
             for k,v in matched_header_map.items():
                 available_header_map.setdefault(k,v)
@@ -53,29 +149,39 @@ def dataset_level_completeness_check(dataset_df, required_fields, field_matching
     missing_required_headers = [field for field in required_fields if field not in available_header_map.keys()]
     unmatched_dataset_headers = [field for field in dataset_headers if field not in available_header_map.values()]
 
-    if missing_required_headers:
-        if field_matching_methods['UA'][0]:
+    if missing_required_headers and 'UA' in field_matching_methods and field_matching_methods['UA'][0]:
+        if cache_dir is not None:
+            # Reuse answers given for previous datasets before prompting the user
+            reference_signature = get_reference_signature(required_fields, field_matching_methods)
+            user_answers = load_user_answers(cache_dir, reference_signature)
+            for field in missing_required_headers:
+                for dataset_field in user_answers.get(field, []):
+                    if dataset_field in unmatched_dataset_headers:
+                        available_header_map[field] = dataset_field
+                        unmatched_dataset_headers.remove(dataset_field)
+                        break
+            missing_required_headers = [field for field in missing_required_headers if field not in available_header_map.keys()]
+
+        if missing_required_headers:
             matching_function_arguments = {
                 'dataset_fields':unmatched_dataset_headers,
                 'required_fields': missing_required_headers,
             }
             if field_matching_methods['UA'][1] is not None and isinstance(field_matching_methods['UA'][1], dict):
                 matching_function_arguments.update(field_matching_methods['UA'][1])
-            matched_header_map = matching_function_map['UA'](**matching_function_arguments)
+            if fuzzy_score_matrix is not None and matching_function_arguments.get('ranking_method', 'fuzzy') == 'fuzzy':
+                # Fuzzy scores only depend on the field names, so the rows and columns of the unmatched fields are taken from the fuzzy step
+                row_idx = [required_fields.index(field) for field in missing_required_headers]
+                col_idx = [dataset_headers.index(field) for field in unmatched_dataset_headers]
+                matching_function_arguments['score_matrix'] = fuzzy_score_matrix[row_idx][:, col_idx]
+            with profile_stage('match_headers.UA'):
+                matched_header_map = matching_function_map['UA'](**matching_function_arguments)
             for k,v in matched_header_map.items():
                 available_header_map.setdefault(k,v)
-    
-    missing_headers = [field for field in required_fields if field not in available_header_map.keys()]
-    unexpected_headers = [field for field in dataset_headers if field not in available_header_map.values()]
-
-    completeness_report = {
-        "available_header_map": available_header_map,
-        "missing_headers": missing_headers,
-        "unexpected_headers": unexpected_headers,
-        "completeness_score": compute_completeness_score(missing_headers, required_fields)
-    }
+            if cache_dir is not None:
+                save_user_answers(cache_dir, reference_signature, matched_header_map)
 
-    return completeness_report
+    return available_header_map
 
 def compute_completeness_score(missing_headers, required_fields):
 
@@ -103,14 +209,168 @@ def compute_completeness_score(missing_headers, required_fields):
     return completeness_score
 
 
+class RecordCompletenessAccumulator:
+
+    """
+    Mergeable accumulator for record-level completeness statistics.
+    Stores per-column missing counts, a histogram of missing values per record and the total number of records.
+    The accumulator can be updated one chunk of metadata records at a time, and accumulators computed on
+    separate partitions of the same metadata file can be merged to obtain the statistics of the full file.
+    
+    :param required_fields: List of all required metadata fields.
+    :type required_fields: List[str]
+    :param available_headers: Required fields available in metadata. 
+        Dictionary with the required field names as keys and the matched dataset field names as values
+    :type available_headers: Dictionary
+
+    """
+
+    def __init__(self, required_fields, available_headers=None):
+        self.required_fields = list(required_fields)
+        if available_headers is not None and len(available_headers)>0:
+            self.available_headers = dict(available_headers)
+        else:
+            self.available_headers = None
+        self.total_records = 0
+        self.missing_per_column = None
+        self.missing_per_row_counts = {}
+
+    def update(self, dataset_df):
+        """
+        Add the completeness statistics of a chunk of metadata records to the accumulator.
+        
+        :param dataset_df: Dataframe with a chunk of dataset metadata records
+        :type dataset_df: pd.DataFrame
+        :return: The updated accumulator
+        :rtype: RecordCompletenessAccumulator
+
+        """
+
+        # Missing values are counted one column at a time, so no boolean copy of the whole chunk is made
+        if self.available_headers is not None:
+            # Required fields without a matched header are missing from every record
+            counted_columns = set(self.available_headers.values())
+            absent_count = len([col for col in self.required_fields if col not in self.available_headers.keys()])
+        else:
+            counted_columns = None
+            absent_count = 0
+
+        missing_per_column = []
+        missing_per_row = np.full(len(dataset_df), absent_count, dtype='int64')
+        for column_name, column in dataset_df.items():
+            column_missing = column.isna().to_numpy()
+            missing_per_column.append(int(column_missing.sum()))
+            if counted_columns is None or column_name in counted_columns:
+                missing_per_row += column_missing
+
+        self._add_column_counts(pd.Series(missing_per_column, index=dataset_df.columns, dtype='int64'))
+        self.total_records += len(dataset_df)
+
+        missing_counts, record_counts = np.unique(missing_per_row, return_counts=True)
+        self._add_row_counts(dict(zip(missing_counts.tolist(), record_counts.tolist())))
+        return self
+
+    def merge(self, other):
+        """
+        Merge the statistics of another accumulator computed on a different partition of the same metadata file.
+        
+        :param other: Accumulator to merge into this one
+        :type other: RecordCompletenessAccumulator
+        :return: The merged accumulator
+        :rtype: RecordCompletenessAccumulator
+
+        """
+
+        if other.missing_per_column is not None:
+            self._add_column_counts(other.missing_per_column)
+        self._add_row_counts(other.missing_per_row_counts)
+        self.total_records += other.total_records
+        return self
+
+    def _add_column_counts(self, missing_per_column):
+        if self.missing_per_column is None:
+            self.missing_per_column = missing_per_column.astype('int64')
+        else:
+            self.missing_per_column = self.missing_per_column.add(missing_per_column, fill_value=0).astype('int64')
+
+    def _add_row_counts(self, missing_per_row_counts):
+        for missing_count, record_count in missing_per_row_counts.items():
+            self.missing_per_row_counts[missing_count] = self.missing_per_row_counts.get(missing_count, 0) + int(record_count)
+
+    def get_report(self):
+        """
+        Compute the record-level completeness report from the accumulated statistics.
+        
+        :return: Dictionary with row and column completeness information
+        :rtype: Dictionary
+
+        """
+
+        total_records = self.total_records
+        missing_per_column = self.missing_per_column if self.missing_per_column is not None else pd.Series(dtype='int64')
+        columns_with_missing_values = missing_per_column[missing_per_column>0]
+
+        missing_per_column_perc = 100* missing_per_column/ total_records
+        available_per_column_perc = 100 - missing_per_column_perc
+
+        missing_cols_df = pd.DataFrame({
+            "Missing Count": columns_with_missing_values,
+            "Missing Percentage" : (columns_with_missing_values / total_records *100).round(2)
+        }).sort_values(by="Missing Count", ascending=False)
+
+        column_completeness = pd.DataFrame({
+            "Available (%)": available_per_column_perc,
+            "Missing (%)" : missing_per_column_perc
+        })
+
+        req_column_completeness = None
+        if self.available_headers is not None:
+            new_names_dict = {v:k for k,v in self.available_headers.items()}
+            available_columns = [col for col in missing_per_column.index if col in self.available_headers.values()]
+            req_missing_per_column = pd.concat([
+                pd.Series(missing_per_column[available_columns].values, index=[new_names_dict[col] for col in available_columns], dtype='int64'),
+                pd.Series(total_records, index=[col for col in self.required_fields if col not in self.available_headers.keys()], dtype='int64')
+            ])
+
+            req_missing_per_column_perc = 100* req_missing_per_column/ total_records
+            req_available_per_column_perc = 100 - req_missing_per_column_perc
+
+            req_column_completeness = pd.DataFrame({
+                "Available (%)": req_available_per_column_perc,
+                "Missing (%)" : req_missing_per_column_perc
+            }).sort_values(by="Available (%)", ascending=False)
+
+        row_missing_dist = pd.Series(self.missing_per_row_counts, dtype='int64').sort_index()
+
+        missing_rows_df = pd.DataFrame({
+            "Missing Values per Record": row_missing_dist.index,
+            "Number of Records" : row_missing_dist.values
+        })
+
+        complete_records = self.missing_per_row_counts.get(0, 0)
+
+        record_completeness_report = {
+            'total_records': total_records,
+            'complete_records': complete_records,
+            'missing_rows_stats_df': missing_rows_df,
+            'missing_cols_stats_df': missing_cols_df,
+            'column_completeness': column_completeness,
+            'required_column_completeness': req_column_completeness,
+        }
+
+        return record_completeness_report
+
+
 def record_level_completeness_check(dataset_df, required_fields, available_headers=None, visualize=False,savefig=False):
     
     """
     Perform a check at the record level to check the metadata availability of each data record.
     Return missing field information for each record.
+    The metadata can be provided as a single dataframe, as an iterator of dataframe chunks (see load_metadata_file),
+    or as a RecordCompletenessAccumulator that has already been updated with the metadata records.
     
-    :param dataset_df: Nested dictionary containing dataset metadata
-    :type dataset_df: Dictionary
+    :param dataset_df: Dataframe, iterator of dataframe chunks or accumulator containing dataset metadata
+    :type dataset_df: pd.DataFrame or Iterator[pd.DataFrame] or RecordCompletenessAccumulator
     :param required_fields: List of all required metadata fields.
     :type required_fields: List[str]
     :param available_headers: Required fields available in metadata. 
@@ -126,81 +386,50 @@ def record_level_completeness_check(dataset_df, required_fields, available_heade
 
     """
 
-    total_records = len(dataset_df)
-    missing_per_column = dataset_df.isnull().sum()
-    columns_with_missing_values = missing_per_column[missing_per_column>0]
+    with profile_stage('record_level_completeness_check') as span:
+        if isinstance(dataset_df, RecordCompletenessAccumulator):
+            accumulator = dataset_df
+        else:
+            accumulator = RecordCompletenessAccumulator(required_fields, available_headers)
+            if isinstance(dataset_df, pd.DataFrame):
+                accumulator.update(dataset_df)
+            else:
+                for chunk_df in dataset_df:
+                    accumulator.update(chunk_df)
 
-    missing_per_column_perc = 100* missing_per_column/ total_records
-    available_per_column_perc = 100 - missing_per_column_perc
+        record_completeness_report = accumulator.get_report()
+        span.set(rows=int(record_completeness_report['total_records']), columns=len(record_completeness_report['column_completeness']))
 
-    missing_cols_df = pd.DataFrame({
-        "Missing Count": columns_with_missing_values,
-        "Missing Percentage" : (columns_with_missing_values / total_records *100).round(2)
-    }).sort_values(by="Missing Count", ascending=False)
+    print('\n== Record Completeness Summary ==')
+    print(f"Total number of records: {record_completeness_report['total_records']}")
+    print(f"Number of complete records: {record_completeness_report['complete_records']}")
+    print(record_completeness_report['missing_rows_stats_df'])
 
-    column_completeness = pd.DataFrame({
-        "Available (%)": available_per_column_perc,
-        "Missing (%)" : missing_per_column_perc
-    })
+    if visualize:
+        plot_record_completeness(record_completeness_report, list(available_headers.keys()) if available_headers is not None else None, savefig=savefig)
 
-    if available_headers is not None and len(available_headers)>0:
+    return record_completeness_report
 
-        drop_columns = [col for col in dataset_df.columns if col not in available_headers.values()]
-        complete_dataset_df = dataset_df.drop(columns=drop_columns)
-        
-        for col in required_fields:
-            if col not in available_headers.keys():
-                complete_dataset_df[col] = np.nan
-        new_names_dict = {v:k for k,v in available_headers.items()}
-        complete_dataset_df = complete_dataset_df.rename(columns=new_names_dict)
-        req_missing_per_column = complete_dataset_df.isnull().sum()
-
-        req_missing_per_column_perc = 100* req_missing_per_column/ total_records
-        req_available_per_column_perc = 100 - req_missing_per_column_perc
-
-        req_column_completeness = pd.DataFrame({
-            "Available (%)": req_available_per_column_perc,
-            "Missing (%)" : req_missing_per_column_perc
-        }).sort_values(by="Available (%)", ascending=False)
-        
-    
-    if available_headers is not None and len(available_headers)>0:
-        missing_per_row = complete_dataset_df.isnull().sum(axis=1)
-    else:
-        missing_per_row = dataset_df.isnull().sum(axis=1)
 
-    rows_with_missing_values = missing_per_row[missing_per_row>0]
-    
-    row_missing_dist = missing_per_row.value_counts().sort_index()
-    
-    missing_rows_df = pd.DataFrame({
-        "Missing Values per Record": row_missing_dist.index,
-        "Number of Records" : row_missing_dist.values
-    })
+def plot_record_completeness(record_completeness_report, available_fields=None, savefig=False):
 
-    complete_records = total_records - len(rows_with_missing_values)
-    complete_records_percentage = 100*complete_records / total_records
+    """
+    Plot the column completeness of a record-level completeness report in barcharts.
+    Matplotlib is only imported when this function is called.
+    
+    :param record_completeness_report: Dictionary with row and column completeness information (see record_level_completeness_check)
+    :type record_completeness_report: Dictionary
+    :param available_fields: Required fields available in metadata. The completeness of the required fields is only plotted if provided.
+    :type available_fields: List[str]
+    :param savefig: Flag to save the figures as pngs
+    :type savefig: bool
 
-    print('\n== Record Completeness Summary ==')
-    print(f"Total number of records: {total_records}")
-    print(f"Number of complete records: {complete_records}")
-    print(missing_rows_df)
+    """
 
-    if visualize:
-        plot_completeness_barchart(column_completeness, available_list = None, plot_title='Completeness of fields present in Metadata', 
+    with profile_stage('record_level_completeness_check.render'):
+        plot_completeness_barchart(record_completeness_report['column_completeness'], available_list = None, plot_title='Completeness of fields present in Metadata', 
                                    plot_colors=['#55CC99','#DD3333'], add_text=True, savefig=savefig)
 
-        if available_headers is not None and len(available_headers)>0:
-            plot_completeness_barchart(req_column_completeness, available_list = list(available_headers.keys()), plot_title='Required Field Completeness Summary', 
-                                   plot_colors=['#5577DD','#DD3333'], add_text=True, savefig=savefig)
-
-
-    record_completeness_report = {
-        'total_records': total_records,
-        'missing_rows_stats_df': missing_rows_df,
-        'missing_cols_stats_df': missing_cols_df,
-        'column_completeness': column_completeness,
-        'required_column_completeness': req_column_completeness,
-    }
-
-    return record_completeness_report
\ No newline at end of file
+        if available_fields is not None and len(available_fields)>0:
+            plot_completeness_barchart(record_completeness_report['required_column_completeness'], available_list = available_fields, plot_title='Required Field Completeness Summary', 
+                                       plot_colors=['#5577DD','#DD3333'], add_text=True, savefig=savefig)
@@ -1,7 +1,6 @@
 import os
 import time
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
 
 from Coverage.compute_coverage import *
@@ -27,6 +26,166 @@ def assign_band(value, bands, labels):
     return 'Unavailable'
 
 
+def get_subgroup_bands(coverage_params_subgroup):
+    """Creates the bands used to group subgroup field values. Bands of bin_count values are created
+    between the subgroup thresholds.
+    
+    :param coverage_params_subgroup: Dictionary containing parameters for subgroup field analysis including thresholds and bin_count.
+    :type coverage_params_subgroup: dict
+    :return: Tuple with the list of band bounds and the list of band labels
+    :rtype: tuple(List[tuple], List[str])
+    
+    """
+    bands = [(i, i+coverage_params_subgroup['bin_count']-1) for i in range(coverage_params_subgroup['thresholds'][0],coverage_params_subgroup['thresholds'][1],coverage_params_subgroup['bin_count'])]
+    band_labels = [str(b) for b in bands]
+    return bands, band_labels
+
+
+def assign_bands(values, bands, labels):
+    """Assigns an array of values to bands based on defined ranges. Vectorized equivalent of assign_band:
+    band edges are inclusive, the first matching band is used and values outside all bands are labeled 'Unavailable'.
+    
+    :param values: Numeric values to be assigned to bands.
+    :type values: pandas.Series or array-like
+    :param bands: List of tuples defining the lower and upper bounds for each band.
+    :type bands: List[tuple]
+    :param labels: List of labels corresponding to each band range.
+    :type labels: List[str]
+    :return: Band label of each value
+    :rtype: pandas.Series
+    
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    values = np.asarray(values, dtype='float64')
+    band_index = np.full(len(values), -1)
+
+    if len(bands) > 0:
+        lows = np.array([low for low, _ in bands], dtype='float64')
+        highs = np.array([high for _, high in bands], dtype='float64')
+        if np.all(lows[1:] > highs[:-1]):
+            # Sorted, non-overlapping bands: find the last band starting at or below each value
+            candidate_index = np.searchsorted(lows, values, side='right') - 1
+            in_band = (candidate_index >= 0) & (values <= highs[np.maximum(candidate_index, 0)])
+            band_index[in_band] = candidate_index[in_band]
+        else:
+            # Unsorted or overlapping bands: later bands are overwritten by earlier ones, so the first match is kept
+            for i in reversed(range(len(bands))):
+                band_index[(lows[i] <= values) & (values <= highs[i])] = i
+
+    band_labels = np.array(list(labels) + ['Unavailable'], dtype=object)
+    return pd.Series(band_labels[band_index], index=index)
+
+
+def get_band_counts(consistency_df):
+    """Counts the records of each target value in each subgroup band. Equivalent to grouping by band and target
+    and unstacking, computed from the integer codes of the two columns.
+    
+    :param consistency_df: DataFrame with 'band' and 'Target' columns.
+    :type consistency_df: pandas.DataFrame
+    :return: DataFrame with the bands as rows, the target values as columns and the record counts as values
+    :rtype: pandas.DataFrame
+    
+    """
+    band_codes, band_values = pd.factorize(consistency_df['band'], sort=True)
+
+    target = consistency_df['Target']
+    if isinstance(target.dtype, pd.CategoricalDtype):
+        # All categories are kept, as with observed=False
+        target_codes = target.cat.codes.to_numpy()
+        target_values = pd.CategoricalIndex(target.cat.categories, categories=target.cat.categories, ordered=target.cat.ordered)
+    else:
+        target_codes, target_values = pd.factorize(target, sort=True)
+
+    valid = (band_codes >= 0) & (target_codes >= 0)
+    band_codes = band_codes[valid]
+    target_codes = target_codes[valid]
+    counts = np.bincount(band_codes*len(target_values) + target_codes, minlength=len(band_values)*len(target_values))
+
+    band_counts = pd.DataFrame(counts.reshape(len(band_values), len(target_values)),
+                               index=pd.Index(band_values, name='band'), columns=target_values.rename('Target'))
+    # Bands without any valid target value are not part of the grouped counts
+    return band_counts[np.bincount(band_codes, minlength=len(band_values)) > 0]
+
+
+def get_consistency_df(dataset_df, required_fields, available_headers, coverage_params_subgroup, coverage_params_target):
+
+    """Cleans the subgroup and target field values of the records and assigns every record to a subgroup band.
+    
+    :param dataset_df: Dataset dataframe containing the fields to analyze.
+    :type dataset_df: pandas.DataFrame
+    :param required_fields: List of fields that are required for the analysis.
+    :type required_fields: List[str]
+    :param available_headers: Dictionary mapping required field names to actual column names in the dataset.
+    :type available_headers: dict
+    :param coverage_params_subgroup: Dictionary containing parameters for subgroup field analysis including target_field, thresholds, and bin_count.
+    :type coverage_params_subgroup: dict
+    :param coverage_params_target: Dictionary containing parameters for target field analysis including target_field and optional value_buckets.
+    :type coverage_params_target: dict
+    :return: DataFrame with the subgroup, target, and band of every record with both field values available
+    :rtype: pandas.DataFrame
+    
+    """
+
+    subgroup_field = coverage_params_subgroup['target_field']
+    target_field = coverage_params_target['target_field']
+    with profile_stage('consistency_check.clean', subgroup_field=subgroup_field, target_field=target_field):
+        field_columns = get_coverage_columns(dataset_df, required_fields, available_headers, list(dict.fromkeys([subgroup_field, target_field])))
+
+        subgroup_values = clean_coverage_values(field_columns[subgroup_field], coverage_params_subgroup)
+
+        target_values = clean_coverage_values(field_columns[target_field], coverage_params_target)
+
+        group_values_into_buckets = False
+        if 'value_buckets' in coverage_params_target:
+            if coverage_params_target['value_buckets'] is not None:
+                group_values_into_buckets = True
+    
+        if group_values_into_buckets:
+            target_values = bucket_values(target_values, coverage_params_target['value_buckets'])
+  
+        consistency_df = pd.concat([subgroup_values, target_values], axis=1, keys=['Subgroup', 'Target'], join='inner')
+        if isinstance(consistency_df['Target'].dtype, pd.CategoricalDtype) and not group_values_into_buckets:
+            # Target values of records without a subgroup value are not counted, as for text columns
+            consistency_df['Target'] = consistency_df['Target'].cat.remove_unused_categories()
+
+    with profile_stage('consistency_check.banding', target_field=target_field) as span:
+        bands, band_labels = get_subgroup_bands(coverage_params_subgroup)
+    
+        consistency_df['band'] = assign_bands(consistency_df['Subgroup'], bands, band_labels)
+        span.set_shape(consistency_df)
+
+    return consistency_df
+
+
+def get_consistency_report(consistency_df, coverage_params_subgroup, coverage_params_target):
+
+    """Summarizes the records of a consistency analysis (see get_consistency_df) as a structured report,
+    so that the consistency figure can be rendered later with plot_consistency.
+    
+    :param consistency_df: DataFrame with the subgroup, target, and band of every record.
+    :type consistency_df: pandas.DataFrame
+    :param coverage_params_subgroup: Dictionary containing parameters for the subgroup field.
+    :type coverage_params_subgroup: dict
+    :param coverage_params_target: Dictionary containing parameters for the target field.
+    :type coverage_params_target: dict
+    :return: Dictionary with the subgroup field, target field, number of records and the record counts of each target value in each subgroup band
+    :rtype: dict
+    
+    """
+
+    with profile_stage('consistency_check.count', target_field=coverage_params_target['target_field']):
+        band_counts = get_band_counts(consistency_df)
+
+    consistency_report = {
+        'subgroup_field': coverage_params_subgroup['target_field'],
+        'target_field': coverage_params_target['target_field'],
+        'records': len(consistency_df),
+        'band_counts': band_counts,
+    }
+
+    return consistency_report
+
+
 def consistency_check(dataset_df, required_fields, available_headers, coverage_params_subgroup, coverage_params_target,visualize=True,savefig=False):
 
     """Performs consistency analysis by examining the distribution of target field values
@@ -51,48 +210,183 @@ def consistency_check(dataset_df, required_fields, available_headers, coverage_p
     
     """
 
-    subgroup_values = get_coverage_df(dataset_df, required_fields, available_headers=available_headers, coverage_params=coverage_params_subgroup)
+    consistency_df = get_consistency_df(dataset_df, required_fields, available_headers, coverage_params_subgroup, coverage_params_target)
+    
+    if visualize:
+        consistency_report = get_consistency_report(consistency_df, coverage_params_subgroup, coverage_params_target)
+        plot_consistency(consistency_report, savefig=savefig)
 
-    target_values = get_coverage_df(dataset_df, required_fields, available_headers=available_headers, coverage_params=coverage_params_target)
+    return consistency_df
 
-    group_values_into_buckets = False
-    if 'value_buckets' in coverage_params_target:
-        if coverage_params_target['value_buckets'] is not None:
-            group_values_into_buckets = True
-    
-    if group_values_into_buckets:
-        target_values = bucket_values(target_values, coverage_params_target['value_buckets'])
-  
-    consistency_df = pd.concat([subgroup_values, target_values], axis=1, keys=['Subgroup', 'Target'], join='inner')
 
-    bands = [(i, i+coverage_params_subgroup['bin_count']-1) for i in range(coverage_params_subgroup['thresholds'][0],coverage_params_subgroup['thresholds'][1],coverage_params_subgroup['bin_count'])]
-    band_labels = [str(b) for b in bands]
-    
-    consistency_df['band'] = consistency_df['Subgroup'].apply(lambda x: assign_band(x, bands, band_labels))
+def plot_consistency(consistency_report, savefig=False, max_values=50):
 
-    band_counts = consistency_df.groupby(['band', 'Target'], observed=False).size().unstack(fill_value=0)
-  
-    band_counts_transposed = band_counts.T
+    """Plots the record counts of a consistency report (see get_consistency_report) as a grouped bar chart
+    with one group per target value and one bar per subgroup band. If there are more than max_values target values,
+    only the target values with the most records are plotted. Matplotlib is only imported when this function is called.
+    The figure is not shown, so that the function does not block in scripts. In notebooks, the figure is displayed inline.
     
-    if visualize:
-        if len(target_values.unique()) > 50:
-            print('Too many values to plot.')
-            return consistency_df
+    :param consistency_report: Consistency report of the subgroup and target fields.
+    :type consistency_report: dict
+    :param savefig: Whether to save generated plots to file with timestamp.
+    :type savefig: bool
+    :param max_values: Maximum number of target values in the chart. Set to None to plot all target values.
+    :type max_values: int or None
+    
+    """
+
+    with profile_stage('consistency_check.render', target_field=consistency_report['target_field']):
+        import matplotlib.pyplot as plt
+
+        band_counts_transposed = consistency_report['band_counts'].T
+        plot_title = f"{consistency_report['target_field']} across {consistency_report['subgroup_field']}"
+        if max_values is not None and len(band_counts_transposed) > max_values:
+            top_values = get_top_counts(band_counts_transposed.sum(axis=1), max_values).index
+            plot_title += f' (top {max_values} of {len(band_counts_transposed)} values)'
+            band_counts_transposed = band_counts_transposed.loc[top_values]
         # Create grouped bar chart
         fig, ax = plt.subplots(1,1,figsize=(15,10))
         band_counts_transposed.plot(ax=ax,kind='bar', figsize=(10, 4), width=0.8)
         plt.grid(axis='y', linestyle='--', alpha=0.7)
-        plt.title(f"{coverage_params_target['target_field']} across {coverage_params_subgroup['target_field']}")
-        plt.xlabel(f"{coverage_params_target['target_field']}", fontsize=12)
+        plt.title(plot_title)
+        plt.xlabel(f"{consistency_report['target_field']}", fontsize=12)
         plt.ylabel('Count', fontsize=12)
         plt.legend(title='Subgroups', bbox_to_anchor=(1.05, 1), loc='upper left',fontsize=10)
         plt.xticks(rotation=0, fontsize=12)
         plt.yticks(fontsize=12)
         plt.tight_layout()
-        plt.show()
 
         if savefig:
             timestr = time.strftime("%Y%m%d_%H%M%S")
             fig.savefig('output/Consistency_'+timestr+'.png',bbox_inches='tight',pad_inches=0.1,facecolor='w')
 
-    return consistency_df
+
+def encode_consistency_field(data_values, coverage_params, subgroup=False):
+    """Encodes the cleaned values of a field as integer codes for consistency cube counting.
+    Subgroup fields with thresholds and a bin_count are grouped into bands and fields with value_buckets are bucketed.
+    
+    :param data_values: Cleaned data values of the field.
+    :type data_values: pandas.Series
+    :param coverage_params: Dictionary containing parameters for the field.
+    :type coverage_params: dict
+    :param subgroup: Whether the field is used as a subgroup field.
+    :type subgroup: bool
+    :return: Tuple with the codes of the values, the value labels for the codes, and whether labels without records are kept
+    :rtype: tuple(numpy.ndarray, pandas.Index, bool)
+    
+    """
+    if subgroup and coverage_params.get('thresholds') is not None and coverage_params.get('bin_count') is not None:
+        bands, band_labels = get_subgroup_bands(coverage_params)
+        data_values = assign_bands(data_values, bands, band_labels)
+    elif coverage_params.get('value_buckets') is not None:
+        data_values = bucket_values(data_values, coverage_params['value_buckets'])
+
+    if isinstance(data_values.dtype, pd.CategoricalDtype):
+        # All value buckets are kept, as with observed=False
+        keep_empty = coverage_params.get('value_buckets') is not None and not subgroup
+        return data_values.cat.codes.to_numpy(), pd.Index(data_values.cat.categories), keep_empty
+    codes, labels = pd.factorize(data_values, sort=True)
+    return codes, pd.Index(labels), False
+
+
+def consistency_cube(dataset_df, required_fields, available_headers, coverage_params_subgroups, coverage_params_targets, metric='HD'):
+
+    """Performs consistency analysis for every pair of subgroup field and target field at once.
+    The fields are extracted from the dataset once, cleaned and encoded as integer codes, and the records are counted
+    in a single grouped aggregation over all encoded fields. The contingency table of each subgroup x target pair is
+    derived from these joint counts. For each pair, the divergence of the target distribution of every subgroup
+    from the pooled target distribution is also computed.
+    
+    :param dataset_df: Dataset dataframe containing the fields to analyze.
+    :type dataset_df: pandas.DataFrame
+    :param required_fields: List of fields that are required for the analysis.
+    :type required_fields: List[str]
+    :param available_headers: Dictionary mapping required field names to actual column names in the dataset.
+    :type available_headers: dict
+    :param coverage_params_subgroups: List of dictionaries containing parameters for each subgroup field (see consistency_check).
+    :type coverage_params_subgroups: List[dict]
+    :param coverage_params_targets: List of dictionaries containing parameters for each target field (see consistency_check).
+    :type coverage_params_targets: List[dict]
+    :param metric: Divergence metric, 'KLD' for Kullback–Leibler divergence or 'HD' for Hellinger distance.
+    :type metric: str
+    :return: Dictionary with the joint counts of all fields ('joint_counts'), the contingency table of each
+        (subgroup field, target field) pair ('contingency_tables') and the divergence of each subgroup from the pooled
+        distribution ('subgroup_divergence')
+    :rtype: dict
+    
+    """
+
+    field_roles = [(params, True) for params in coverage_params_subgroups] + [(params, False) for params in coverage_params_targets]
+    field_names = list(dict.fromkeys(params['target_field'] for params, _ in field_roles))
+    field_columns = get_coverage_columns(dataset_df, required_fields, available_headers, field_names)
+    record_num = max(len(column) for column in field_columns.values())
+
+    # Codes of every field for every record, -1 for records where the field is unavailable
+    field_codes = {}
+    field_labels = {}
+    for params, subgroup in field_roles:
+        key = ('subgroup' if subgroup else 'target', params['target_field'])
+        data_values = clean_coverage_values(field_columns[params['target_field']].reset_index(drop=True), params)
+        if not isinstance(data_values, pd.Series):
+            print(f"{params['target_field']} is excluded from the consistency cube.")
+            continue
+        codes, labels, keep_empty = encode_consistency_field(data_values, params, subgroup=subgroup)
+        record_codes = np.full(record_num, -1, dtype='int64')
+        record_codes[data_values.index.to_numpy()] = codes
+        field_codes[key] = record_codes
+        field_labels[key] = (labels, keep_empty)
+
+    code_keys = list(field_codes.keys())
+    joint_counts = pd.DataFrame({i: field_codes[key] for i, key in enumerate(code_keys)}).value_counts(sort=False)
+    joint_codes = joint_counts.index.to_frame(index=False).to_numpy()
+    joint_record_counts = joint_counts.to_numpy()
+
+    joint_counts_df = pd.DataFrame({
+        f'{role}: {field}': field_labels[(role, field)][0].take(joint_codes[:, i], allow_fill=True, fill_value=np.nan)
+        for i, (role, field) in enumerate(code_keys)
+    })
+    joint_counts_df['count'] = joint_record_counts
+
+    contingency_tables = {}
+    divergence_rows = []
+    for i, (role_s, subgroup_field) in enumerate(code_keys):
+        if role_s != 'subgroup':
+            continue
+        subgroup_labels, _ = field_labels[(role_s, subgroup_field)]
+        for j, (role_t, target_field) in enumerate(code_keys):
+            if role_t != 'target' or target_field == subgroup_field:
+                continue
+            target_labels, keep_empty_targets = field_labels[(role_t, target_field)]
+
+            subgroup_codes = joint_codes[:, i]
+            target_codes = joint_codes[:, j]
+            valid = (subgroup_codes >= 0) & (target_codes >= 0)
+            counts = np.bincount(subgroup_codes[valid]*len(target_labels) + target_codes[valid], weights=joint_record_counts[valid],
+                                 minlength=len(subgroup_labels)*len(target_labels)).astype('int64')
+            contingency_table = pd.DataFrame(counts.reshape(len(subgroup_labels), len(target_labels)),
+                                             index=subgroup_labels.rename(subgroup_field), columns=target_labels.rename(target_field))
+            contingency_table = contingency_table[contingency_table.sum(axis=1) > 0]
+            if not keep_empty_targets:
+                contingency_table = contingency_table.loc[:, contingency_table.sum(axis=0) > 0]
+            contingency_tables[(subgroup_field, target_field)] = contingency_table
+
+            pooled_counts = contingency_table.sum(axis=0)
+            pooled_counts = pooled_counts[pooled_counts > 0]
+            for subgroup_value, subgroup_counts in contingency_table[pooled_counts.index].iterrows():
+                divergence_value, _ = get_divergence_dfs(CountTable(subgroup_counts[subgroup_counts > 0]), CountTable(pooled_counts), metric=metric)
+                divergence_rows.append({
+                    'subgroup_field': subgroup_field,
+                    'subgroup_value': subgroup_value,
+                    'target_field': target_field,
+                    'records': int(subgroup_counts.sum()),
+                    'metric': metric,
+                    'divergence': float(divergence_value),
+                })
+
+    subgroup_divergence_df = pd.DataFrame(divergence_rows, columns=['subgroup_field', 'subgroup_value', 'target_field', 'records', 'metric', 'divergence'])
+
+    return {
+        'joint_counts': joint_counts_df,
+        'contingency_tables': contingency_tables,
+        'subgroup_divergence': subgroup_divergence_df,
+    }
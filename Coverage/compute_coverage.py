@@ -2,54 +2,172 @@ import sys
 import os
 import time
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
-import scipy.stats as stats
 import re
 import ast
-from scipy.special import rel_entr
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from Completeness.profiling_utils import *
+
+# Integer values are extracted from metadata text as the first number, without leading zeros
+_INT_VALUE_PATTERN = re.compile(r'0*(\d+)')
+
+
+class CountTable:
+    """Mergeable table of value counts for a metadata field.
+    Count tables can be computed separately on chunks or partitions of metadata files and merged by addition,
+    so that divergences can be computed without concatenating the underlying dataframes.
+    
+    :param counts: Series with the field values as index and the number of records for each value as data.
+    :type counts: pandas.Series or None
+    
+    """
+
+    def __init__(self, counts=None):
+        if counts is None:
+            counts = pd.Series(dtype='int64')
+        self.counts = counts
+
+    @classmethod
+    def from_values(cls, data_values):
+        """Creates a count table from the data values of a field.
+        
+        :param data_values: Data values of the field, such as the output of get_coverage_df.
+        :type data_values: pandas.Series
+        :return: Count table of the data values
+        :rtype: CountTable
+        
+        """
+        counts = data_values.value_counts().sort_index()
+        if isinstance(counts.index, pd.CategoricalIndex):
+            # Keep all categories (including empty buckets) but store them as plain values so tables can be merged
+            counts.index = counts.index.astype(counts.index.categories.dtype)
+        return cls(counts)
+
+    def update(self, data_values):
+        """Adds the counts of a new chunk of data values to the table.
+        
+        :param data_values: Data values of the field.
+        :type data_values: pandas.Series
+        :return: The updated count table
+        :rtype: CountTable
+        
+        """
+        return self.merge(CountTable.from_values(data_values))
+
+    def merge(self, other):
+        """Adds the counts of another count table to this table.
+        
+        :param other: Count table to merge.
+        :type other: CountTable
+        :return: The merged count table
+        :rtype: CountTable
+        
+        """
+        if len(self.counts) == 0:
+            self.counts = other.counts.copy()
+        elif len(other.counts) > 0:
+            self.counts = self.counts.add(other.counts, fill_value=0).astype('int64').sort_index()
+        return self
+
+    def __add__(self, other):
+        return CountTable(self.counts.copy()).merge(other)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def total(self):
+        """Returns the total number of records in the count table.
+        
+        :return: Number of records
+        :rtype: int
+        
+        """
+        return int(self.counts.sum())
+
+    def reindex(self, field_values, fill_value=0):
+        """Returns the counts for a given list of field values.
+        
+        :param field_values: Field values for which counts are returned.
+        :type field_values: array-like
+        :param fill_value: Count used for values that are not in the table.
+        :type fill_value: int
+        :return: Counts for the given field values
+        :rtype: pandas.Series
+        
+        """
+        return self.counts.reindex(field_values, fill_value=fill_value)
+
+
+def align_count_tables(count_tables, field_values=None):
+    """Aligns a list of count tables on a common set of field values.
+    
+    :param count_tables: Count tables to align.
+    :type count_tables: List[CountTable]
+    :param field_values: Field values to align on. If None, uses the union of the values in all tables.
+    :type field_values: array-like or None
+    :return: Aligned count vectors, one per count table
+    :rtype: List[numpy.ndarray]
+    
+    """
+    if field_values is None:
+        field_values = count_tables[0].counts.index
+        for count_table in count_tables[1:]:
+            field_values = field_values.union(count_table.counts.index)
+    return [count_table.reindex(field_values, fill_value=0).to_numpy() for count_table in count_tables]
 
 
 def calculate_hellinger_dist(counts_p, counts_q, symmetric=False):
     """Calculates the Hellinger distance between two probability distributions
-    derived from count data.
+    derived from count data. Count tables are aligned on the union of their values.
     
     :param counts_p: Count data for the first distribution.
-    :type counts_p: array-like
+    :type counts_p: array-like or CountTable
     :param counts_q: Count data for the second distribution.
-    :type counts_q: array-like
+    :type counts_q: array-like or CountTable
     :return: Hellinger distance value
     :rtype: float
     
     """
+    if isinstance(counts_p, CountTable) and isinstance(counts_q, CountTable):
+        counts_p, counts_q = align_count_tables([counts_p, counts_q])
+
     p = np.asarray(counts_p, dtype=np.float64)
     q = np.asarray(counts_q, dtype=np.float64)
 
-    p /= p.sum()
-    q /= q.sum()
+    # Normalize into new arrays so that the caller's count arrays are not modified
+    p = p / p.sum()
+    q = q / q.sum()
 
     return np.sqrt(np.sum((np.sqrt(p) - np.sqrt(q))**2)) / np.sqrt(2)
 
 
 def calculate_kl_div(counts_p, counts_q, symmetric=False):
     """Calculates the Kullback-Leibler divergence between two probability distributions
-    derived from count data.
+    derived from count data. Count tables are aligned on the union of their values.
     
     :param counts_p: Count data for the first distribution.
-    :type counts_p: array-like
+    :type counts_p: array-like or CountTable
     :param counts_q: Count data for the second distribution.
-    :type counts_q: array-like
+    :type counts_q: array-like or CountTable
     :param symmetric: If True, returns the symmetric KL divergence (sum of both directions).
     :type symmetric: bool
     :return: KL divergence value, or symmetric KL divergence if symmetric=True
     :rtype: float
     
     """
+    if isinstance(counts_p, CountTable) and isinstance(counts_q, CountTable):
+        counts_p, counts_q = align_count_tables([counts_p, counts_q])
+
+    from scipy.special import rel_entr
+
     p = np.asarray(counts_p, dtype=np.float64)
     q = np.asarray(counts_q, dtype=np.float64)
 
-    p /= p.sum()
-    q /= q.sum()
+    # Normalize into new arrays so that the caller's count arrays are not modified
+    p = p / p.sum()
+    q = q / q.sum()
 
     kld_pq = np.sum(rel_entr(p, q))
 
@@ -60,15 +178,105 @@ def calculate_kl_div(counts_p, counts_q, symmetric=False):
         return kld_pq
         
 
+def get_count_matrix(count_tables, field_values=None):
+    """Stacks count tables into a count matrix with one row per table, aligned on a common set of field values.
+    
+    :param count_tables: Count tables to stack.
+    :type count_tables: List[CountTable]
+    :param field_values: Field values to align on. If None, uses the union of the values in all tables.
+    :type field_values: array-like or None
+    :return: Tuple with the count matrix (tables x field values) and the field values of its columns
+    :rtype: tuple(numpy.ndarray, pandas.Index)
+    
+    """
+    if field_values is None:
+        field_values = count_tables[0].counts.index
+        for count_table in count_tables[1:]:
+            field_values = field_values.union(count_table.counts.index)
+    field_values = pd.Index(field_values)
+    count_matrix = np.vstack(align_count_tables(count_tables, field_values)) if count_tables else np.zeros((0, len(field_values)))
+    return count_matrix.astype(np.float64), field_values
+
+
+def _normalize_count_rows(count_matrix):
+    count_matrix = np.atleast_2d(np.asarray(count_matrix, dtype=np.float64))
+    return count_matrix / count_matrix.sum(axis=1, keepdims=True)
+
+
+def _get_row_chunk_size(num_rows_q, num_values, max_chunk_elements):
+    return max(1, int(max_chunk_elements // max(1, num_rows_q*num_values)))
+
+
+def pairwise_hellinger_dist(counts_p, counts_q=None, max_chunk_elements=2**24):
+    """Calculates the Hellinger distance between every row of one count matrix and every row of another.
+    Batched equivalent of calling calculate_hellinger_dist on every pair of rows. The input matrices are not modified.
+    Rows are processed in chunks so that at most max_chunk_elements intermediate values are held in memory.
+    
+    :param counts_p: Count matrix with one distribution per row (e.g. sites x field values).
+    :type counts_p: array-like
+    :param counts_q: Count matrix with one distribution per row over the same field values. If None, counts_p is compared with itself.
+    :type counts_q: array-like or None
+    :param max_chunk_elements: Maximum number of elements of the intermediate array for one chunk of rows.
+    :type max_chunk_elements: int
+    :return: Matrix of Hellinger distances with rows for counts_p and columns for counts_q
+    :rtype: numpy.ndarray
+    
+    """
+    sqrt_p = np.sqrt(_normalize_count_rows(counts_p))
+    sqrt_q = sqrt_p if counts_q is None else np.sqrt(_normalize_count_rows(counts_q))
+
+    divergence_matrix = np.empty((sqrt_p.shape[0], sqrt_q.shape[0]))
+    chunk_size = _get_row_chunk_size(sqrt_q.shape[0], sqrt_q.shape[1], max_chunk_elements)
+    for start in range(0, sqrt_p.shape[0], chunk_size):
+        diff = sqrt_p[start:start+chunk_size, None, :] - sqrt_q[None, :, :]
+        divergence_matrix[start:start+chunk_size] = np.sqrt(np.sum(diff**2, axis=2)) / np.sqrt(2)
+
+    return divergence_matrix
+
+
+def pairwise_kl_div(counts_p, counts_q=None, symmetric=False, max_chunk_elements=2**24):
+    """Calculates the Kullback-Leibler divergence between every row of one count matrix and every row of another.
+    Batched equivalent of calling calculate_kl_div on every pair of rows. The input matrices are not modified.
+    Rows are processed in chunks so that at most max_chunk_elements intermediate values are held in memory.
+    
+    :param counts_p: Count matrix with one distribution per row (e.g. sites x field values).
+    :type counts_p: array-like
+    :param counts_q: Count matrix with one distribution per row over the same field values. If None, counts_p is compared with itself.
+    :type counts_q: array-like or None
+    :param symmetric: If True, returns the symmetric KL divergence (sum of both directions).
+    :type symmetric: bool
+    :param max_chunk_elements: Maximum number of elements of the intermediate array for one chunk of rows.
+    :type max_chunk_elements: int
+    :return: Matrix of KL divergences with rows for counts_p and columns for counts_q
+    :rtype: numpy.ndarray
+    
+    """
+    from scipy.special import rel_entr
+
+    p = _normalize_count_rows(counts_p)
+    q = p if counts_q is None else _normalize_count_rows(counts_q)
+
+    divergence_matrix = np.empty((p.shape[0], q.shape[0]))
+    chunk_size = _get_row_chunk_size(q.shape[0], q.shape[1], max_chunk_elements)
+    for start in range(0, p.shape[0], chunk_size):
+        p_chunk = p[start:start+chunk_size, None, :]
+        divergence_chunk = np.sum(rel_entr(p_chunk, q[None, :, :]), axis=2)
+        if symmetric:
+            divergence_chunk += np.sum(rel_entr(q[None, :, :], p_chunk), axis=2)
+        divergence_matrix[start:start+chunk_size] = divergence_chunk
+
+    return divergence_matrix
+
+
 def get_divergence_dfs(df1, df2=None, field_values=None, metric="HD", fill_value=1):
 
     """Calculates divergence between distributions from one or two dataframes using
-    specified distance metrics.
+    specified distance metrics. Count tables can be provided in place of the data values.
     
-    :param df1: First dataframe or series for distribution comparison.
-    :type df1: pandas.DataFrame or pandas.Series
-    :param df2: Second dataframe or series for distribution comparison. If None, compares df1 against uniform distribution.
-    :type df2: pandas.DataFrame or pandas.Series or None
+    :param df1: First dataframe, series or count table for distribution comparison.
+    :type df1: pandas.DataFrame or pandas.Series or CountTable
+    :param df2: Second dataframe, series or count table for distribution comparison. If None, compares df1 against uniform distribution.
+    :type df2: pandas.DataFrame or pandas.Series or CountTable or None
     :param field_values: Specific field values to include in the comparison. If None, uses all unique values from the data.
     :type field_values: array-like or None
     :param metric: Distance metric to use for comparison ("KLD" for Kullback-Leibler divergence, "HD" for Hellinger distance).
@@ -84,19 +292,20 @@ def get_divergence_dfs(df1, df2=None, field_values=None, metric="HD", fill_value
         "KLD": calculate_kl_div,
         "HD": calculate_hellinger_dist
     }
-            
-    df1_total_records = len(df1)
 
-    observed_counts1 = df1.value_counts().sort_index()
+    if not isinstance(df1, CountTable):
+        df1 = CountTable.from_values(df1)
+    if df2 is not None and not isinstance(df2, CountTable):
+        df2 = CountTable.from_values(df2)
+
+    observed_counts1 = df1.counts
     original_indices1 = observed_counts1.index
 
     if field_values is None:
         if df2 is not None:
-            df_combined = pd.concat([df1, df2], axis=0, ignore_index=True, join='inner')
-            observed_counts_combined = df_combined.value_counts().sort_index()
-            field_values = observed_counts_combined.index.values
+            field_values = original_indices1.union(df2.counts.index).values
         else:
-            field_values = df1.unique()
+            field_values = original_indices1.values
             
         
     if field_values is not None and not all(element in original_indices1 for element in field_values):
@@ -109,8 +318,7 @@ def get_divergence_dfs(df1, df2=None, field_values=None, metric="HD", fill_value
 
     
     if df2 is not None:
-        df2_total_records = len(df2)
-        observed_counts2 = df2.value_counts().sort_index()
+        observed_counts2 = df2.counts
         original_indices2 = observed_counts2.index
 
         if field_values is not None and not all(element in original_indices2 for element in field_values):
@@ -128,7 +336,7 @@ def get_divergence_dfs(df1, df2=None, field_values=None, metric="HD", fill_value
         return divergence_value, {'dist1':observed_counts1/observed_counts1.sum(), 'dist2':observed_counts2/observed_counts2.sum()}
     else:
         num_unique = len(observed_counts1)
-        df1_counts_uniform = np.full(num_unique,df1_total_records/num_unique)
+        df1_counts_uniform = np.full(num_unique,df1.total()/num_unique)
         divergence_value = metric_funcs[metric](observed_counts1, df1_counts_uniform, symmetric=False)
         
         return divergence_value, {'dist1':observed_counts1/observed_counts1.sum()}
@@ -152,52 +360,204 @@ def get_coverage_df(dataset_df_full, required_fields, available_headers=None, co
     
     """
 
-
     target_field = coverage_params['target_field']
-    assert target_field in available_headers.keys() or target_field in dataset_df_full.columns, f'Target field {target_field} not found in metadata.'
+    target_columns = get_coverage_columns(dataset_df_full, required_fields, available_headers, [target_field])
 
-    if available_headers is not None and len(available_headers)>0 and target_field in available_headers.keys():
+    return clean_coverage_values(target_columns[target_field], coverage_params)
 
-        drop_columns = [col for col in dataset_df_full.columns if col not in available_headers.values()]
-        complete_dataset_df = dataset_df_full.drop(columns=drop_columns)
-        
-        for col in required_fields:
-            if col not in available_headers.keys():
-                complete_dataset_df[col] = np.nan
-        new_names_dict = {v:k for k,v in available_headers.items()}
-        dataset_df_full = complete_dataset_df.rename(columns=new_names_dict)
-
-    empty_rows = dataset_df_full.isna().all(axis=1)
-    empty_row_indexes = empty_rows[empty_rows].index.tolist()
-    
-    if empty_row_indexes:
-        first_empty_row_index = empty_row_indexes[0]
-        dataset_df = dataset_df_full.iloc[:first_empty_row_index]
-    else:
-        dataset_df = dataset_df_full
+
+def get_coverage_columns(dataset_df_full, required_fields, available_headers=None, target_fields=None):
+
+    """Extracts the data of one or more target fields from a dataset. Target fields that are matched
+    required fields are looked up through the header map, other target fields are read as dataset columns.
+    The records after the first empty record are dropped. The header remapping and the empty record search
+    are done once for all target fields.
     
-    record_num = len(dataset_df[target_field])
-    if len(dataset_df[target_field].unique()) > 0.9*record_num:
+    :param dataset_df_full: Complete dataset dataframe to process.
+    :type dataset_df_full: pandas.DataFrame
+    :param required_fields: List of fields that are required for analysis.
+    :type required_fields: List[str]
+    :param available_headers: Dictionary mapping required field names to actual column names in the dataset.
+    :type available_headers: dict or None
+    :param target_fields: List of target fields to extract.
+    :type target_fields: List[str]
+    :return: Dictionary with the target fields as keys and their data as values
+    :rtype: dict
+    
+    """
+
+    use_header_map = available_headers is not None and len(available_headers)>0
+    for target_field in target_fields:
+        assert (use_header_map and target_field in available_headers.keys()) or target_field in dataset_df_full.columns, f'Target field {target_field} not found in metadata.'
+
+    mapped_targets = [field for field in target_fields if use_header_map and field in available_headers.keys()]
+    unmapped_targets = [field for field in target_fields if field not in mapped_targets]
+
+    # Only the target columns are read from the dataset. A record is empty when all the matched
+    # columns are empty (required fields without a matched column are always empty).
+    target_columns = {}
+    if mapped_targets:
+        record_num = get_first_empty_row(dataset_df_full, available_headers.values())
+        for target_field in mapped_targets:
+            target_column = dataset_df_full[available_headers[target_field]].iloc[:record_num]
+            target_column.name = target_field
+            target_columns[target_field] = target_column
+
+    if unmapped_targets:
+        record_num = get_first_empty_row(dataset_df_full)
+        for target_field in unmapped_targets:
+            target_columns[target_field] = dataset_df_full[target_field].iloc[:record_num]
+
+    return target_columns
+
+
+def get_first_empty_row(dataset_df, columns=None):
+
+    """Finds the position of the first record with no values in a dataset. The columns are checked one at a time
+    and the search stops as soon as no empty records remain, so only one column is held in memory at a time.
+    
+    :param dataset_df: Dataset dataframe.
+    :type dataset_df: pandas.DataFrame
+    :param columns: Columns to check, defaults to None which checks all columns.
+    :type columns: List[str] or None
+    :return: Position of the first empty record, or the number of records if there are no empty records
+    :rtype: int
+    
+    """
+
+    if columns is not None:
+        columns = set(columns)
+
+    empty_rows = None
+    for column_name, column in dataset_df.items():
+        if columns is not None and column_name not in columns:
+            continue
+        if empty_rows is None:
+            empty_rows = column.isna().to_numpy()
+        else:
+            np.logical_and(empty_rows, column.isna().to_numpy(), out=empty_rows)
+        if not empty_rows.any():
+            return len(dataset_df)
+
+    if empty_rows is None:
+        # No columns to check, every record is empty
+        return 0
+    return int(empty_rows.argmax())
+
+
+def clean_coverage_values(data_values, coverage_params, check_cardinality=True):
+
+    """Cleans the data values of a target field for coverage analysis: missing values are filled or dropped,
+    and for integer fields numeric values are extracted from the text and thresholded.
+    
+    :param data_values: Data values of the target field.
+    :type data_values: pandas.Series
+    :param coverage_params: Dictionary containing parameters for coverage analysis including fill_na, dtype, and thresholds.
+    :type coverage_params: dict
+    :param check_cardinality: Whether to check that the field has few enough distinct values for coverage analysis (see is_coverage_field).
+        Chunks of a file are cleaned without the check, which is applied once to the whole file.
+    :type check_cardinality: bool
+    :return: Processed data values ready for coverage analysis, or 0 if coverage cannot be computed
+    :rtype: pandas.Series
+    
+    """
+
+    if check_cardinality and not is_coverage_field(len(data_values.unique()), len(data_values)):
         print('Coverage cannot be computed')
         return 0
 
     if coverage_params['fill_na'] is not None:
-        data_values = dataset_df[target_field].fillna(coverage_params['fill_na'])
+        if isinstance(data_values.dtype, pd.CategoricalDtype) and coverage_params['fill_na'] not in data_values.cat.categories:
+            data_values = data_values.cat.add_categories([coverage_params['fill_na']])
+        data_values = data_values.fillna(coverage_params['fill_na'])
     else:
-        data_values = dataset_df[target_field].dropna()
+        data_values = data_values.dropna()
+
+    if isinstance(data_values.dtype, pd.CategoricalDtype):
+        # Categories of records that were dropped are not part of the field values
+        data_values = data_values.cat.remove_unused_categories()
 
-    # If data type is int, attempt to use regex to extract values from text
+    # If data type is int, use regex to extract values from text
     if coverage_params['dtype'] == 'int':
-        try:
-            data_values = data_values.str.extract(r'0*(\d+)', expand=False).astype('int32')
-        except:
-            data_values = data_values.astype('int32')
+        data_values = parse_int_values(data_values)
         if coverage_params['thresholds'] is not None:
             data_values = data_values[(data_values >= coverage_params['thresholds'][0]) & (data_values <= coverage_params['thresholds'][1])]
 
     return data_values
 
 
+def is_coverage_field(num_unique, record_num):
+
+    """Checks whether a field has few enough distinct values for coverage analysis.
+    Fields where the distinct values make up more than 90% of the records (e.g. identifiers) are not coverage fields.
+    
+    :param num_unique: Number of distinct values of the field, including missing values.
+    :type num_unique: int
+    :param record_num: Number of records.
+    :type record_num: int
+    :return: Whether coverage can be computed for the field
+    :rtype: bool
+    
+    """
+    return num_unique <= 0.9*record_num
+
+
+def parse_int_value(value):
+    """Parses an integer from a metadata value. For strings, the first number in the text is used
+    (e.g. '045Y' is parsed as 45). Numeric values are truncated to integers.
+    
+    :param value: Metadata value.
+    :type value: str or int or float
+    :return: Parsed integer, or None if the value could not be parsed
+    :rtype: int or None
+    
+    """
+    if isinstance(value, str):
+        match = _INT_VALUE_PATTERN.search(value)
+        return int(match.group(1)) if match else None
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool) and np.isfinite(value):
+        return int(value)
+    return None
+
+
+def parse_int_values(data_values):
+    """Parses integers from the values of a metadata field. Each distinct value is parsed once with parse_int_value
+    and the results are mapped back to the records through the value codes. Records whose value could not be
+    parsed, or whose value is outside the int64 range, are dropped and reported with a warning.
+    
+    :param data_values: Data values of the field.
+    :type data_values: pandas.Series
+    :return: Parsed integer values
+    :rtype: pandas.Series
+    
+    """
+    if pd.api.types.is_integer_dtype(data_values.dtype) and not data_values.hasnans:
+        return data_values.astype('int64')
+
+    if isinstance(data_values.dtype, pd.CategoricalDtype):
+        value_codes = data_values.cat.codes.to_numpy()
+        unique_values = data_values.cat.categories
+    else:
+        value_codes, unique_values = pd.factorize(data_values)
+
+    int64_info = np.iinfo(np.int64)
+    parsed_unique_values = [parse_int_value(value) for value in unique_values]
+    parsed_unique_values = [value if value is not None and int64_info.min <= value <= int64_info.max else None for value in parsed_unique_values]
+    parsed = np.array([value is not None for value in parsed_unique_values] + [False])
+    unique_ints = np.array([value if value is not None else 0 for value in parsed_unique_values] + [0], dtype='int64')
+
+    # Code -1 (missing values) maps to the last, unparsed entry
+    parsed_records = parsed[value_codes]
+    if not parsed_records.all():
+        failed_values = [str(value) for value, parsed_value in zip(unique_values, parsed_unique_values) if parsed_value is None]
+        if (value_codes == -1).any():
+            failed_values.append('NaN')
+        warnings.warn(f"{(~parsed_records).sum()} records of {data_values.name} could not be parsed as integers and were dropped. "
+                      f"Values: {failed_values[:10]}{' ...' if len(failed_values) > 10 else ''}")
+
+    return pd.Series(unique_ints[value_codes], index=data_values.index, name=data_values.name)[parsed_records]
+
+
 def bucket_values(data_values, value_buckets):
 
     """Assigns data values to buckets based on specified bucket centers using
@@ -227,7 +587,342 @@ def bucket_values(data_values, value_buckets):
 
     return data_values
 
+
+def get_coverage_counts(dataset_df_full, required_fields, available_headers=None, coverage_params=None):
+
+    """Computes the count table of the target field values of a chunk or partition of a dataset.
+    Values are cleaned with clean_coverage_values and grouped into value_buckets if specified in coverage_params.
+    Count tables from different chunks can be merged and passed to get_divergence_dfs.
+    The records after the first empty record of the chunk are dropped, and the distinct value check of clean_coverage_values
+    is not applied, as both depend on the whole file. Use get_file_coverage_counts to compute the count table of a file.
+    
+    :param dataset_df_full: Dataset dataframe or chunk of a dataset to process.
+    :type dataset_df_full: pandas.DataFrame
+    :param required_fields: List of fields that are required for analysis.
+    :type required_fields: List[str]
+    :param available_headers: Dictionary mapping required field names to actual column names in the dataset.
+    :type available_headers: dict or None
+    :param coverage_params: Dictionary containing parameters for coverage analysis including target_field, fill_na, dtype, thresholds and value_buckets.
+    :type coverage_params: dict
+    :return: Count table of the target field values
+    :rtype: CountTable
+    
+    """
+
+    target_field = coverage_params['target_field']
+    target_column = get_coverage_columns(dataset_df_full, required_fields, available_headers, [target_field])[target_field]
+    return get_column_counts(target_column, coverage_params)
+
+
+def get_column_counts(target_column, coverage_params):
+
+    """Computes the count table of the cleaned (and bucketed) values of a target field column, without the distinct value check.
+    
+    :param target_column: Data values of the target field.
+    :type target_column: pandas.Series
+    :param coverage_params: Dictionary containing parameters for coverage analysis including fill_na, dtype, thresholds and value_buckets.
+    :type coverage_params: dict
+    :return: Count table of the target field values
+    :rtype: CountTable
+    
+    """
+
+    data_values = clean_coverage_values(target_column, coverage_params, check_cardinality=False)
+    if coverage_params.get('value_buckets') is not None:
+        data_values = bucket_values(data_values, coverage_params['value_buckets'])
+    return CountTable.from_values(data_values)
+
+
+def get_file_coverage_counts(dataset_df, required_fields, available_headers=None, coverage_params=None):
+
+    """Computes the count table of the target field values of a dataset that is given whole or as an iterator of chunks
+    (see load_metadata_file), so that large files can be processed without loading them whole.
+    The results match those of get_coverage_df on the whole dataset: records after the first empty record of the file are dropped,
+    and the distinct value check is applied once to all the records.
     
+    :param dataset_df: Dataset dataframe or iterator of dataframe chunks.
+    :type dataset_df: pandas.DataFrame or Iterator[pandas.DataFrame]
+    :param required_fields: List of fields that are required for analysis.
+    :type required_fields: List[str]
+    :param available_headers: Dictionary mapping required field names to actual column names in the dataset.
+    :type available_headers: dict or None
+    :param coverage_params: Dictionary containing parameters for coverage analysis including target_field, fill_na, dtype, thresholds and value_buckets.
+    :type coverage_params: dict
+    :return: Count table of the target field values, or None if coverage cannot be computed
+    :rtype: CountTable or None
+    
+    """
+
+    dataset_chunks = [dataset_df] if isinstance(dataset_df, pd.DataFrame) else dataset_df
+    target_field = coverage_params['target_field']
+    counts = CountTable()
+    distinct_values = set()
+    has_missing = False
+    record_num = 0
+    for chunk_df in dataset_chunks:
+        target_column = get_coverage_columns(chunk_df, required_fields, available_headers, [target_field])[target_field]
+        record_num += len(target_column)
+        distinct_values.update(target_column.dropna().unique())
+        has_missing = has_missing or bool(target_column.isna().any())
+        counts.merge(get_column_counts(target_column, coverage_params))
+        if len(target_column) < len(chunk_df):
+            # The chunk contains the first empty record of the file
+            break
+
+    if not is_coverage_field(len(distinct_values) + int(has_missing), record_num):
+        print('Coverage cannot be computed')
+        return None
+    return counts
+
+
+def get_coverage_params(metadata_dictionary, metric='HD'):
+
+    """Creates default coverage parameters for every field flagged with checkCoverage in a metadata dictionary.
+    Fields with an 'int' dtype in the dictionary are parsed as integers.
+    
+    :param metadata_dictionary: Metadata dictionary with the field names as keys.
+    :type metadata_dictionary: dict
+    :param metric: Divergence metric, 'KLD' for Kullback–Leibler divergence or 'HD' for Hellinger distance.
+    :type metric: str
+    :return: List of coverage parameter dictionaries, one per coverage field
+    :rtype: List[dict]
+    
+    """
+
+    coverage_params_list = []
+    for field, field_info in metadata_dictionary.items():
+        if field_info.get('checkCoverage', False):
+            coverage_params_list.append({
+                'target_field': field,
+                'field_values': None,
+                'dtype': 'int' if field_info.get('dtype') == 'int' else 'str',
+                'value_buckets': None,
+                'metric': metric,
+                'fill_na': None,
+                'thresholds': None,
+                'bin_count': None,
+            })
+    return coverage_params_list
+
+
+def multi_coverage_check(dataset_df_full, required_fields, available_headers=None, coverage_params_list=None, dataset_df2_full=None, available_headers2=None, num_workers=None):
+
+    """Performs coverage analysis for several target fields at once. The header remapping and record cleaning
+    are done once per dataset for all target fields, after which the distributions and divergences of the
+    fields are computed, optionally in parallel. Target fields that are not available in the metadata are reported
+    in the result table instead of raising an error.
+    
+    :param dataset_df_full: Primary dataset dataframe for coverage analysis.
+    :type dataset_df_full: pandas.DataFrame
+    :param required_fields: List of fields that are required for the analysis.
+    :type required_fields: List[str]
+    :param available_headers: Dictionary mapping required field names to actual column names in the primary dataset.
+    :type available_headers: dict or None
+    :param coverage_params_list: List of coverage parameter dictionaries, one per target field (see get_coverage_params).
+    :type coverage_params_list: List[dict]
+    :param dataset_df2_full: Optional second dataset dataframe for comparative coverage analysis.
+    :type dataset_df2_full: pandas.DataFrame or None
+    :param available_headers2: Dictionary mapping required field names to actual column names in the second dataset.
+    :type available_headers2: dict or None
+    :param num_workers: Number of threads used to process the target fields, defaults to None which processes them sequentially.
+    :type num_workers: int or None
+    :return: Tuple with a dataframe summarizing the coverage of each target field and a dictionary with the normalized distributions of each field
+    :rtype: tuple(pandas.DataFrame, dict)
+    
+    """
+
+    def get_available_targets(dataset_df, headers):
+        return [params['target_field'] for params in coverage_params_list
+                if (headers is not None and params['target_field'] in headers.keys()) or params['target_field'] in dataset_df.columns]
+
+    with profile_stage('multi_coverage_check.extract', target_fields=len(coverage_params_list)):
+        available_targets = get_available_targets(dataset_df_full, available_headers)
+        target_columns = get_coverage_columns(dataset_df_full, required_fields, available_headers, available_targets)
+        if dataset_df2_full is not None:
+            available_targets2 = get_available_targets(dataset_df2_full, available_headers2)
+            target_columns2 = get_coverage_columns(dataset_df2_full, required_fields, available_headers2, available_targets2)
+
+    def compute_field_coverage(coverage_params):
+        target_field = coverage_params['target_field']
+        with profile_stage('multi_coverage_check.field', target_field=target_field) as span:
+            coverage_row = {
+                'target_field': target_field,
+                'metric': coverage_params['metric'],
+                'reference': 'dataset 2' if dataset_df2_full is not None else 'uniform',
+                'records': 0,
+                'unique_values': 0,
+                'divergence': np.nan,
+                'status': 'ok',
+            }
+            if target_field not in target_columns or (dataset_df2_full is not None and target_field not in target_columns2):
+                coverage_row['status'] = 'field not found'
+                return coverage_row, None
+
+            data_values = clean_coverage_values(target_columns[target_field], coverage_params)
+            data_values2 = None
+            if dataset_df2_full is not None:
+                data_values2 = clean_coverage_values(target_columns2[target_field], coverage_params)
+            if not isinstance(data_values, pd.Series) or (dataset_df2_full is not None and not isinstance(data_values2, pd.Series)):
+                coverage_row['status'] = 'too many unique values'
+                return coverage_row, None
+            span.set_shape(data_values)
+
+            if coverage_params.get('value_buckets') is not None:
+                data_values = bucket_values(data_values, coverage_params['value_buckets'])
+                if data_values2 is not None:
+                    data_values2 = bucket_values(data_values2, coverage_params['value_buckets'])
+
+            counts = CountTable.from_values(data_values)
+            counts2 = CountTable.from_values(data_values2) if data_values2 is not None else None
+            if counts.total() == 0 or (counts2 is not None and counts2.total() == 0):
+                # The divergence is not defined without any values, e.g. for a metadata file with a header but no records
+                coverage_row['status'] = 'no values'
+                return coverage_row, None
+            divergence_value, features = get_divergence_dfs(counts, counts2, field_values=coverage_params['field_values'], metric=coverage_params['metric'], fill_value=1)
+
+            coverage_row['records'] = len(data_values)
+            coverage_row['unique_values'] = int((counts.counts > 0).sum())
+            coverage_row['divergence'] = float(divergence_value)
+            return coverage_row, features
+
+    if num_workers is not None and num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            field_results = list(executor.map(compute_field_coverage, coverage_params_list))
+    else:
+        field_results = [compute_field_coverage(coverage_params) for coverage_params in coverage_params_list]
+
+    coverage_summary_df = pd.DataFrame([coverage_row for coverage_row, _ in field_results]).set_index('target_field')
+    coverage_features = {coverage_row['target_field']: features for coverage_row, features in field_results if features is not None}
+
+    print(coverage_summary_df)
+
+    return coverage_summary_df, coverage_features
+
+
+def get_coverage_report(dataset_df_full, required_fields, available_headers=None, dataset_df2_full=None, available_headers2=None, coverage_params=None):
+
+    """Computes the coverage of a target field as a structured report, without printing or plotting.
+    The report contains the counts of the target field values (or a histogram of the values if bin_count is specified)
+    so that the coverage figure can be rendered later with plot_coverage.
+    The datasets can also be given as iterators of dataframe chunks (see load_metadata_file), which are reduced
+    to count tables with get_file_coverage_counts so that the files are never loaded whole.
+    
+    :param dataset_df_full: Primary dataset dataframe or iterator of dataframe chunks for coverage analysis.
+    :type dataset_df_full: pandas.DataFrame or Iterator[pandas.DataFrame]
+    :param required_fields: List of fields that are required for the analysis.
+    :type required_fields: List[str]
+    :param available_headers: Dictionary mapping required field names to actual column names in the primary dataset.
+    :type available_headers: dict or None
+    :param dataset_df2_full: Optional second dataset dataframe or iterator of dataframe chunks for comparative coverage analysis.
+    :type dataset_df2_full: pandas.DataFrame or Iterator[pandas.DataFrame] or None
+    :param available_headers2: Dictionary mapping required field names to actual column names in the second dataset.
+    :type available_headers2: dict or None
+    :param coverage_params: Dictionary containing analysis parameters including target_field, metric, field_values, value_buckets, and bin_count.
+    :type coverage_params: dict
+    :return: Dictionary with the target field, metric, number of records, unique values, divergence, value counts,
+        histogram (or None) and normalized distributions ('features')
+    :rtype: dict
+    
+    """
+
+    if not isinstance(dataset_df_full, pd.DataFrame) or (dataset_df2_full is not None and not isinstance(dataset_df2_full, pd.DataFrame)):
+        with profile_stage('coverage_check.clean', target_field=coverage_params['target_field']):
+            counts = get_file_coverage_counts(dataset_df_full, required_fields, available_headers, coverage_params)
+            counts2 = None
+            if dataset_df2_full is not None:
+                counts2 = get_file_coverage_counts(dataset_df2_full, required_fields, available_headers2, coverage_params)
+        assert counts is not None and (dataset_df2_full is None or counts2 is not None), f"Coverage cannot be computed for {coverage_params['target_field']}."
+        return get_count_coverage_report(counts, counts2, coverage_params)
+
+    with profile_stage('coverage_check.clean', target_field=coverage_params['target_field']) as span:
+        data_values = get_coverage_df(dataset_df_full, required_fields, available_headers, coverage_params)
+
+        group_values_into_buckets = False
+        if 'value_buckets' in coverage_params:
+            if coverage_params['value_buckets'] is not None:
+                group_values_into_buckets = True
+
+        if group_values_into_buckets:
+            data_values = bucket_values(data_values, coverage_params['value_buckets'])
+
+        data_values2 = None
+        if dataset_df2_full is not None:
+            data_values2 = get_coverage_df(dataset_df2_full, required_fields, available_headers2, coverage_params)
+            if group_values_into_buckets:
+                data_values2 = bucket_values(data_values2, coverage_params['value_buckets'])
+        span.set_shape(data_values)
+
+    with profile_stage('coverage_check.divergence', target_field=coverage_params['target_field']):
+        divergence_value, features = get_divergence_dfs(data_values, data_values2, field_values=coverage_params['field_values'], metric=coverage_params['metric'], fill_value=1)
+
+        observed_counts = data_values.value_counts().sort_index()
+        if coverage_params['field_values'] is not None and not all(element in observed_counts.index for element in coverage_params['field_values']):
+            observed_counts = observed_counts.reindex(coverage_params['field_values'], fill_value=0)
+
+        histogram = None
+        if coverage_params.get('bin_count') is not None and pd.api.types.is_numeric_dtype(data_values):
+            bin_counts, bin_edges = np.histogram(data_values.dropna().to_numpy(dtype=float), bins=int(coverage_params['bin_count']))
+            histogram = pd.DataFrame({'left': bin_edges[:-1], 'right': bin_edges[1:], 'count': bin_counts})
+
+    coverage_report = {
+        'target_field': coverage_params['target_field'],
+        'metric': coverage_params['metric'],
+        'reference': 'dataset 2' if dataset_df2_full is not None else 'uniform',
+        'records': len(data_values),
+        'unique_values': np.sort(data_values.unique()),
+        'divergence': float(divergence_value),
+        'counts': observed_counts,
+        'histogram': histogram,
+        'features': features,
+    }
+
+    return coverage_report
+
+
+def get_count_coverage_report(counts, counts2=None, coverage_params=None):
+
+    """Computes the coverage report of a target field (see get_coverage_report) from count tables of its values,
+    such as the count tables of files read in chunks from get_file_coverage_counts.
+    
+    :param counts: Count table of the target field values of the primary dataset.
+    :type counts: CountTable
+    :param counts2: Optional count table of the target field values of a second dataset.
+    :type counts2: CountTable or None
+    :param coverage_params: Dictionary containing analysis parameters including target_field, metric, field_values, value_buckets, and bin_count.
+    :type coverage_params: dict
+    :return: Dictionary with the target field, metric, number of records, unique values, divergence, value counts,
+        histogram (or None) and normalized distributions ('features')
+    :rtype: dict
+    
+    """
+
+    with profile_stage('coverage_check.divergence', target_field=coverage_params['target_field']):
+        divergence_value, features = get_divergence_dfs(counts, counts2, field_values=coverage_params['field_values'], metric=coverage_params['metric'], fill_value=1)
+
+        observed_counts = counts.counts
+        if coverage_params['field_values'] is not None and not all(element in observed_counts.index for element in coverage_params['field_values']):
+            observed_counts = observed_counts.reindex(coverage_params['field_values'], fill_value=0)
+
+        # Bucketed values are categories, for which no histogram is computed
+        histogram = None
+        if coverage_params.get('bin_count') is not None and coverage_params.get('value_buckets') is None and pd.api.types.is_numeric_dtype(counts.counts.index) and len(counts) > 0:
+            # The histogram of the distinct values weighted by their counts is the histogram of the records
+            bin_counts, bin_edges = np.histogram(counts.counts.index.to_numpy(dtype=float), bins=int(coverage_params['bin_count']), weights=counts.counts.to_numpy(dtype=float))
+            histogram = pd.DataFrame({'left': bin_edges[:-1], 'right': bin_edges[1:], 'count': bin_counts.astype('int64')})
+
+    coverage_report = {
+        'target_field': coverage_params['target_field'],
+        'metric': coverage_params['metric'],
+        'reference': 'dataset 2' if counts2 is not None else 'uniform',
+        'records': counts.total(),
+        'unique_values': counts.counts.index[counts.counts.to_numpy() > 0].to_numpy(),
+        'divergence': float(divergence_value),
+        'counts': observed_counts,
+        'histogram': histogram,
+        'features': features,
+    }
+
+    return coverage_report
 
 
 def coverage_check(dataset_df_full, required_fields, available_headers=None, dataset_df2_full=None, available_headers2=None, coverage_params=None, visualize=False,savefig=False):
@@ -256,69 +951,261 @@ def coverage_check(dataset_df_full, required_fields, available_headers=None, dat
     
     """
 
-    data_values = get_coverage_df(dataset_df_full, required_fields, available_headers, coverage_params)
+    coverage_report = get_coverage_report(dataset_df_full, required_fields, available_headers, dataset_df2_full, available_headers2, coverage_params)
 
-    group_values_into_buckets = False
-    if 'value_buckets' in coverage_params:
-        if coverage_params['value_buckets'] is not None:
-            group_values_into_buckets = True
+    print_coverage_report(coverage_report)
 
-    if group_values_into_buckets:
-        data_values = bucket_values(data_values, coverage_params['value_buckets'])
+    if visualize:
+        plot_coverage(coverage_report, savefig=savefig)
+        
+    return coverage_report['features']
 
-    if dataset_df2_full is not None:
-        data_values2 = get_coverage_df(dataset_df2_full, required_fields, available_headers2, coverage_params)
-        if group_values_into_buckets:
-            data_values2 = bucket_values(data_values2, coverage_params['value_buckets'])
-        divergence_value, features = get_divergence_dfs(data_values, data_values2, field_values=coverage_params['field_values'], metric=coverage_params['metric'], fill_value=1)
-    else:
-        divergence_value, features = get_divergence_dfs(data_values, df2=None, field_values=coverage_params['field_values'], metric=coverage_params['metric'], fill_value=1)
 
-    print(f'Number of records (after cleaning and thresholding): {len(data_values)}')
-    print(f"Unique values of {coverage_params['target_field']}: {np.sort(data_values.unique())}")
+def print_coverage_report(coverage_report):
+
+    """Prints the number of records, unique values and divergence of a coverage report (see get_coverage_report).
+    
+    :param coverage_report: Coverage report of the target field.
+    :type coverage_report: dict
+    
+    """
 
-    if coverage_params['metric'] == 'KLD':
+    divergence_value = coverage_report['divergence']
+
+    print(f"Number of records (after cleaning and thresholding): {coverage_report['records']}")
+    print(f"Unique values of {coverage_report['target_field']}: {coverage_report['unique_values']}")
+
+    if coverage_report['metric'] == 'KLD':
         print(f'Divergence metric: Kullback–Leibler divergence')
-    elif coverage_params['metric'] == 'HD':
+    elif coverage_report['metric'] == 'HD':
         print(f'Divergence metric: Hellinger distance')
     else:
         print('Unknown metric')
 
-    if dataset_df2_full is not None:
+    if coverage_report['reference'] == 'dataset 2':
         print(f'Divergence between Dataset 1 and Dataset 2: {divergence_value}')
     else:
         print(f'Divergence from uniform: {divergence_value}')
 
 
-    if visualize:
-        num_unique = len(data_values.unique())
-        if num_unique > 50 and coverage_params['bin_count'] is None:
-            print('Too many values to plot.')
-            return features
-  
-        if coverage_params['bin_count'] is not None:
-            fig_width = 12 + 0.1*int(coverage_params['bin_count'])
+def plot_coverage(coverage_report, savefig=False, max_values=50):
+
+    """Plots the value counts of a coverage report (see get_coverage_report) as a bar chart, or its histogram if the
+    report was computed with a bin_count. If there are more than max_values values, only the most frequent values are plotted.
+    Matplotlib is only imported when this function is called.
+    
+    :param coverage_report: Coverage report of the target field.
+    :type coverage_report: dict
+    :param savefig: Whether to save generated plots to file with timestamp.
+    :type savefig: bool
+    :param max_values: Maximum number of values in the bar chart. Set to None to plot all values.
+    :type max_values: int or None
+    
+    """
+
+    with profile_stage('coverage_check.render', target_field=coverage_report['target_field']):
+        import matplotlib.pyplot as plt
+
+        histogram = coverage_report['histogram']
+        counts = coverage_report['counts']
+        plot_title = f"Coverage for field: {coverage_report['target_field']}"
+        if histogram is None and max_values is not None and len(counts) > max_values:
+            counts = get_top_counts(counts, max_values)
+            plot_title += f' (top {max_values} of {len(coverage_report["counts"])} values)'
+        num_unique = len(counts)
+
+        if histogram is not None:
+            fig_width = 12 + 0.1*len(histogram)
             fig, ax = plt.subplots(1,1,figsize=(fig_width,6))
-            data_values.plot(ax=ax,kind='hist',bins=coverage_params['bin_count'], edgecolor='black',
-                                                         title=f"{coverage_params['target_field']} Coverage",fontsize=6)
+            bin_edges = np.append(histogram['left'].to_numpy(), histogram['right'].iloc[-1])
+            ax.hist(bin_edges[:-1], bins=bin_edges, weights=histogram['count'].to_numpy(), edgecolor='black')
+            ax.set_title(f"{coverage_report['target_field']} Coverage")
         else:
             fig_width = 12 + 0.2*num_unique
             fig, ax = plt.subplots(1,1,figsize=(fig_width,6))
-            observed_counts = data_values.value_counts().sort_index()
-            original_indices = observed_counts.index
-            if coverage_params['field_values'] is not None and not all(element in original_indices for element in coverage_params['field_values']):
-                observed_counts = observed_counts.reindex(coverage_params['field_values'], fill_value=0)
-            observed_counts.plot(ax=ax,kind='bar',title=f"Coverage for field: {coverage_params['target_field']}",fontsize=10)
+            counts.plot(ax=ax,kind='bar',title=plot_title,fontsize=10)
         plt.xticks(rotation=0, fontsize=10)
         plt.yticks(fontsize=10)
         plt.xlabel('Items', fontsize=12)
         plt.ylabel('Count', fontsize=12)
         plt.grid(axis='y', linestyle='--', alpha=0.7)
-        for p in ax.patches:
-            ax.annotate(str(p.get_height()), (p.get_x() + p.get_width() / 2., p.get_height()),
-                        ha='center', va='bottom')
+        for container in ax.containers:
+            ax.bar_label(container)
         if savefig:
             timestr = time.strftime("%Y%m%d_%H%M%S")
             fig.savefig('output/Coverage_'+timestr+'.png',bbox_inches='tight',pad_inches=0.1,facecolor='w')
-        
-    return features
+
+
+def get_top_counts(counts, max_values):
+
+    """Selects the most frequent values of a count table for plotting. The selected values keep their original order.
+    
+    :param counts: Counts of the values, indexed by value.
+    :type counts: pandas.Series
+    :param max_values: Number of values to select.
+    :type max_values: int
+    :return: Counts of the max_values most frequent values.
+    :rtype: pandas.Series
+    
+    """
+
+    top_positions = np.argsort(-counts.to_numpy(dtype=float), kind='stable')[:max_values]
+    return counts.iloc[np.sort(top_positions)]
+
+
+def get_partition_count_tables(dataset_df_full, required_fields, available_headers=None, coverage_params=None, partition_field=None):
+
+    """Computes the count table of the target field values for each partition (e.g. site) of a dataset,
+    where the partitions are given by the values of a partition field. Values are cleaned with clean_coverage_values
+    and grouped into value_buckets if specified in coverage_params. Records without a partition value are ignored.
+    
+    :param dataset_df_full: Complete dataset dataframe to process.
+    :type dataset_df_full: pandas.DataFrame
+    :param required_fields: List of fields that are required for analysis.
+    :type required_fields: List[str]
+    :param available_headers: Dictionary mapping required field names to actual column names in the dataset.
+    :type available_headers: dict or None
+    :param coverage_params: Dictionary containing parameters for coverage analysis including target_field, fill_na, dtype, and thresholds.
+    :type coverage_params: dict
+    :param partition_field: Required field or dataset column whose values define the partitions.
+    :type partition_field: str
+    :return: Dictionary with the partition values as keys and count tables as values, or None if coverage cannot be computed
+    :rtype: dict or None
+    
+    """
+
+    target_field = coverage_params['target_field']
+    field_columns = get_coverage_columns(dataset_df_full, required_fields, available_headers, list(dict.fromkeys([target_field, partition_field])))
+    target_column = field_columns[target_field].reset_index(drop=True)
+    partition_column = field_columns[partition_field].reset_index(drop=True)
+
+    data_values = clean_coverage_values(target_column, coverage_params)
+    if not isinstance(data_values, pd.Series):
+        return None
+    data_values = data_values[data_values.index < len(partition_column)]
+
+    if coverage_params.get('value_buckets') is not None:
+        data_values = bucket_values(data_values, coverage_params['value_buckets'])
+
+    partition_values = partition_column.to_numpy()[data_values.index.to_numpy()]
+    partition_count_tables = {}
+    for partition_value, partition_data_values in data_values.groupby(partition_values, sort=True, observed=False):
+        partition_count_tables[str(partition_value)] = CountTable.from_values(partition_data_values)
+
+    return partition_count_tables
+
+
+def site_divergence_check(site_count_tables, field_values=None, metric='HD', fill_value=1, target_field=None, visualize=False, savefig=False):
+
+    """Computes the pairwise divergence between the target field distributions of several sites, and between
+    each site and the pooled distribution of all sites. The count tables are aligned once on the union of their values
+    (or on field_values), after which the full divergence matrix is computed with the batched divergence kernels.
+    For KLD, fill_value is added to all counts of sites with missing values, as in get_divergence_dfs, and the symmetric divergence is used.
+    
+    :param site_count_tables: Dictionary with the site names as keys and count tables of the target field as values.
+    :type site_count_tables: dict
+    :param field_values: Specific field values to include in the comparison. If None, uses all values from the count tables.
+    :type field_values: array-like or None
+    :param metric: Distance metric to use for comparison ("KLD" for Kullback-Leibler divergence, "HD" for Hellinger distance).
+    :type metric: str
+    :param fill_value: Value added to the counts of sites with missing values for KLD.
+    :type fill_value: int
+    :param target_field: Name of the target field, used in the figure title.
+    :type target_field: str or None
+    :param visualize: Whether to plot the divergence matrix as a clustered heatmap.
+    :type visualize: bool
+    :param savefig: Whether to save generated plots to file with timestamp.
+    :type savefig: bool
+    :return: Tuple with the divergence matrix of the sites and the pooled population, and the normalized distributions of the sites and the pooled population
+    :rtype: tuple(pandas.DataFrame, pandas.DataFrame)
+    
+    """
+
+    with profile_stage('site_divergence_check.divergence', sites=len(site_count_tables)):
+        site_names = list(site_count_tables.keys())
+        count_matrix, field_values = get_count_matrix(list(site_count_tables.values()), field_values)
+        count_matrix = np.vstack([count_matrix, count_matrix.sum(axis=0)])
+        row_names = site_names + ['Pooled']
+
+        if metric == 'KLD':
+            missing_values = (count_matrix == 0).any(axis=1)
+            count_matrix[missing_values] += fill_value
+            divergence_matrix = pairwise_kl_div(count_matrix, symmetric=True)
+        else:
+            divergence_matrix = pairwise_hellinger_dist(count_matrix)
+
+        divergence_df = pd.DataFrame(divergence_matrix, index=row_names, columns=row_names)
+        distributions_df = pd.DataFrame(count_matrix / count_matrix.sum(axis=1, keepdims=True), index=row_names, columns=field_values)
+
+    print(f'Number of sites: {len(site_names)}')
+    print(f'Divergence metric: {"Kullback–Leibler divergence" if metric == "KLD" else "Hellinger distance"}')
+    print(divergence_df.round(4))
+
+    if visualize and len(site_names) > 0:
+        plot_site_divergence(divergence_df, metric=metric, target_field=target_field, savefig=savefig)
+
+    return divergence_df, distributions_df
+
+
+def plot_site_divergence(divergence_df, metric='HD', target_field=None, savefig=False):
+
+    """Plots a site divergence matrix (see site_divergence_check) as a heatmap. With more than two sites, the sites are
+    ordered by average-linkage hierarchical clustering and the dendrogram is drawn above the heatmap.
+    The last row of the matrix is the pooled population, which is shown as the last column.
+    Matplotlib is only imported when this function is called.
+    
+    :param divergence_df: Divergence matrix of the sites and the pooled population.
+    :type divergence_df: pandas.DataFrame
+    :param metric: Distance metric of the matrix ("KLD" for Kullback-Leibler divergence, "HD" for Hellinger distance).
+    :type metric: str
+    :param target_field: Name of the target field, used in the figure title.
+    :type target_field: str or None
+    :param savefig: Whether to save generated plots to file with timestamp.
+    :type savefig: bool
+    
+    """
+
+    row_names = list(divergence_df.index)
+    site_names = row_names[:-1]
+    divergence_matrix = divergence_df.to_numpy()
+
+    with profile_stage('site_divergence_check.render', sites=len(site_names)):
+        import matplotlib.pyplot as plt
+
+        site_order = list(range(len(site_names)))
+        link = None
+        if len(site_names) > 2:
+            from scipy.cluster.hierarchy import linkage, leaves_list
+            from scipy.spatial.distance import squareform
+
+            site_matrix = divergence_matrix[:len(site_names), :len(site_names)]
+            link = linkage(squareform((site_matrix + site_matrix.T) / 2, checks=False), method='average')
+            site_order = list(leaves_list(link))
+
+        ordered_rows = [row_names[i] for i in site_order]
+        ordered_columns = ordered_rows + ['Pooled']
+        heatmap_df = divergence_df.loc[ordered_rows, ordered_columns]
+
+        fig_size = 6 + 0.3*len(site_names)
+        fig, (ax_tree, ax) = plt.subplots(2, 1, figsize=(fig_size+2, fig_size+1.5), gridspec_kw={'height_ratios': [1, 5]}, layout='constrained')
+        if link is not None:
+            from scipy.cluster.hierarchy import dendrogram
+            # Dendrogram leaves are placed at 5, 15, 25, ... which align with the heatmap columns
+            dendrogram(link, ax=ax_tree, no_labels=True, color_threshold=0, above_threshold_color='k')
+            ax_tree.set_xlim(0, 10*len(ordered_columns))
+        ax_tree.axis('off')
+
+        image = ax.imshow(heatmap_df.to_numpy(), cmap='viridis', aspect='auto')
+        ax.set_xticks(range(len(ordered_columns)), ordered_columns, rotation=90, fontsize=8)
+        ax.set_yticks(range(len(ordered_rows)), ordered_rows, fontsize=8)
+        if len(site_names) <= 30:
+            for i in range(len(ordered_rows)):
+                for j in range(len(ordered_columns)):
+                    ax.text(j, i, f'{heatmap_df.iat[i, j]:.2f}', ha='center', va='center', fontsize=7, color='w')
+        # The colorbar spans both axes so that the dendrogram and heatmap keep the same width
+        fig.colorbar(image, ax=[ax_tree, ax], label='Hellinger distance' if metric == 'HD' else 'Kullback–Leibler divergence')
+        ax_tree.set_title(f'Site divergence for field: {target_field}' if target_field is not None else 'Site divergence')
+
+        if savefig:
+            timestr = time.strftime("%Y%m%d_%H%M%S")
+            fig.savefig('output/Site_Divergence_'+timestr+'.png',bbox_inches='tight',pad_inches=0.1,facecolor='w')
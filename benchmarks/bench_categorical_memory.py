@@ -0,0 +1,50 @@
+import argparse
+import os
+import tempfile
+import time
+
+from Completeness import *
+from benchmarks.synthetic_metadata import generate_synthetic_metadata, get_all_fields
+
+# Compares the memory use of metadata loaded with the default dtypes and with low-cardinality
+# text columns loaded as categorical columns, for synthetic metadata with the field sets of the bundled dictionaries.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark memory use of categorical ingestion on the bundled dictionary field sets.')
+    parser.add_argument('--reference_paths', type=str, nargs='+', default=[os.path.join(REPO_ROOT, 'data/wsi_metadata_dictionary.json'), os.path.join(REPO_ROOT, 'data/dm_metadata_dictionary.json')], help='Paths to metadata reference dictionaries')
+    parser.add_argument('--num_records', type=int, default=100000, help='Number of records')
+    parser.add_argument('--categorical_threshold', type=float, default=0.5, help='Categorical ingestion threshold')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    print('Dictionary\t\t\tColumns\tDefault (MiB)\tCategorical (MiB)\tReduction\tLoad time (s)')
+    print('---------------------------------------------------------------------------------------------------------')
+    for reference_path in args.reference_paths:
+        metadata_dictionary = load_json(reference_path)
+        field_dtypes = get_all_fields(metadata_dictionary, item_key='dtype')
+        metadata_df, _ = generate_synthetic_metadata(metadata_dictionary, args.num_records, alias_rate=0, seed=args.seed)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            metadata_path = os.path.join(temp_dir, 'metadata.csv')
+            metadata_df.to_csv(metadata_path, index=False)
+
+            start_time = time.perf_counter()
+            default_df = load_metadata_file(metadata_path)
+            default_time = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            categorical_df = load_metadata_file(metadata_path, categorical_threshold=args.categorical_threshold, dtype_hints=field_dtypes)
+            categorical_time = time.perf_counter() - start_time
+
+        default_memory = default_df.memory_usage(deep=True).sum()
+        categorical_memory = categorical_df.memory_usage(deep=True).sum()
+        print('{:<32}{}\t{:.1f}\t\t{:.1f}\t\t\t{:.1f}x\t\t{:.2f} / {:.2f}'.format(
+            os.path.basename(reference_path), metadata_df.shape[1], default_memory/2**20, categorical_memory/2**20,
+            default_memory/categorical_memory, default_time, categorical_time))
+
+
+if __name__ == "__main__":
+    main()
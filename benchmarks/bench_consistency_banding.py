@@ -0,0 +1,101 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from Consistency import *
+
+# Compares subgroup banding and band counting in consistency_check with the per-record
+# assign_band loop followed by a grouped count, and checks that both give identical band counts.
+
+
+def band_counts_per_record(consistency_df, bands, band_labels):
+    """
+    Reference implementation: assign each record to a band with assign_band and count the records with a groupby.
+
+    :param consistency_df: DataFrame with 'Subgroup' and 'Target' columns
+    :type consistency_df: pd.DataFrame
+    :param bands: List of tuples defining the lower and upper bounds for each band.
+    :type bands: List[tuple]
+    :param band_labels: List of labels corresponding to each band range.
+    :type band_labels: List[str]
+    :return: Band counts
+    :rtype: pd.DataFrame
+
+    """
+    consistency_df = consistency_df.copy()
+    consistency_df['band'] = consistency_df['Subgroup'].apply(lambda x: assign_band(x, bands, band_labels))
+    return consistency_df.groupby(['band', 'Target'], observed=False).size().unstack(fill_value=0)
+
+
+def band_counts_vectorized(consistency_df, bands, band_labels):
+    """
+    Vectorized implementation used by consistency_check.
+
+    :param consistency_df: DataFrame with 'Subgroup' and 'Target' columns
+    :type consistency_df: pd.DataFrame
+    :param bands: List of tuples defining the lower and upper bounds for each band.
+    :type bands: List[tuple]
+    :param band_labels: List of labels corresponding to each band range.
+    :type band_labels: List[str]
+    :return: Band counts
+    :rtype: pd.DataFrame
+
+    """
+    consistency_df = consistency_df.copy()
+    consistency_df['band'] = assign_bands(consistency_df['Subgroup'], bands, band_labels)
+    return get_band_counts(consistency_df)
+
+
+def make_consistency_df(num_records, seed=0):
+    """
+    Generate synthetic age and mpp values.
+
+    :param num_records: Number of records
+    :type num_records: int
+    :param seed: Random seed
+    :type seed: int
+    :return: DataFrame with 'Subgroup' and 'Target' columns
+    :rtype: pd.DataFrame
+
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Subgroup': rng.integers(0, 110, num_records).astype('int32'),
+        'Target': rng.choice(['0.25', '0.2527', '0.5', '0.499'], num_records),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark subgroup banding and band counting in consistency_check.')
+    parser.add_argument('--num_records', type=int, nargs='+', default=[10000, 100000, 1000000], help='Numbers of records to benchmark')
+    parser.add_argument('--thresholds', type=int, nargs=2, default=[11, 100], help='Subgroup thresholds')
+    parser.add_argument('--bin_count', type=int, default=15, help='Subgroup band width')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of repetitions per size (best time is reported)')
+    args = parser.parse_args()
+
+    bands = [(i, i+args.bin_count-1) for i in range(args.thresholds[0], args.thresholds[1], args.bin_count)]
+    band_labels = [str(b) for b in bands]
+
+    print(f'Bands: {len(bands)}')
+    print('Records\tPer record (s)\tVectorized (s)')
+    print('---------------------------------------------')
+    for num_records in args.num_records:
+        consistency_df = make_consistency_df(num_records)
+        timings = []
+        band_counts = []
+        for counting_function in (band_counts_per_record, band_counts_vectorized):
+            best_time = float('inf')
+            for _ in range(args.repeat):
+                start_time = time.perf_counter()
+                counts = counting_function(consistency_df, bands, band_labels)
+                best_time = min(best_time, time.perf_counter() - start_time)
+            timings.append(best_time)
+            band_counts.append(counts)
+        pd.testing.assert_frame_equal(*band_counts)
+        print('{}\t{:.4f}\t\t{:.4f}'.format(num_records, *timings))
+
+
+if __name__ == "__main__":
+    main()
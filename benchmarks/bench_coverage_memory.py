@@ -0,0 +1,102 @@
+import argparse
+import os
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from Completeness import *
+from Coverage import *
+
+# Measures the peak memory allocated by a single-field coverage call on a wide synthetic WSI metadata frame.
+# The peak is reported relative to the memory of the target column and of the whole frame.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_wide_metadata(field_aliases, num_records, num_extra_columns, seed=0):
+    """
+    Generate a wide metadata frame with one column per required field and additional vendor columns.
+
+    :param field_aliases: Dictionary with the field names as keys and their aliases as values
+    :type field_aliases: Dictionary
+    :param num_records: Number of records
+    :type num_records: int
+    :param num_extra_columns: Number of additional columns that are not required fields
+    :type num_extra_columns: int
+    :param seed: Random seed
+    :type seed: int
+    :return: Metadata dataframe and header map
+    :rtype: tuple(pd.DataFrame, Dictionary)
+
+    """
+    rng = np.random.default_rng(seed)
+    metadata_columns = {}
+    available_header_map = {}
+    for field in field_aliases:
+        column_name = f'{field} (vendor)'
+        metadata_columns[column_name] = rng.choice(['A', 'B', 'C', 'D', None], num_records)
+        available_header_map[field] = column_name
+    for i in range(num_extra_columns):
+        metadata_columns[f'extra_{i}'] = rng.random(num_records)
+    return pd.DataFrame(metadata_columns), available_header_map
+
+
+def measure_peak_memory(function, *args, **kwargs):
+    """
+    Run a function and return the peak memory allocated by it.
+
+    :param function: Function to run
+    :type function: Callable
+    :return: Peak allocated memory in bytes
+    :rtype: int
+
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    function(*args, **kwargs)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak_memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark peak memory of a coverage call on a wide metadata frame.')
+    parser.add_argument('--reference_path', type=str, default=os.path.join(REPO_ROOT, 'data/wsi_metadata_dictionary.json'), help='Path to metadata reference dictionary')
+    parser.add_argument('--cc_level', type=str, default='Core Fields', help='Dictionary level of the required fields')
+    parser.add_argument('--num_records', type=int, default=200000, help='Number of records')
+    parser.add_argument('--num_extra_columns', type=int, default=200, help='Number of columns that are not required fields')
+    parser.add_argument('--max_column_ratio', type=float, default=None, help='Fail if the peak memory exceeds this multiple of the target column memory')
+    args = parser.parse_args()
+
+    field_aliases = get_field_item(get_dictionary(args.reference_path, args.cc_level))
+    required_fields = list(field_aliases.keys())
+    metadata_df, available_header_map = make_wide_metadata(field_aliases, args.num_records, args.num_extra_columns)
+    target_field = required_fields[0]
+
+    coverage_params = {
+        'target_field': target_field,
+        'field_values': None,
+        'dtype': 'str',
+        'value_buckets': None,
+        'metric': 'HD',
+        'fill_na': None,
+        'thresholds': None,
+        'bin_count': None,
+    }
+
+    frame_memory = metadata_df.memory_usage(deep=False).sum()
+    column_memory = metadata_df[available_header_map[target_field]].memory_usage(deep=False)
+    peak_memory = measure_peak_memory(get_coverage_df, metadata_df, required_fields, available_header_map, coverage_params)
+
+    print(f'Metadata frame: {metadata_df.shape[0]} records x {metadata_df.shape[1]} columns')
+    print(f'Frame memory: {frame_memory/2**20:.1f} MiB')
+    print(f'Target column memory: {column_memory/2**20:.1f} MiB')
+    print(f'Peak memory of get_coverage_df: {peak_memory/2**20:.1f} MiB ({peak_memory/column_memory:.2f} x column, {peak_memory/frame_memory:.3f} x frame)')
+
+    if args.max_column_ratio is not None and peak_memory > args.max_column_ratio*column_memory:
+        raise SystemExit(f'Peak memory exceeds {args.max_column_ratio} x the target column memory.')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import time
+
+import numpy as np
+
+from Coverage import *
+
+# Compares the batched pairwise divergence kernels with calling the scalar divergence functions
+# on every pair of sites, and checks that both give the same divergence matrices without modifying the inputs.
+
+
+def pairwise_divergence_loop(count_matrix, metric='HD', symmetric=False):
+    """
+    Reference implementation: call the scalar divergence function for every pair of rows.
+
+    :param count_matrix: Count matrix with one distribution per row
+    :type count_matrix: numpy.ndarray
+    :param metric: 'KLD' for Kullback–Leibler divergence or 'HD' for Hellinger distance
+    :type metric: str
+    :param symmetric: If True, the symmetric KL divergence is computed
+    :type symmetric: bool
+    :return: Divergence matrix
+    :rtype: numpy.ndarray
+
+    """
+    num_sites = count_matrix.shape[0]
+    divergence_matrix = np.empty((num_sites, num_sites))
+    for i in range(num_sites):
+        for j in range(num_sites):
+            if metric == 'KLD':
+                divergence_matrix[i, j] = calculate_kl_div(count_matrix[i], count_matrix[j], symmetric=symmetric)
+            else:
+                divergence_matrix[i, j] = calculate_hellinger_dist(count_matrix[i], count_matrix[j])
+    return divergence_matrix
+
+
+def pairwise_divergence_batched(count_matrix, metric='HD', symmetric=False):
+    """
+    Batched implementation.
+
+    :param count_matrix: Count matrix with one distribution per row
+    :type count_matrix: numpy.ndarray
+    :param metric: 'KLD' for Kullback–Leibler divergence or 'HD' for Hellinger distance
+    :type metric: str
+    :param symmetric: If True, the symmetric KL divergence is computed
+    :type symmetric: bool
+    :return: Divergence matrix
+    :rtype: numpy.ndarray
+
+    """
+    if metric == 'KLD':
+        return pairwise_kl_div(count_matrix, symmetric=symmetric)
+    return pairwise_hellinger_dist(count_matrix)
+
+
+def make_count_matrix(num_sites, num_values, seed=0):
+    """
+    Generate site count vectors with some zero counts.
+
+    :param num_sites: Number of sites
+    :type num_sites: int
+    :param num_values: Number of field values
+    :type num_values: int
+    :param seed: Random seed
+    :type seed: int
+    :return: Count matrix (sites x field values)
+    :rtype: numpy.ndarray
+
+    """
+    rng = np.random.default_rng(seed)
+    count_matrix = rng.integers(0, 1000, (num_sites, num_values)).astype(np.float64)
+    count_matrix[rng.random((num_sites, num_values)) < 0.1] = 0
+    return count_matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batched pairwise divergence kernels against the scalar divergence functions.')
+    parser.add_argument('--num_sites', type=int, nargs='+', default=[10, 50, 150], help='Numbers of sites to benchmark')
+    parser.add_argument('--num_values', type=int, default=20, help='Number of field values per site')
+    args = parser.parse_args()
+
+    print('Sites\tMetric\t\tPairwise loop (s)\tBatched (s)')
+    print('---------------------------------------------------------')
+    for num_sites in args.num_sites:
+        count_matrix = make_count_matrix(num_sites, args.num_values)
+        for metric, symmetric in (('HD', False), ('KLD', False), ('KLD', True)):
+            input_matrix = count_matrix.copy()
+            timings = []
+            divergence_matrices = []
+            for divergence_function in (pairwise_divergence_loop, pairwise_divergence_batched):
+                start_time = time.perf_counter()
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    divergence_matrices.append(divergence_function(input_matrix, metric, symmetric))
+                timings.append(time.perf_counter() - start_time)
+            assert np.array_equal(input_matrix, count_matrix), 'Input count matrix was modified.'
+            np.testing.assert_allclose(divergence_matrices[1], divergence_matrices[0], rtol=1e-10, atol=1e-12)
+            metric_name = metric + (' (sym)' if symmetric else '')
+            print('{}\t{:<10}\t{:.4f}\t\t\t{:.4f}'.format(num_sites, metric_name, *timings))
+
+
+if __name__ == "__main__":
+    main()
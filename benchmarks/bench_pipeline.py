@@ -0,0 +1,202 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+import warnings
+
+from Completeness import *
+from Coverage import *
+from Consistency import *
+from benchmarks.bench_coverage_memory import measure_peak_memory
+from benchmarks.synthetic_metadata import generate_synthetic_metadata, get_field_kind
+
+# Times and memory-profiles the dataset-level completeness, record-level completeness, coverage and consistency checks
+# on synthetic metadata generated from a reference dictionary, for a range of record counts.
+# Results can be stored as a JSON report and compared with a previous report to catch performance regressions.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_benchmark_params(metadata_reference_dictionary):
+    """
+    Get coverage parameters for the benchmarked checks from the required fields of a reference dictionary.
+    The first integer or age field is used as the consistency subgroup and the first text field flagged with
+    checkCoverage is used as the coverage and consistency target.
+
+    :param metadata_reference_dictionary: Reference dictionary of the assessed level
+    :type metadata_reference_dictionary: Dictionary
+    :return: Coverage parameters of the subgroup field and of the target field
+    :rtype: tuple(Dictionary, Dictionary)
+
+    """
+    field_kinds = {field: get_field_kind(field, field_info.get('dtype')) for field, field_info in metadata_reference_dictionary.items()}
+    subgroup_field = next(field for field, kind in field_kinds.items() if kind == 'age')
+    target_field = next(field for field, kind in field_kinds.items()
+                        if kind == 'categorical' and metadata_reference_dictionary[field].get('checkCoverage', False))
+
+    coverage_params_subgroup = {
+        'target_field': subgroup_field,
+        'field_values': None,
+        'dtype': 'int',
+        'metric': 'HD',
+        'fill_na': None,
+        'thresholds': [11, 100],
+        'bin_count': 15,
+    }
+    coverage_params_target = {
+        'target_field': target_field,
+        'field_values': None,
+        'dtype': 'str',
+        'value_buckets': None,
+        'metric': 'HD',
+        'fill_na': None,
+        'thresholds': None,
+        'bin_count': None,
+    }
+    return coverage_params_subgroup, coverage_params_target
+
+
+def get_benchmark_stages(metadata_df, metadata_reference_dictionary):
+    """
+    Get the benchmarked checks as functions without arguments. The header map used by the record-level, coverage and
+    consistency checks is matched once beforehand, so that each stage only measures its own check.
+
+    :param metadata_df: Synthetic metadata
+    :type metadata_df: pd.DataFrame
+    :param metadata_reference_dictionary: Reference dictionary of the assessed level
+    :type metadata_reference_dictionary: Dictionary
+    :return: Dictionary with the stage names as keys and the check functions as values
+    :rtype: Dictionary
+
+    """
+    field_aliases = get_field_item(metadata_reference_dictionary)
+    required_fields = list(field_aliases.keys())
+    field_matching_methods = {
+        'strict':(False,None),
+        'dictionary':(True,{'field_dictionary':field_aliases}),
+        'soft': (False,None),
+        'fuzzy': (False,None),
+        'UA':(False,None)
+    }
+    with contextlib.redirect_stdout(io.StringIO()):
+        available_header_map = dataset_level_completeness_check(metadata_df, required_fields, field_matching_methods)['available_header_map']
+    coverage_params_subgroup, coverage_params_target = get_benchmark_params(metadata_reference_dictionary)
+
+    return {
+        'dataset_level_completeness_check': lambda: dataset_level_completeness_check(metadata_df, required_fields, field_matching_methods),
+        'record_level_completeness_check': lambda: record_level_completeness_check(metadata_df, required_fields, available_header_map),
+        'coverage_check': lambda: coverage_check(metadata_df, required_fields, available_header_map, coverage_params=coverage_params_target),
+        'consistency_check': lambda: consistency_check(metadata_df, required_fields, available_header_map,
+                                                       coverage_params_subgroup, coverage_params_target, visualize=False),
+    }
+
+
+def run_stage(stage_function, repeat=3, memory=False):
+    """
+    Time a check, and optionally measure its peak allocated memory in a separate run.
+    Terminal output and warnings of the check are suppressed.
+
+    :param stage_function: Check function without arguments
+    :type stage_function: Callable
+    :param repeat: Number of timed runs. The fastest run is reported.
+    :type repeat: int
+    :param memory: Flag to measure the peak allocated memory
+    :type memory: bool
+    :return: Dictionary with the run time in seconds and the peak memory in MiB (None if not measured)
+    :rtype: Dictionary
+
+    """
+    run_times = []
+    with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            stage_function()
+            run_times.append(time.perf_counter() - start_time)
+        # Memory is measured in a separate run because tracing allocations slows the check down
+        peak_memory = measure_peak_memory(stage_function)/2**20 if memory else None
+    return {'seconds': min(run_times), 'peak_memory_mib': peak_memory}
+
+
+def find_regressions(results, baseline_results, max_regression=1.5):
+    """
+    Compare benchmark results with the results of a baseline report.
+
+    :param results: Benchmark results
+    :type results: List[Dictionary]
+    :param baseline_results: Benchmark results of the baseline report
+    :type baseline_results: List[Dictionary]
+    :param max_regression: Largest allowed ratio of the run time or peak memory to the baseline
+    :type max_regression: float
+    :return: Descriptions of the results that exceed the allowed ratio
+    :rtype: List[str]
+
+    """
+    baseline = {(r['dictionary'], r['stage'], r['num_records'], r['num_columns']): r for r in baseline_results}
+    regressions = []
+    for result in results:
+        baseline_result = baseline.get((result['dictionary'], result['stage'], result['num_records'], result['num_columns']))
+        if baseline_result is None:
+            continue
+        for key in ['seconds', 'peak_memory_mib']:
+            if result[key] is None or not baseline_result.get(key):
+                continue
+            ratio = result[key] / baseline_result[key]
+            if ratio > max_regression:
+                regressions.append(f"{result['stage']} ({result['num_records']} records): {key} {result[key]:.3f} vs {baseline_result[key]:.3f} ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the completeness, coverage and consistency checks on synthetic metadata.')
+    parser.add_argument('--reference_path', type=str, default=os.path.join(REPO_ROOT, 'data/wsi_metadata_dictionary.json'), help='Path to metadata reference dictionary')
+    parser.add_argument('--cc_level', type=str, default="Core Fields", help='The level at which the checks are assessed.')
+    parser.add_argument('--num_records', type=int, nargs='+', default=[10000, 100000, 1000000], help='Record counts to benchmark')
+    parser.add_argument('--num_columns', type=int, default=None, help='Number of columns, defaults to one column per dictionary field')
+    parser.add_argument('--as_categorical', action='store_true', help='Keep the synthetic columns categorical, which is needed for very large record counts')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs per check')
+    parser.add_argument('--memory', action='store_true', help='Measure the peak allocated memory of each check')
+    parser.add_argument('--report_path', type=str, default=None, help='Path of a JSON report of the results')
+    parser.add_argument('--baseline_path', type=str, default=None, help='Path of a JSON report to compare the results with')
+    parser.add_argument('--max_regression', type=float, default=1.5, help='Fail if a run time or peak memory exceeds this ratio of the baseline')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    metadata_dictionary = load_json(args.reference_path)
+    metadata_reference_dictionary = get_dictionary(args.reference_path, args.cc_level)
+
+    results = []
+    print('Records\t\tColumns\tCheck\t\t\t\t\tTime (s)\tPeak memory (MiB)')
+    print('-----------------------------------------------------------------------------------------------')
+    for num_records in args.num_records:
+        metadata_df, _ = generate_synthetic_metadata(metadata_dictionary, num_records, args.num_columns, as_categorical=args.as_categorical, seed=args.seed)
+        for stage, stage_function in get_benchmark_stages(metadata_df, metadata_reference_dictionary).items():
+            stage_result = run_stage(stage_function, args.repeat, args.memory)
+            results.append({
+                'dictionary': os.path.basename(args.reference_path),
+                'stage': stage,
+                'num_records': num_records,
+                'num_columns': metadata_df.shape[1],
+                **stage_result,
+            })
+            peak_memory = f"{stage_result['peak_memory_mib']:.1f}" if stage_result['peak_memory_mib'] is not None else '-'
+            print('{:<12}\t{}\t{:<36}\t{:.3f}\t\t{}'.format(num_records, metadata_df.shape[1], stage, stage_result['seconds'], peak_memory))
+        del metadata_df
+
+    if args.report_path is not None:
+        with open(args.report_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline_path is not None:
+        with open(args.baseline_path, 'r') as f:
+            baseline_results = json.load(f)
+        regressions = find_regressions(results, baseline_results, args.max_regression)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        assert not regressions, f'{len(regressions)} results exceed {args.max_regression}x the baseline.'
+
+
+if __name__ == "__main__":
+    main()
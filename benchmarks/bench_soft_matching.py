@@ -0,0 +1,85 @@
+import argparse
+import os
+import random
+import time
+
+from Completeness import *
+from benchmarks.synthetic_metadata import get_all_fields
+
+# Compares soft field matching with a single-pass substring automaton against the
+# nested loop of substring checks between every required field and every dataset header.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def soft_field_matching_nested_loop(dataset_fields, required_fields):
+    """
+    Reference nested-loop implementation of soft field matching (last matching header wins).
+
+    :param dataset_fields: Header fields present in dataset metadata.
+    :type dataset_fields: List[str]
+    :param required_fields: Fields of interest.
+    :type required_fields: List[str]
+    :return: Dictionary with required_fields present in dataset_fields as keys and the corresponding dataset fields as values
+    :rtype: Dictionary
+
+    """
+    cleaned_dataset_fields = [(clean_string(item), item) for item in dataset_fields]
+    field_mappings = {}
+    for field in required_fields:
+        cleaned_field = clean_string(field)
+        for cleaned_dataset_field, dataset_field in cleaned_dataset_fields:
+            if cleaned_field in cleaned_dataset_field:
+                field_mappings[field] = dataset_field
+    return field_mappings
+
+
+def make_headers(field_aliases, num_headers, seed=0):
+    """
+    Generate vendor-style headers by decorating field names and aliases with prefixes and suffixes.
+
+    :param field_aliases: Dictionary with the field names as keys and their aliases as values
+    :type field_aliases: Dictionary
+    :param num_headers: Number of headers to generate
+    :type num_headers: int
+    :param seed: Random seed
+    :type seed: int
+    :return: List of headers
+    :rtype: List[str]
+
+    """
+    rng = random.Random(seed)
+    names = [a for k, v in field_aliases.items() for a in [k] + v if a]
+    prefixes = ['', 'Scanner.', 'aperio_', 'DICOM ', 'tiff:', 'openslide.']
+    suffixes = ['', ' (raw)', '_v2', ' [units]', '.1']
+    return [f'{rng.choice(prefixes)}{rng.choice(names)}{rng.choice(suffixes)}_{i}' for i in range(num_headers)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark soft field matching against the number of dataset headers.')
+    parser.add_argument('--reference_path', type=str, default=os.path.join(REPO_ROOT, 'data/wsi_metadata_dictionary.json'), help='Path to metadata reference dictionary')
+    parser.add_argument('--num_headers', type=int, nargs='+', default=[100, 1000, 5000, 20000], help='Numbers of dataset headers to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of repetitions per size (best time is reported)')
+    args = parser.parse_args()
+
+    field_aliases = get_all_fields(load_json(args.reference_path))
+    required_fields = list(field_aliases.keys())
+
+    print(f'Required fields: {len(required_fields)}')
+    print('Headers\tNested loop (s)\tAutomaton (s)')
+    print('---------------------------------------------')
+    for num_headers in args.num_headers:
+        dataset_fields = make_headers(field_aliases, num_headers)
+        timings = []
+        for matching_function in (soft_field_matching_nested_loop, soft_field_matching):
+            best_time = float('inf')
+            for _ in range(args.repeat):
+                start_time = time.perf_counter()
+                matching_function(dataset_fields, required_fields)
+                best_time = min(best_time, time.perf_counter() - start_time)
+            timings.append(best_time)
+        print('{}\t{:.4f}\t\t{:.4f}'.format(num_headers, *timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import os
+import sys
+import json
+import subprocess
+
+# Measures the startup time of the completeness pipeline in a fresh interpreter and checks
+# that the dictionary-only matching path does not import the heavy optional backends.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['torch', 'sentence_transformers', 'rapidfuzz', 'matplotlib', 'scipy']
+
+STARTUP_SCRIPT = """
+import sys
+import time
+import json
+start_time = time.perf_counter()
+import pandas as pd
+from Completeness import *
+import_time = time.perf_counter() - start_time
+
+metadata_reference_dictionary = get_dictionary('data/wsi_metadata_dictionary.json', 'Core Fields')
+field_aliases = get_field_item(metadata_reference_dictionary)
+required_fields = list(field_aliases.keys())
+metadata_df = pd.DataFrame(columns=['Patient Identifier', 'Sex', 'Scanner Model', 'Vendor', 'Unrelated Field'])
+field_matching_methods = {
+    'strict':(True,None),
+    'dictionary':(True,{'field_dictionary':field_aliases}),
+    'soft': (False,None),
+    'fuzzy': (False,None),
+    'UA':(False,None)
+}
+completeness_report = dataset_level_completeness_check(metadata_df, required_fields, field_matching_methods)
+total_time = time.perf_counter() - start_time
+print(json.dumps({
+    'import_time': import_time,
+    'total_time': total_time,
+    'heavy_modules': [m for m in HEAVY_MODULES if m in sys.modules],
+}))
+"""
+
+
+def run_startup(repeat=5):
+    """
+    Run the dictionary-only completeness path in fresh interpreters.
+
+    :param repeat: Number of interpreter launches
+    :type repeat: int
+    :return: List of timing results, one per launch
+    :rtype: List[Dictionary]
+
+    """
+
+    script = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n" + STARTUP_SCRIPT
+    results = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', script], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup time of the dictionary-only completeness path.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of interpreter launches')
+    parser.add_argument('--max_seconds', type=float, default=1.0, help='Fail if the median time to a completeness report exceeds this value')
+    args = parser.parse_args()
+
+    results = run_startup(args.repeat)
+    import_times = sorted(r['import_time'] for r in results)
+    total_times = sorted(r['total_time'] for r in results)
+    median_import = import_times[len(import_times)//2]
+    median_total = total_times[len(total_times)//2]
+    heavy_modules = sorted({m for r in results for m in r['heavy_modules']})
+
+    print(f'Median import time: {median_import:.3f} s')
+    print(f'Median time to completeness report: {median_total:.3f} s')
+    print(f'Heavy modules imported: {heavy_modules if heavy_modules else "none"}')
+
+    assert 'torch' not in heavy_modules, 'Dictionary-only matching imported torch.'
+    assert not heavy_modules, f'Dictionary-only matching imported {heavy_modules}.'
+    assert median_total < args.max_seconds, f'Startup took {median_total:.3f} s (limit {args.max_seconds} s).'
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from Completeness import *
+
+# Generates synthetic metadata tables from the fields of a reference dictionary.
+# Headers can be renamed to field aliases, values have skewed distributions, missing values are injected
+# and numeric fields are written as noisy strings (e.g. '045Y'), as in real DICOM and WSI exports.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IDENTIFIER_KEYWORDS = ['ID', 'Identifier', 'UID', 'Accession']
+NUMERIC_KEYWORDS = ['MPP', 'Resolution', 'Spacing', 'Thickness', 'Width', 'Height', 'Magnification']
+
+
+def get_all_fields(metadata_dictionary, item_key='aliases'):
+    """
+    Collect the field names and an item of each field (by default, the aliases) at every level of a reference dictionary.
+
+    :param metadata_dictionary: Nested reference dictionary
+    :type metadata_dictionary: Dictionary
+    :param item_key: Key name for the item to be retrieved
+    :type item_key: str
+    :return: Dictionary with the field names as keys and the specified items as values
+    :rtype: Dictionary
+
+    """
+    fields = {}
+    for k, v in metadata_dictionary.items():
+        if isinstance(v, dict) and 'aliases' in v:
+            fields[k] = v.get(item_key)
+        elif isinstance(v, dict):
+            fields.update(get_all_fields(v, item_key))
+    return fields
+
+
+def get_field_kind(field, dtype):
+    """
+    Get the kind of synthetic values generated for a field from its name and reference dictionary dtype.
+
+    :param field: Field name
+    :type field: str
+    :param dtype: Reference dictionary dtype of the field
+    :type dtype: str
+    :return: 'identifier', 'age', 'date', 'time', 'numeric' or 'categorical'
+    :rtype: str
+
+    """
+    words = field.replace('/', ' ').replace('_', ' ').split()
+    if any(keyword in words for keyword in IDENTIFIER_KEYWORDS):
+        return 'identifier'
+    if dtype == 'int' or 'Age' in words:
+        return 'age'
+    if 'Date' in words:
+        return 'date'
+    if 'Time' in words:
+        return 'time'
+    if any(keyword in field for keyword in NUMERIC_KEYWORDS):
+        return 'numeric'
+    return 'categorical'
+
+
+def get_skewed_probabilities(num_values, skew):
+    """
+    Get Zipf-like probabilities for a number of values, where the probability of the value of rank r is proportional to 1/r^skew.
+
+    :param num_values: Number of values
+    :type num_values: int
+    :param skew: Skew exponent, 0 gives a uniform distribution
+    :type skew: float
+    :return: Probabilities
+    :rtype: numpy.ndarray
+
+    """
+    weights = 1.0 / np.arange(1, num_values+1)**skew
+    return weights / weights.sum()
+
+
+def make_synthetic_values(field, kind, num_records, rng, skew=1.0, noise_rate=0.1):
+    """
+    Generate the synthetic values of a field as a categorical column.
+
+    :param field: Field name
+    :type field: str
+    :param kind: Kind of values (see get_field_kind)
+    :type kind: str
+    :param num_records: Number of records
+    :type num_records: int
+    :param rng: Random number generator
+    :type rng: numpy.random.Generator
+    :param skew: Skew exponent of the value distribution
+    :type skew: float
+    :param noise_rate: Fraction of numeric values written in an alternative text format
+    :type noise_rate: float
+    :return: Field values
+    :rtype: pandas.Categorical
+
+    """
+    if kind == 'identifier':
+        return pd.Categorical.from_codes(np.arange(num_records), categories=[f'{field}-{i:09d}' for i in range(num_records)])
+
+    if kind == 'age':
+        values = np.arange(18, 96)
+        labels = [f'{value:03d}Y' for value in values] + [f'{value} years' for value in values] + [f'{value}' for value in values]
+        codes = rng.choice(len(values), num_records, p=get_skewed_probabilities(len(values), skew/4)[rng.permutation(len(values))])
+        noise = rng.random(num_records) < noise_rate
+        codes[noise] += len(values)*rng.integers(1, 3, noise.sum())
+        return pd.Categorical.from_codes(codes, categories=labels)
+
+    if kind == 'date':
+        labels = (pd.Timestamp('2010-01-01') + pd.to_timedelta(np.arange(3650), unit='D')).strftime('%Y%m%d')
+    elif kind == 'time':
+        labels = [f'{hour:02d}{minute:02d}00' for hour in range(7, 20) for minute in range(60)]
+    elif kind == 'numeric':
+        base_values = [0.25, 0.5, 1.0, 2.0]
+        labels = [f'{value}' for value in base_values] + [f'{value:.4f}' for value in base_values] + [f'{value} um' for value in base_values]
+        codes = rng.choice(len(base_values), num_records, p=get_skewed_probabilities(len(base_values), skew))
+        noise = rng.random(num_records) < noise_rate
+        codes[noise] += len(base_values)*rng.integers(1, 3, noise.sum())
+        return pd.Categorical.from_codes(codes, categories=labels)
+    else:
+        labels = [f'{field} {i}' for i in range(rng.integers(2, 12))]
+
+    codes = rng.choice(len(labels), num_records, p=get_skewed_probabilities(len(labels), skew))
+    return pd.Categorical.from_codes(codes, categories=labels)
+
+
+def generate_synthetic_metadata(metadata_dictionary, num_records, num_columns=None, alias_rate=0.5, missing_rate=0.1, skew=1.0, noise_rate=0.1, as_categorical=False, seed=0):
+    """
+    Generate a synthetic metadata table from the fields of a reference dictionary.
+
+    :param metadata_dictionary: Reference dictionary. Fields are collected from all levels.
+    :type metadata_dictionary: Dictionary
+    :param num_records: Number of records
+    :type num_records: int
+    :param num_columns: Number of columns, defaults to None which creates one column per field.
+        With fewer columns than fields, the first fields are used. Additional columns are filled with unrelated fields.
+    :type num_columns: int
+    :param alias_rate: Fraction of columns named with a field alias instead of the field name
+    :type alias_rate: float
+    :param missing_rate: Average fraction of missing values per column
+    :type missing_rate: float
+    :param skew: Skew exponent of the value distributions, 0 gives uniform distributions
+    :type skew: float
+    :param noise_rate: Fraction of numeric values written in an alternative text format
+    :type noise_rate: float
+    :param as_categorical: Flag to return categorical columns instead of text columns, which keeps very large tables in memory
+    :type as_categorical: bool
+    :param seed: Random seed
+    :type seed: int
+    :return: Tuple with the metadata dataframe and the header map with the field names as keys and the column names as values
+    :rtype: tuple(pd.DataFrame, Dictionary)
+
+    """
+    rng = np.random.default_rng(seed)
+    field_aliases = get_all_fields(metadata_dictionary)
+    field_dtypes = get_all_fields(metadata_dictionary, item_key='dtype')
+
+    fields = list(field_aliases.keys())
+    if num_columns is None:
+        num_columns = len(fields)
+    fields = fields[:num_columns]
+
+    metadata_columns = {}
+    header_map = {}
+    for field in fields:
+        aliases = [alias for alias in field_aliases[field] if alias and alias not in metadata_columns]
+        column_name = field
+        if aliases and rng.random() < alias_rate:
+            column_name = aliases[rng.integers(len(aliases))]
+        if column_name in metadata_columns:
+            continue
+        metadata_columns[column_name] = make_synthetic_values(field, get_field_kind(field, field_dtypes[field]), num_records, rng, skew, noise_rate)
+        header_map[field] = column_name
+
+    for i in range(num_columns - len(metadata_columns)):
+        metadata_columns[f'Unrelated Field {i}'] = make_synthetic_values(f'Unrelated {i}', 'categorical', num_records, rng, skew, noise_rate)
+
+    for column_name, values in metadata_columns.items():
+        # Missing rates vary between columns around the average rate
+        missing = rng.random(num_records) < rng.uniform(0, 2*missing_rate)
+        codes = values.codes.copy()
+        codes[missing] = -1
+        values = pd.Categorical.from_codes(codes, categories=values.categories)
+        metadata_columns[column_name] = values if as_categorical else np.asarray(values, dtype=object)
+
+    return pd.DataFrame(metadata_columns), header_map
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic metadata file from a reference dictionary.')
+    parser.add_argument('--reference_path', type=str, default=os.path.join(REPO_ROOT, 'data/wsi_metadata_dictionary.json'), help='Path to metadata reference dictionary')
+    parser.add_argument('--output_path', type=str, default='output/synthetic_metadata.csv', help='Path of the generated metadata file (csv, xlsx, parquet or feather)')
+    parser.add_argument('--num_records', type=int, default=10000, help='Number of records')
+    parser.add_argument('--num_columns', type=int, default=None, help='Number of columns, defaults to one column per dictionary field')
+    parser.add_argument('--alias_rate', type=float, default=0.5, help='Fraction of columns named with a field alias')
+    parser.add_argument('--missing_rate', type=float, default=0.1, help='Average fraction of missing values per column')
+    parser.add_argument('--skew', type=float, default=1.0, help='Skew exponent of the value distributions')
+    parser.add_argument('--noise_rate', type=float, default=0.1, help='Fraction of numeric values written in an alternative text format')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    metadata_df, header_map = generate_synthetic_metadata(load_json(args.reference_path), args.num_records, args.num_columns, args.alias_rate,
+                                                          args.missing_rate, args.skew, args.noise_rate, seed=args.seed)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output_path)), exist_ok=True)
+    file_type = get_metadata_file_type(args.output_path)
+    if file_type == 'parquet':
+        metadata_df.to_parquet(args.output_path, index=False)
+    elif file_type == 'feather':
+        metadata_df.to_feather(args.output_path)
+    elif file_type in ('xls', 'xlsx'):
+        metadata_df.to_excel(args.output_path, index=False)
+    else:
+        metadata_df.to_csv(args.output_path, index=False)
+
+    # The true header map is stored next to the metadata file so that matching results can be checked
+    with open(os.path.splitext(args.output_path)[0] + '_header_map.json', 'w') as f:
+        json.dump(header_map, f, indent=2)
+
+    print(f'Generated {metadata_df.shape[0]} records x {metadata_df.shape[1]} columns in {args.output_path}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import os
+import json
+import time
+
+from Completeness import *
+from Coverage import *
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Provide a directory or manifest of dataset metadata files and a reference dictionary. Each file is scored for completeness, and optionally for coverage (--coverage). The consistency check is not part of batch runs; use dcard_consistency_main.py for single files.')
+    parser.add_argument('--data_path', type=str, default=None, help='Path to a directory of metadata files or to a manifest file with one metadata file path per line')
+    parser.add_argument('--reference_path', type=str, default=None, help='Path to metadata reference dictionary')
+    parser.add_argument('--cc_level', type=str, default="Core Fields", help='The level at which completeness should be assessed.')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Directory for caching matched header maps and user-assisted matching answers. Caching is disabled if not provided.')
+    parser.add_argument('--num_workers', type=int, default=None, help='Number of worker processes. Defaults to the number of CPUs.')
+    parser.add_argument('--chunksize', type=int, default=None, help='Number of rows per chunk for record-level checks. Defaults to loading each file whole.')
+    parser.add_argument('--coverage', action='store_true', help='Also compute the coverage of every field flagged with checkCoverage in the reference dictionary for each file, against a uniform distribution. The matched columns of each file are then loaded whole, even with --chunksize.')
+    parser.add_argument('--report_path', type=str, default=None, help='Path of the consolidated JSON report. Defaults to a timestamped file in the output directory.')
+    args = parser.parse_args()
+
+    metadata_reference_path = args.reference_path
+    batch_data_path = args.data_path
+    completeness_check_level = args.cc_level
+    assert metadata_reference_path is not None, 'Reference dictionary path not specified.'
+    assert batch_data_path is not None, 'Metadata directory or manifest path not specified.'
+
+    # Create output directory to store the report
+    os.makedirs('output', exist_ok=True)
+    report_path = args.report_path
+    if report_path is None:
+        timestr = time.strftime("%Y%m%d_%H%M%S")
+        report_path = 'output/Batch_Completeness_'+timestr+'.json'
+
+    # Load required metadata fields from a json dictionary once for the whole batch.
+    metadata_reference_dictionary = get_dictionary(metadata_reference_path,completeness_check_level)
+    field_aliases = get_field_item(metadata_reference_dictionary)
+    required_fields = list(field_aliases.keys())
+
+    file_paths = get_batch_file_paths(batch_data_path)
+    print(f"Assessing completeness for {len(file_paths)} metadata files")
+
+    # The alias index is compiled once and shared by all files in the batch.
+    # User-assisted matching is interactive and cannot be used in batch mode.
+    field_matching_methods = {
+        'strict':(False,None),
+        'dictionary':(True,{'alias_index':compile_alias_index(field_aliases)}),
+        'soft': (False,None),
+        'fuzzy': (False,{'similarity_threshold':80}),
+        'UA':(False,None)
+    }
+
+    # Coverage parameters of all checkCoverage fields, with the default settings of the coverage module
+    coverage_params_list = get_coverage_params(metadata_reference_dictionary) if args.coverage else None
+
+    start_time = time.time()
+    batch_results = batch_completeness_check(file_paths, required_fields, field_matching_methods,
+                                             num_workers=args.num_workers, chunksize=args.chunksize, cache_dir=args.cache_dir,
+                                             coverage_params_list=coverage_params_list)
+    elapsed_time = time.time() - start_time
+
+    batch_report = {
+        'reference_path': metadata_reference_path,
+        'cc_level': completeness_check_level,
+        'required_fields': required_fields,
+        'files': batch_results,
+    }
+    with open(report_path, 'w') as f:
+        json.dump(batch_report, f, indent=2, default=str, allow_nan=False)
+
+    print('Score\tRecords\tFile')
+    print('---------------------------------------------')
+    for file_result in batch_results:
+        if file_result['status'] == 'ok':
+            print('{:.2f}\t{}\t{}'.format(file_result['completeness_score'], file_result['total_records'], os.path.basename(file_result['file'])))
+        else:
+            print('ERROR\t-\t{}\t{}'.format(os.path.basename(file_result['file']), file_result['error']))
+    print(f"\nScored {len(batch_results)} files in {elapsed_time:.1f} s")
+    print(f"Report saved to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
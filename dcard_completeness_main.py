@@ -10,97 +10,142 @@ def main():
     parser.add_argument('--data_path', type=str, default=None, help='Path to dataset metadata file')
     parser.add_argument('--reference_path', type=str, default=None, help='Path to metadata reference dictionary')
     parser.add_argument('--cc_level', type=str, default="Core Fields", help='The level at which completeness should be assessed.')
+    parser.add_argument('--categorical_threshold', type=float, default=None, help='Load text columns with a ratio of distinct values to records at or below this threshold (e.g. 0.5) as categorical columns to reduce memory use.')
+    parser.add_argument('--chunksize', type=int, default=None, help='Number of rows per chunk for reading the metadata file, so that the record-level check never loads the file whole. Defaults to loading the file whole.')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Directory for caching matched header maps and user-assisted matching answers. Caching is disabled if not provided.')
+    parser.add_argument('--headless', action='store_true', help='Skip figure rendering. Matplotlib is not imported, and the figures can be rendered later from the structured report with dcard_render_main.py.')
+    parser.add_argument('--render_workers', type=int, default=1, help='Number of background worker processes that render the figures while the assessment continues. Set to 0 to render the figures in the main process.')
+    parser.add_argument('--report_path', type=str, default=None, help='Path of a JSON structured report with the header map, scores, count tables and divergences of the run.')
+    parser.add_argument('--report_format', type=str, default='json', choices=['json', 'parquet'], help="Format of the tables of the structured report. With 'parquet', tables are written as Parquet files to a directory next to the JSON report.")
+    parser.add_argument('--profile_path', type=str, default=None, help='Path of a JSON trace with the run time, memory use and record counts of each pipeline stage. A Prometheus text-format file with the same name and a .prom extension is also written. Profiling is disabled if not provided.')
+    parser.add_argument('--profile_memory', action='store_true', help='Also trace the peak Python memory allocation of each pipeline stage with tracemalloc, which slows down the run.')
     args = parser.parse_args()
 
-    metadata_reference_path = args.reference_path
-    metadata_file_path = args.data_path
-    completeness_check_level = args.cc_level
-    assert metadata_reference_path is not None, 'Reference dictionary path not specified.'
-    assert metadata_file_path is not None, 'Metadata file path not specified.'
-
-    # Create output directory to store visualizations
-    os.makedirs('output', exist_ok=True)
-
-    # Load required metadata fields from a json dictionary and retrieve the list of aliases for each field.
-    metadata_reference_dictionary = get_dictionary(metadata_reference_path,completeness_check_level)
-    field_aliases = get_field_item(metadata_reference_dictionary)
-    required_fields = list(field_aliases.keys())
-
-    # Load the dataset metadata
-    # This step loads the dataset metadata (a multi-column CSV/XLS file) into a pandas DataFrame.
-    # Each column represents a metadata attribute (e.g., 'PatientID', 'Modality'), and each row represents a data point.
-    metadata_df = load_metadata_file(metadata_file_path)
-
-    if metadata_df is not None:
-        print(f"Assessing completeness for metadata file '{os.path.basename(metadata_file_path)}'")
-
-    """
-    Perform dataset-level completeness check
-    This checks if the dataset's headers (column names) match the required fields.
-    - Missing Headers: Required fields that are not present in the dataset.
-    - Unexpected Headers: Fields present in the dataset that are not part of the required fields.
-
-    The field_matching_methods dictionary consists of a set of matching methods that are executed in order.
-    The value for each method is a tuple in which the first item is a flag to enable/disable the method
-    and the second item contains any additional parameters needed for that method (or None).
-    `UA` refers to User-Assisted. Enabling this method will use either fuzzy matching or token matching using a language model
-    to return likely matches for header fields that could not be automatically matched.
-    For each such field, the user will receive a prompt to select a field from one of the top N most likely options (specified by 'limit').
-    The token matching option is disabled in this version of the code.
-    """
-
-    field_matching_methods = {
-        'strict':(False,None),
-        'dictionary':(True,{'field_dictionary':field_aliases}),
-        'soft': (False,None),
-        'fuzzy': (False,{'threshold':80}),
-        'UA':(False,{'ranking_method':'LM','limit':4})  # 'fuzzy' or 'LM'
-    }
-
-    if metadata_df is not None and required_fields:
-        completeness_report = dataset_level_completeness_check(metadata_df, required_fields, field_matching_methods)
-
-        # Extract missing and unexpected headers for clarity
-        available_header_map = completeness_report["available_header_map"]
-        missing_headers = completeness_report["missing_headers"]
-        unexpected_headers = completeness_report["unexpected_headers"]
-        completeness_score = completeness_report["completeness_score"]
-
-        # Show header mapping
-        # If there are required fields missing from the dataset, list them.
-        if available_header_map:
-            print('Required Header\t\tMatched Dataset Header')
-            print('---------------------------------------------')
-            for k,v in available_header_map.items():
-                print('{:<20}\t{:<12}'.format(k,v))
+    if args.profile_path is not None:
+        enable_profiling(track_memory=args.profile_memory)
+
+    # The profile is also written if the assessment fails, to help diagnose failed runs
+    try:
+        # Figures are drawn in the background with the Agg backend and saved in the output directory
+        render_queue = RenderQueue(num_workers=args.render_workers) if not args.headless else None
+
+        metadata_reference_path = args.reference_path
+        metadata_file_path = args.data_path
+        completeness_check_level = args.cc_level
+        assert metadata_reference_path is not None, 'Reference dictionary path not specified.'
+        assert metadata_file_path is not None, 'Metadata file path not specified.'
+
+        # Results of the run, written as a structured report if a report path is provided
+        structured_report = {
+            'script': 'completeness',
+            'data_path': metadata_file_path,
+            'reference_path': metadata_reference_path,
+            'cc_level': completeness_check_level,
+        }
+
+        # Create output directory to store visualizations
+        os.makedirs('output', exist_ok=True)
+
+        # Load required metadata fields from a json dictionary and retrieve the list of aliases for each field.
+        metadata_reference_dictionary = get_dictionary(metadata_reference_path,completeness_check_level)
+        field_aliases = get_field_item(metadata_reference_dictionary)
+        required_fields = list(field_aliases.keys())
+
+        # Read the dataset metadata header
+        # The dataset-level check only needs the column names, so the records are loaded after it.
+        # Each column represents a metadata attribute (e.g., 'PatientID', 'Modality'), and each row represents a data point.
+        metadata_header = read_metadata_header(metadata_file_path)
+
+        if metadata_header is not None:
+            print(f"Assessing completeness for metadata file '{os.path.basename(metadata_file_path)}'")
+
+        """
+        Perform dataset-level completeness check
+        This checks if the dataset's headers (column names) match the required fields.
+        - Missing Headers: Required fields that are not present in the dataset.
+        - Unexpected Headers: Fields present in the dataset that are not part of the required fields.
+
+        The field_matching_methods dictionary consists of a set of matching methods that are executed in order.
+        The value for each method is a tuple in which the first item is a flag to enable/disable the method
+        and the second item contains any additional parameters needed for that method (or None).
+        `UA` refers to User-Assisted. Enabling this method will use either fuzzy matching or token matching using a language model
+        to return likely matches for header fields that could not be automatically matched.
+        For each such field, the user will receive a prompt to select a field from one of the top N most likely options (specified by 'limit').
+        The token matching option is disabled in this version of the code.
+        """
+
+        field_matching_methods = {
+            'strict':(False,None),
+            'dictionary':(True,{'field_dictionary':field_aliases}),
+            'soft': (False,None),
+            'fuzzy': (False,{'similarity_threshold':80}),
+            'UA':(False,{'ranking_method':'LM','limit':4})  # 'fuzzy' or 'LM'
+        }
+
+        if metadata_header is not None and required_fields:
+            completeness_report = dataset_level_completeness_check(metadata_header, required_fields, field_matching_methods, cache_dir=args.cache_dir)
+
+            # Extract missing and unexpected headers for clarity
+            available_header_map = completeness_report["available_header_map"]
+            # Reference dictionary dtypes of the matched columns, used when loading columns as categorical
+            dtype_hints = get_dtype_hints(metadata_reference_dictionary, available_header_map)
+            missing_headers = completeness_report["missing_headers"]
+            unexpected_headers = completeness_report["unexpected_headers"]
+            completeness_score = completeness_report["completeness_score"]
+
+            # Show header mapping
+            # If there are required fields missing from the dataset, list them.
+            if available_header_map:
+                print('Required Header\t\tMatched Dataset Header')
+                print('---------------------------------------------')
+                for k,v in available_header_map.items():
+                    print('{:<20}\t{:<12}'.format(k,v))
+            else:
+                print(f"All required fields are missing for {completeness_check_level}.")
+
+            # Step 4: Report Missing Headers
+            # If there are required fields missing from the dataset, list them.
+            if missing_headers:
+                print(f"\nMissing Headers: {missing_headers}\n")
+            else:
+                print("No missing headers. All required fields are present.")
+
+            # Step 5: Report Unexpected Headers
+            # If the dataset contains extra fields not listed in the required fields, list them.
+            if unexpected_headers:
+                print(f"Unexpected Headers: {unexpected_headers}\n")
+            else:
+                print("No unexpected headers. All dataset fields are required.")
+
+            # Step 6: Report Completeness Score
+            print(f"Completeness Score: {completeness_score:.2f}")
+
+            # Step 7: Perform record-level completeness check
+            # This loads the dataset metadata (a multi-column CSV/XLS file) into a pandas DataFrame,
+            # checks individual columns and rows in the metadata file and reports completion information
+            # With a chunksize, an iterator of dataframe chunks is returned and the records are counted chunk by chunk
+            metadata_df = load_metadata_file(metadata_file_path, chunksize=args.chunksize, categorical_threshold=args.categorical_threshold, dtype_hints=dtype_hints)
+            assert metadata_df is not None, 'Failed to load dataset.'
+            record_level_results = record_level_completeness_check(metadata_df, required_fields, available_header_map,visualize=False)
+            if render_queue is not None:
+                render_queue.submit(plot_record_completeness, record_level_results, list(available_header_map.keys()), savefig=True)
+
+            structured_report['completeness'] = completeness_report
+            structured_report['record_completeness'] = record_level_results
+            structured_report['available_fields'] = list(available_header_map.keys())
         else:
-            print(f"All required fields are missing for {completeness_check_level}.")
+            # Handle cases where either the dataset or required fields failed to load.
+            print("Failed to load dataset or required fields.")
 
-        # Step 4: Report Missing Headers
-        # If there are required fields missing from the dataset, list them.
-        if missing_headers:
-            print(f"\nMissing Headers: {missing_headers}\n")
-        else:
-            print("No missing headers. All required fields are present.")
-
-        # Step 5: Report Unexpected Headers
-        # If the dataset contains extra fields not listed in the required fields, list them.
-        if unexpected_headers:
-            print(f"Unexpected Headers: {unexpected_headers}\n")
-        else:
-            print("No unexpected headers. All dataset fields are required.")
-
-        # Step 6: Report Completeness Score
-        print(f"Completeness Score: {completeness_score:.2f}")
+        if args.report_path is not None:
+            write_structured_report(structured_report, args.report_path, table_format=args.report_format)
 
-        # Step 7: Perform record-level completeness check
-        # This checks individual columns and rows in the metadata file and reports completion information
-        record_level_results = record_level_completeness_check(metadata_df, required_fields, available_header_map,visualize=True,savefig=True)
-    else:
-        # Handle cases where either the dataset or required fields failed to load.
-        print("Failed to load dataset or required fields.")
+        if render_queue is not None:
+            render_queue.wait()
+    finally:
+        if args.profile_path is not None:
+            write_profile(args.profile_path, script_name='completeness')
 
-    
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -11,118 +11,164 @@ def main():
     parser.add_argument('--data_path', type=str, default=None, help='Path to dataset metadata file')
     parser.add_argument('--reference_path', type=str, default=None, help='Path to metadata reference dictionary')
     parser.add_argument('--cc_level', type=str, default="Core Fields", help='The level at which completeness should be assessed.')
+    parser.add_argument('--categorical_threshold', type=float, default=None, help='Load text columns with a ratio of distinct values to records at or below this threshold (e.g. 0.5) as categorical columns to reduce memory use.')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Directory for caching matched header maps and user-assisted matching answers. Caching is disabled if not provided.')
+    parser.add_argument('--headless', action='store_true', help='Skip figure rendering. Matplotlib is not imported, and the figures can be rendered later from the structured report with dcard_render_main.py.')
+    parser.add_argument('--render_workers', type=int, default=1, help='Number of background worker processes that render the figures while the assessment continues. Set to 0 to render the figures in the main process.')
+    parser.add_argument('--report_path', type=str, default=None, help='Path of a JSON structured report with the header map, scores, count tables and divergences of the run.')
+    parser.add_argument('--report_format', type=str, default='json', choices=['json', 'parquet'], help="Format of the tables of the structured report. With 'parquet', tables are written as Parquet files to a directory next to the JSON report.")
+    parser.add_argument('--profile_path', type=str, default=None, help='Path of a JSON trace with the run time, memory use and record counts of each pipeline stage. A Prometheus text-format file with the same name and a .prom extension is also written. Profiling is disabled if not provided.')
+    parser.add_argument('--profile_memory', action='store_true', help='Also trace the peak Python memory allocation of each pipeline stage with tracemalloc, which slows down the run.')
     args = parser.parse_args()
 
-    metadata_reference_path = args.reference_path
-    metadata_file_path = args.data_path
-    completeness_check_level = args.cc_level
-    assert metadata_reference_path is not None, 'Reference dictionary path not specified.'
-    assert metadata_file_path is not None, 'Metadata file path not specified.'
-
-    # Create output directory to store visualizations
-    os.makedirs('output', exist_ok=True)
-
-    # Load required metadata fields from a json dictionary and retrieve the list of aliases for each field.
-    metadata_reference_dictionary = get_dictionary(metadata_reference_path,completeness_check_level)
-    field_aliases = get_field_item(metadata_reference_dictionary)
-    required_fields = list(field_aliases.keys())
-
-    # Load the dataset metadata
-    # This step loads the dataset metadata (a multi-column CSV/XLS file) into a pandas DataFrame.
-    # Each column represents a metadata attribute (e.g., 'PatientID', 'Modality'), and each row represents a data point.
-    metadata_df = load_metadata_file(metadata_file_path)
-
-    if metadata_df is not None:
-        print(f"Assessing completeness for metadata file '{os.path.basename(metadata_file_path)}'")
-
-    """
-    Perform dataset-level completeness check
-    This checks if the dataset's headers (column names) match the required fields.
-    - Missing Headers: Required fields that are not present in the dataset.
-    - Unexpected Headers: Fields present in the dataset that are not part of the required fields.
-
-    The field_matching_methods dictionary consists of a set of matching methods that are executed in order.
-    The value for each method is a tuple in which the first item is a flag to enable/disable the method
-    and the second item contains any additional parameters needed for that method (or None).
-    `UA` refers to User-Assisted. Enabling this method will use either fuzzy matching or token matching using a language model
-    to return likely matches for header fields that could not be automatically matched.
-    For each such field, the user will receive a prompt to select a field from one of the top N most likely options (specified by 'limit').
-    The token matching option is disabled in this version of the code.
-    """
-
-    field_matching_methods = {
-        'strict':(False,None),
-        'dictionary':(True,{'field_dictionary':field_aliases}),
-        'soft': (False,None),
-        'fuzzy': (False,{'threshold':80}),
-        'UA':(False,{'ranking_method':'LM','limit':4})  # 'fuzzy' or 'LM'
-    }
-
-    if metadata_df is not None and required_fields:
-        completeness_report = dataset_level_completeness_check(metadata_df, required_fields, field_matching_methods)
-
-        # Extract missing and unexpected headers for clarity
-        available_header_map = completeness_report["available_header_map"]
-
-        # Show header mapping
-        # If there are required fields missing from the dataset, list them.
-        if available_header_map:
-            print('Required Header\t\tMatched Dataset Header')
-            print('---------------------------------------------')
-            for k,v in available_header_map.items():
-                print('{:<20}\t{:<12}'.format(k,v))
+    if args.profile_path is not None:
+        enable_profiling(track_memory=args.profile_memory)
+
+    # The profile is also written if the assessment fails, to help diagnose failed runs
+    try:
+        # Figures are drawn in the background with the Agg backend and saved in the output directory
+        render_queue = RenderQueue(num_workers=args.render_workers) if not args.headless else None
+
+        metadata_reference_path = args.reference_path
+        metadata_file_path = args.data_path
+        completeness_check_level = args.cc_level
+        assert metadata_reference_path is not None, 'Reference dictionary path not specified.'
+        assert metadata_file_path is not None, 'Metadata file path not specified.'
+
+        # Results of the run, written as a structured report if a report path is provided
+        structured_report = {
+            'script': 'consistency',
+            'data_path': metadata_file_path,
+            'reference_path': metadata_reference_path,
+            'cc_level': completeness_check_level,
+        }
+
+        # Create output directory to store visualizations
+        os.makedirs('output', exist_ok=True)
+
+        # Load required metadata fields from a json dictionary and retrieve the list of aliases for each field.
+        metadata_reference_dictionary = get_dictionary(metadata_reference_path,completeness_check_level)
+        field_aliases = get_field_item(metadata_reference_dictionary)
+        required_fields = list(field_aliases.keys())
+
+        # Read the dataset metadata header
+        # Header matching only needs the column names. The records of the matched columns are loaded afterwards.
+        # Each column represents a metadata attribute (e.g., 'PatientID', 'Modality'), and each row represents a data point.
+        metadata_header = read_metadata_header(metadata_file_path)
+
+        if metadata_header is not None:
+            print(f"Assessing completeness for metadata file '{os.path.basename(metadata_file_path)}'")
+
+        """
+        Perform dataset-level completeness check
+        This checks if the dataset's headers (column names) match the required fields.
+        - Missing Headers: Required fields that are not present in the dataset.
+        - Unexpected Headers: Fields present in the dataset that are not part of the required fields.
+
+        The field_matching_methods dictionary consists of a set of matching methods that are executed in order.
+        The value for each method is a tuple in which the first item is a flag to enable/disable the method
+        and the second item contains any additional parameters needed for that method (or None).
+        `UA` refers to User-Assisted. Enabling this method will use either fuzzy matching or token matching using a language model
+        to return likely matches for header fields that could not be automatically matched.
+        For each such field, the user will receive a prompt to select a field from one of the top N most likely options (specified by 'limit').
+        The token matching option is disabled in this version of the code.
+        """
+
+        field_matching_methods = {
+            'strict':(False,None),
+            'dictionary':(True,{'field_dictionary':field_aliases}),
+            'soft': (False,None),
+            'fuzzy': (False,{'similarity_threshold':80}),
+            'UA':(False,{'ranking_method':'LM','limit':4})  # 'fuzzy' or 'LM'
+        }
+
+        if metadata_header is not None and required_fields:
+            completeness_report = dataset_level_completeness_check(metadata_header, required_fields, field_matching_methods, cache_dir=args.cache_dir)
+
+            # Extract missing and unexpected headers for clarity
+            available_header_map = completeness_report["available_header_map"]
+            structured_report['completeness'] = completeness_report
+            # Reference dictionary dtypes of the matched columns, used when loading columns as categorical
+            dtype_hints = get_dtype_hints(metadata_reference_dictionary, available_header_map)
+
+            # Show header mapping
+            # If there are required fields missing from the dataset, list them.
+            if available_header_map:
+                print('Required Header\t\tMatched Dataset Header')
+                print('---------------------------------------------')
+                for k,v in available_header_map.items():
+                    print('{:<20}\t{:<12}'.format(k,v))
+            else:
+                print(f"All required fields are missing for {completeness_check_level}.")
         else:
-            print(f"All required fields are missing for {completeness_check_level}.")
-    else:
-        # Handle cases where either the dataset or required fields failed to load.
-        print("Failed to load dataset or required fields.")
+            # Handle cases where either the dataset or required fields failed to load.
+            print("Failed to load dataset or required fields.")
 
 
-    """
-    Perform consistency check of coverage for a specified "target" field against a specified "subgroup" field.
+        """
+        Perform consistency check of coverage for a specified "target" field against a specified "subgroup" field.
 
-    Two coverage parameter dictionaries need to be specified, one of each field. 
+        Two coverage parameter dictionaries need to be specified, one of each field. 
 
-    The coverage_params dictionary consists of the required parameters for the coverage check:
+        The coverage_params dictionary consists of the required parameters for the coverage check:
     
-        - target_field : The metadata field for which coverage will be computed
-        - field_values : All possible values for the target field. If set to None, field_values will be generated from the unique values of the target_field in the metadata.
-        - dtype (Optional): 'str' for string or 'int' for integer type. Needed along with regex to extract data values from metadata field item strings
-        - value_buckets (Optional): For numeric variables, a list of buckets to group values into before computing consistency
-        - metric: 'KLD' for Kullback–Leibler divergence or 'HD' for Hellinger distance
-        - fill_na (Optional): Fill NA values in target field with a specific value. Set to 'None' to drop all NA values
-        - thresholds (Optional): For numeric variables, only compute coverage within a specified range of values. Eg: [10, 80]
-        - bin_count (Optional): For numeric variables, number of bins to generate a histogram plot
-    """
-    
-    coverage_params_subgroup = {
-        'target_field': "Patient Birth Date/Age",
-        'field_values': None,
-        'dtype': 'int',
-        'metric': 'HD',
-        'fill_na': None,
-        'thresholds': [11, 100],
-        'bin_count': 15,
-    }
-
-    coverage_params_target = {
-        'target_field': "mpp",
-        'field_values': None,
-        'dtype': 'str',
-        'value_buckets': None,
-        'metric': 'HD',
-        'fill_na': None,
-        'thresholds': None,
-        'bin_count': None,
-    }
-
-
-    print(f"\n\nConsistency Information: {coverage_params_target['target_field']} for subgroups of {coverage_params_subgroup['target_field']}")
-
-    f = consistency_check(metadata_df, required_fields, available_headers=available_header_map, 
-                        coverage_params_subgroup=coverage_params_subgroup, coverage_params_target=coverage_params_target,
-                        visualize=True,savefig=True)             
+            - target_field : The metadata field for which coverage will be computed
+            - field_values : All possible values for the target field. If set to None, field_values will be generated from the unique values of the target_field in the metadata.
+            - dtype (Optional): 'str' for string or 'int' for integer type. Needed along with regex to extract data values from metadata field item strings
+            - value_buckets (Optional): For numeric variables, a list of buckets to group values into before computing consistency
+            - metric: 'KLD' for Kullback–Leibler divergence or 'HD' for Hellinger distance
+            - fill_na (Optional): Fill NA values in target field with a specific value. Set to 'None' to drop all NA values
+            - thresholds (Optional): For numeric variables, only compute coverage within a specified range of values. Eg: [10, 80]
+            - bin_count (Optional): For numeric variables, number of bins to generate a histogram plot
+        """
     
+        coverage_params_subgroup = {
+            'target_field': "Patient Birth Date/Age",
+            'field_values': None,
+            'dtype': 'int',
+            'metric': 'HD',
+            'fill_na': None,
+            'thresholds': [11, 100],
+            'bin_count': 15,
+        }
+
+        coverage_params_target = {
+            'target_field': "mpp",
+            'field_values': None,
+            'dtype': 'str',
+            'value_buckets': None,
+            'metric': 'HD',
+            'fill_na': None,
+            'thresholds': None,
+            'bin_count': None,
+        }
+
+
+        # Load the dataset metadata (a multi-column CSV/XLS file) into a pandas DataFrame.
+        # If the subgroup and target fields are matched required fields, only the matched columns are read.
+        target_fields = [coverage_params_subgroup['target_field'], coverage_params_target['target_field']]
+        metadata_df = load_metadata_file(metadata_file_path, usecols=get_target_usecols(available_header_map, target_fields), categorical_threshold=args.categorical_threshold, dtype_hints=dtype_hints)
+
+        print(f"\n\nConsistency Information: {coverage_params_target['target_field']} for subgroups of {coverage_params_subgroup['target_field']}")
+
+        # The consistency check is run in stages so that the consistency report can be stored and rendered separately
+        consistency_df = get_consistency_df(metadata_df, required_fields, available_headers=available_header_map,
+                                            coverage_params_subgroup=coverage_params_subgroup, coverage_params_target=coverage_params_target)
+        consistency_report = get_consistency_report(consistency_df, coverage_params_subgroup, coverage_params_target)
+        print(consistency_report['band_counts'])
+        if render_queue is not None:
+            render_queue.submit(plot_consistency, consistency_report, savefig=True)
+        structured_report['consistency'] = consistency_report
+
+        if args.report_path is not None:
+            write_structured_report(structured_report, args.report_path, table_format=args.report_format)
+
+        if render_queue is not None:
+            render_queue.wait()
+    finally:
+        if args.profile_path is not None:
+            write_profile(args.profile_path, script_name='consistency')
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
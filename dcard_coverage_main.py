@@ -9,123 +9,246 @@ def main():
     parser.add_argument('--reference_data_path', type=str, default=None, help='Path to second dataset metadata file for coverage comparison')
     parser.add_argument('--reference_path', type=str, default=None, help='Path to metadata reference dictionary')
     parser.add_argument('--cc_level', type=str, default="Core Fields", help='The level at which completeness should be assessed. Required for header matching.')
+    parser.add_argument('--all_coverage_fields', action='store_true', help='Compute coverage for all fields flagged with checkCoverage in the reference dictionary and save a summary table.')
+    parser.add_argument('--num_workers', type=int, default=None, help='Number of threads used to compute coverage for multiple fields.')
+    parser.add_argument('--site_data_paths', type=str, nargs='+', default=None, help='Paths to site metadata files for pairwise site divergence of the target field.')
+    parser.add_argument('--partition_field', type=str, default=None, help='Field or column of the dataset metadata file that defines sites for pairwise site divergence of the target field.')
+    parser.add_argument('--categorical_threshold', type=float, default=None, help='Load text columns with a ratio of distinct values to records at or below this threshold (e.g. 0.5) as categorical columns to reduce memory use.')
+    parser.add_argument('--chunksize', type=int, default=None, help='Number of rows per chunk for reading the metadata files, so that the coverage of the target field and the site divergence of site files are computed without loading the files whole. The coverage of all coverage fields (--all_coverage_fields) and of a partition field (--partition_field) need the whole metadata file, which is then loaded whole. Defaults to loading the files whole.')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Directory for caching matched header maps and user-assisted matching answers. Caching is disabled if not provided.')
+    parser.add_argument('--headless', action='store_true', help='Skip figure rendering. Matplotlib is not imported, and the figures can be rendered later from the structured report with dcard_render_main.py.')
+    parser.add_argument('--render_workers', type=int, default=1, help='Number of background worker processes that render the figures while the assessment continues. Set to 0 to render the figures in the main process.')
+    parser.add_argument('--report_path', type=str, default=None, help='Path of a JSON structured report with the header map, scores, count tables and divergences of the run.')
+    parser.add_argument('--report_format', type=str, default='json', choices=['json', 'parquet'], help="Format of the tables of the structured report. With 'parquet', tables are written as Parquet files to a directory next to the JSON report.")
+    parser.add_argument('--profile_path', type=str, default=None, help='Path of a JSON trace with the run time, memory use and record counts of each pipeline stage. A Prometheus text-format file with the same name and a .prom extension is also written. Profiling is disabled if not provided.')
+    parser.add_argument('--profile_memory', action='store_true', help='Also trace the peak Python memory allocation of each pipeline stage with tracemalloc, which slows down the run.')
     args = parser.parse_args()
 
-    metadata_reference_path = args.reference_path
-    metadata_file_path = args.data_path
-    completeness_check_level = args.cc_level
-    assert metadata_reference_path is not None, 'Reference dictionary path not specified.'
-    assert metadata_file_path is not None, 'Metadata file path not specified.'
-
-    if args.reference_data_path is not None:
-        dataset2_path = args.reference_data_path
-        metadata_df2 = load_metadata_file(dataset2_path)
-    else:
-        metadata_df2 = None
-
-    # Create output directory to store visualizations
-    os.makedirs('output', exist_ok=True)
-
-    # Load required metadata fields from a json dictionary and retrieve the list of aliases for each field.
-    metadata_reference_dictionary = get_dictionary(metadata_reference_path,completeness_check_level)
-    field_aliases = get_field_item(metadata_reference_dictionary)
-    required_fields = list(field_aliases.keys())
-
-    # Load the dataset metadata
-    # This step loads the dataset metadata (a multi-column CSV/XLS file) into a pandas DataFrame.
-    # Each column represents a metadata attribute (e.g., 'PatientID', 'Modality'), and each row represents a data point.
-    metadata_df = load_metadata_file(metadata_file_path)
-
-    if metadata_df is not None:
-        print(f"Assessing completeness for metadata file '{os.path.basename(metadata_file_path)}'")
-
-    """
-    Perform dataset-level completeness check
-    This checks if the dataset's headers (column names) match the required fields.
-    - Missing Headers: Required fields that are not present in the dataset.
-    - Unexpected Headers: Fields present in the dataset that are not part of the required fields.
-
-    The field_matching_methods dictionary consists of a set of matching methods that are executed in order.
-    The value for each method is a tuple in which the first item is a flag to enable/disable the method
-    and the second item contains any additional parameters needed for that method (or None).
-    `UA` refers to User-Assisted. Enabling this method will use either fuzzy matching or token matching using a language model
-    to return likely matches for header fields that could not be automatically matched.
-    For each such field, the user will receive a prompt to select a field from one of the top N most likely options (specified by 'limit').
-    The token matching option is disabled in this version of the code.
-    """
-
-    field_matching_methods = {
-        'strict':(False,None),
-        'dictionary':(True,{'field_dictionary':field_aliases}),
-        'soft': (False,None),
-        'fuzzy': (False,{'threshold':80}),
-        'UA':(False,{'ranking_method':'LM','limit':4})  # 'fuzzy' or 'LM'
-    }
-
-    if metadata_df is not None and required_fields:
-        completeness_report = dataset_level_completeness_check(metadata_df, required_fields, field_matching_methods)
-
-        # Extract missing and unexpected headers for clarity
-        available_header_map = completeness_report["available_header_map"]
-
-        # Show header mapping
-        # If there are required fields missing from the dataset, list them.
-        if available_header_map:
-            print('Required Header\t\tMatched Dataset Header')
-            print('---------------------------------------------')
-            for k,v in available_header_map.items():
-                print('{:<20}\t{:<12}'.format(k,v))
+    if args.profile_path is not None:
+        enable_profiling(track_memory=args.profile_memory)
+
+    # The profile is also written if the assessment fails, to help diagnose failed runs
+    try:
+        # Figures are drawn in the background with the Agg backend and saved in the output directory
+        render_queue = RenderQueue(num_workers=args.render_workers) if not args.headless else None
+
+        metadata_reference_path = args.reference_path
+        metadata_file_path = args.data_path
+        completeness_check_level = args.cc_level
+        assert metadata_reference_path is not None, 'Reference dictionary path not specified.'
+        assert metadata_file_path is not None, 'Metadata file path not specified.'
+
+        # Results of the run, written as a structured report if a report path is provided
+        structured_report = {
+            'script': 'coverage',
+            'data_path': metadata_file_path,
+            'reference_path': metadata_reference_path,
+            'cc_level': completeness_check_level,
+        }
+
+        if args.reference_data_path is not None:
+            dataset2_path = args.reference_data_path
+            metadata_header2 = read_metadata_header(dataset2_path)
         else:
-            print(f"All required fields are missing for {completeness_check_level}.")
-    else:
-        # Handle cases where either the dataset or required fields failed to load.
-        print("Failed to load dataset or required fields.")
-
-    if metadata_df2 is not None and required_fields:
-        completeness_report2 = dataset_level_completeness_check(metadata_df2, required_fields, field_matching_methods)
-        available_header_map2 = completeness_report2["available_header_map"]
-        if available_header_map2:
-            print('Required Header\t\tMatched Dataset 2 Header')
-            print('---------------------------------------------')
-            for k,v in available_header_map2.items():
-                print('{:<20}\t{:<12}'.format(k,v))
+            metadata_header2 = None
+
+        # Create output directory to store visualizations
+        os.makedirs('output', exist_ok=True)
+
+        # Load required metadata fields from a json dictionary and retrieve the list of aliases for each field.
+        metadata_reference_dictionary = get_dictionary(metadata_reference_path,completeness_check_level)
+        field_aliases = get_field_item(metadata_reference_dictionary)
+        required_fields = list(field_aliases.keys())
+
+        # Read the dataset metadata header
+        # Header matching only needs the column names. The records of the matched columns are loaded afterwards.
+        # Each column represents a metadata attribute (e.g., 'PatientID', 'Modality'), and each row represents a data point.
+        metadata_header = read_metadata_header(metadata_file_path)
+
+        if metadata_header is not None:
+            print(f"Assessing completeness for metadata file '{os.path.basename(metadata_file_path)}'")
+
+        """
+        Perform dataset-level completeness check
+        This checks if the dataset's headers (column names) match the required fields.
+        - Missing Headers: Required fields that are not present in the dataset.
+        - Unexpected Headers: Fields present in the dataset that are not part of the required fields.
+
+        The field_matching_methods dictionary consists of a set of matching methods that are executed in order.
+        The value for each method is a tuple in which the first item is a flag to enable/disable the method
+        and the second item contains any additional parameters needed for that method (or None).
+        `UA` refers to User-Assisted. Enabling this method will use either fuzzy matching or token matching using a language model
+        to return likely matches for header fields that could not be automatically matched.
+        For each such field, the user will receive a prompt to select a field from one of the top N most likely options (specified by 'limit').
+        The token matching option is disabled in this version of the code.
+        """
+
+        field_matching_methods = {
+            'strict':(False,None),
+            'dictionary':(True,{'field_dictionary':field_aliases}),
+            'soft': (False,None),
+            'fuzzy': (False,{'similarity_threshold':80}),
+            'UA':(False,{'ranking_method':'LM','limit':4})  # 'fuzzy' or 'LM'
+        }
+
+        if metadata_header is not None and required_fields:
+            completeness_report = dataset_level_completeness_check(metadata_header, required_fields, field_matching_methods, cache_dir=args.cache_dir)
+
+            # Extract missing and unexpected headers for clarity
+            available_header_map = completeness_report["available_header_map"]
+            structured_report['completeness'] = completeness_report
+            # Reference dictionary dtypes of the matched columns, used when loading columns as categorical
+            dtype_hints = get_dtype_hints(metadata_reference_dictionary, available_header_map)
+
+            # Show header mapping
+            # If there are required fields missing from the dataset, list them.
+            if available_header_map:
+                print('Required Header\t\tMatched Dataset Header')
+                print('---------------------------------------------')
+                for k,v in available_header_map.items():
+                    print('{:<20}\t{:<12}'.format(k,v))
+            else:
+                print(f"All required fields are missing for {completeness_check_level}.")
         else:
-            print(f"All required fields are missing for {completeness_check_level}.")
-
-
-    """
-    Perform coverage check for a specified field.
-
-    The coverage_params dictionary consists of the required parameters for the coverage check:
-    
-        - target_field : The metadata field for which coverage will be computed
-        - field_values : All possible values for the target field. If set to None, field_values will be generated from the unique values of the target_field in the metadata.
-        - dtype (Optional): 'str' for string or 'int' for integer type. Needed along with regex to extract data values from metadata field item strings
-        - value_buckets (Optional): For numeric variables, a list of buckets to group values into before computing coverage
-        - metric: 'KLD' for Kullback–Leibler divergence or 'HD' for Hellinger distance
-        - fill_na (Optional): Fill NA values in target field with a specific value. Set to 'None' to drop all NA values
-        - thresholds (Optional): For numeric variables, only compute coverage within a specified range of values. Eg: [10, 80]
-        - bin_count (Optional): For numeric variables, number of bins to generate a histogram plot
-    """
+            # Handle cases where either the dataset or required fields failed to load.
+            print("Failed to load dataset or required fields.")
+
+        if metadata_header2 is not None and required_fields:
+            completeness_report2 = dataset_level_completeness_check(metadata_header2, required_fields, field_matching_methods, cache_dir=args.cache_dir)
+            available_header_map2 = completeness_report2["available_header_map"]
+            structured_report['reference_data_path'] = dataset2_path
+            structured_report['completeness2'] = completeness_report2
+            dtype_hints2 = get_dtype_hints(metadata_reference_dictionary, available_header_map2)
+            if available_header_map2:
+                print('Required Header\t\tMatched Dataset 2 Header')
+                print('---------------------------------------------')
+                for k,v in available_header_map2.items():
+                    print('{:<20}\t{:<12}'.format(k,v))
+            else:
+                print(f"All required fields are missing for {completeness_check_level}.")
+
+
+        """
+        Perform coverage check for a specified field.
+
+        The coverage_params dictionary consists of the required parameters for the coverage check:
     
-    coverage_params = {
-        'target_field': "Resolution/MPP",    
-        'field_values': None,
-        'dtype': 'str',
-        'value_buckets': [0.25, 0.5],
-        'metric': 'HD',
-        'fill_na': None,
-        'thresholds': None,
-        'bin_count': None,
-    }
-
-    print(f"\nCoverage Information: {coverage_params['target_field']}")
-
-    if metadata_df2 is not None and available_header_map2:
-        f = coverage_check(metadata_df, required_fields, available_header_map, metadata_df2, available_header_map2, coverage_params=coverage_params,visualize=True,savefig=True)
-    else:
-        f = coverage_check(metadata_df, required_fields, available_header_map,  None, None, coverage_params=coverage_params,visualize=True,savefig=True)              
+            - target_field : The metadata field for which coverage will be computed
+            - field_values : All possible values for the target field. If set to None, field_values will be generated from the unique values of the target_field in the metadata.
+            - dtype (Optional): 'str' for string or 'int' for integer type. Needed along with regex to extract data values from metadata field item strings
+            - value_buckets (Optional): For numeric variables, a list of buckets to group values into before computing coverage
+            - metric: 'KLD' for Kullback–Leibler divergence or 'HD' for Hellinger distance
+            - fill_na (Optional): Fill NA values in target field with a specific value. Set to 'None' to drop all NA values
+            - thresholds (Optional): For numeric variables, only compute coverage within a specified range of values. Eg: [10, 80]
+            - bin_count (Optional): For numeric variables, number of bins to generate a histogram plot
+        """
     
+        coverage_params = {
+            'target_field': "Resolution/MPP",    
+            'field_values': None,
+            'dtype': 'str',
+            'value_buckets': [0.25, 0.5],
+            'metric': 'HD',
+            'fill_na': None,
+            'thresholds': None,
+            'bin_count': None,
+        }
+
+        target_fields = [coverage_params['target_field']]
+        if args.all_coverage_fields:
+            coverage_params_list = get_coverage_params(metadata_reference_dictionary, metric=coverage_params['metric'])
+            target_fields += [params['target_field'] for params in coverage_params_list if params['target_field'] in available_header_map]
+
+        # Load the dataset metadata (a multi-column CSV/XLS file) into a pandas DataFrame.
+        # The metadata is loaded once for the target field and all coverage fields.
+        # If all target fields are matched required fields, only the matched columns are read.
+        # With a chunksize, the coverage of the target field is computed from an iterator of dataframe chunks,
+        # unless the whole metadata is needed for the coverage of all coverage fields or of a partition field.
+        # The partition field is read along with the target fields, so that the metadata file is only loaded once.
+        chunksize = args.chunksize if not args.all_coverage_fields and args.partition_field is None else None
+        dataset_target_fields = target_fields if args.partition_field is None else target_fields + [args.partition_field]
+        metadata_df = load_metadata_file(metadata_file_path, usecols=get_target_usecols(available_header_map, dataset_target_fields), chunksize=chunksize, categorical_threshold=args.categorical_threshold, dtype_hints=dtype_hints)
+        metadata_df2 = None
+        if metadata_header2 is not None and available_header_map2:
+            metadata_df2 = load_metadata_file(dataset2_path, usecols=get_target_usecols(available_header_map2, target_fields), chunksize=chunksize, categorical_threshold=args.categorical_threshold, dtype_hints=dtype_hints2)
+
+        if args.all_coverage_fields:
+            # Coverage of all checkCoverage fields from a single pass over the metadata
+            print("\nCoverage Summary")
+            coverage_summary_df, _ = multi_coverage_check(metadata_df, required_fields, available_header_map, coverage_params_list,
+                                                          metadata_df2, available_header_map2 if metadata_df2 is not None else None, num_workers=args.num_workers)
+            timestr = time.strftime("%Y%m%d_%H%M%S")
+            coverage_summary_df.to_csv('output/Coverage_Summary_'+timestr+'.csv')
+            structured_report['coverage_summary'] = coverage_summary_df
+
+        print(f"\nCoverage Information: {coverage_params['target_field']}")
+
+        # The coverage check is run in stages so that the coverage report can be stored and rendered separately
+        if metadata_df2 is not None and available_header_map2:
+            coverage_report = get_coverage_report(metadata_df, required_fields, available_header_map, metadata_df2, available_header_map2, coverage_params=coverage_params)
+        else:
+            coverage_report = get_coverage_report(metadata_df, required_fields, available_header_map,  None, None, coverage_params=coverage_params)
+        print_coverage_report(coverage_report)
+        if render_queue is not None:
+            render_queue.submit(plot_coverage, coverage_report, savefig=True)
+        structured_report['coverage'] = coverage_report
+
+        """
+        Perform pairwise site divergence check for the target field.
+
+        Sites are either separate metadata files (--site_data_paths) or the values of a partition field of the dataset metadata file (--partition_field).
+        The divergence of the target field distribution is computed between every pair of sites and between each site and the pooled population.
+        """
+
+        if args.site_data_paths is not None or args.partition_field is not None:
+            print(f"\nSite Divergence: {coverage_params['target_field']}")
+            site_count_tables = {}
+            if args.site_data_paths is not None:
+                for site_path in args.site_data_paths:
+                    site_header = read_metadata_header(site_path)
+                    if site_header is None:
+                        continue
+                    site_header_map = dataset_level_completeness_check(site_header, required_fields, field_matching_methods, cache_dir=args.cache_dir)['available_header_map']
+                    if coverage_params['target_field'] not in site_header_map and coverage_params['target_field'] not in site_header:
+                        print(f"Skipping site '{os.path.basename(site_path)}': target field {coverage_params['target_field']} not found in metadata.")
+                        continue
+                    site_df = load_metadata_file(site_path, usecols=get_target_usecols(site_header_map, [coverage_params['target_field']]), chunksize=args.chunksize, categorical_threshold=args.categorical_threshold, dtype_hints=get_dtype_hints(metadata_reference_dictionary, site_header_map))
+                    if site_df is None:
+                        print(f"Skipping site '{os.path.basename(site_path)}': metadata could not be loaded.")
+                        continue
+                    site_counts = get_file_coverage_counts(site_df, required_fields, site_header_map, coverage_params)
+                    if site_counts is not None:
+                        site_count_tables[os.path.basename(site_path)] = site_counts
+            if args.partition_field is not None:
+                partition_count_tables = get_partition_count_tables(metadata_df, required_fields, available_header_map, coverage_params, args.partition_field)
+                if partition_count_tables is not None:
+                    site_count_tables.update(partition_count_tables)
+
+            if site_count_tables:
+                divergence_df, distributions_df = site_divergence_check(site_count_tables, field_values=coverage_params['field_values'], metric=coverage_params['metric'],
+                                                                        target_field=coverage_params['target_field'])
+                if render_queue is not None:
+                    render_queue.submit(plot_site_divergence, divergence_df, metric=coverage_params['metric'], target_field=coverage_params['target_field'], savefig=True)
+                timestr = time.strftime("%Y%m%d_%H%M%S")
+                divergence_df.to_csv('output/Site_Divergence_'+timestr+'.csv')
+                structured_report['site_divergence'] = {
+                    'target_field': coverage_params['target_field'],
+                    'metric': coverage_params['metric'],
+                    'divergence': divergence_df,
+                    'distributions': distributions_df,
+                }
+            else:
+                print("No site metadata could be loaded.")
+
+        if args.report_path is not None:
+            write_structured_report(structured_report, args.report_path, table_format=args.report_format)
+
+        if render_queue is not None:
+            render_queue.wait()
+    finally:
+        if args.profile_path is not None:
+            write_profile(args.profile_path, script_name='coverage')
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
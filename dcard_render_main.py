@@ -0,0 +1,62 @@
+import argparse
+import os
+
+from Completeness import *
+from Coverage import *
+from Consistency import *
+
+
+
+def render_structured_report(structured_report, savefig=True, num_workers=0):
+    """
+    Render the figures of a structured report written by the completeness, coverage or consistency modules.
+
+    :param structured_report: Structured report (see load_structured_report)
+    :type structured_report: Dictionary
+    :param savefig: Flag to save the figures as pngs in the output directory
+    :type savefig: bool
+    :param num_workers: Number of worker processes rendering the report sections in parallel (see RenderQueue).
+        Defaults to 0, which renders the sections in the current process.
+    :type num_workers: int
+    :return: Number of rendered report sections
+    :rtype: int
+
+    """
+
+    render_queue = RenderQueue(num_workers=num_workers)
+    rendered_sections = 0
+    if structured_report.get('record_completeness') is not None:
+        render_queue.submit(plot_record_completeness, structured_report['record_completeness'], structured_report.get('available_fields'), savefig=savefig)
+        rendered_sections += 1
+    if structured_report.get('coverage') is not None:
+        render_queue.submit(plot_coverage, structured_report['coverage'], savefig=savefig)
+        rendered_sections += 1
+    if structured_report.get('site_divergence') is not None:
+        site_divergence = structured_report['site_divergence']
+        render_queue.submit(plot_site_divergence, site_divergence['divergence'], metric=site_divergence['metric'], target_field=site_divergence['target_field'], savefig=savefig)
+        rendered_sections += 1
+    if structured_report.get('consistency') is not None:
+        render_queue.submit(plot_consistency, structured_report['consistency'], savefig=savefig)
+        rendered_sections += 1
+    render_queue.wait()
+    return rendered_sections
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the figures of a structured report written with --report_path.')
+    parser.add_argument('--report_path', type=str, default=None, help='Path of the JSON structured report')
+    parser.add_argument('--render_workers', type=int, default=1, help='Number of worker processes rendering the report sections in parallel with the Agg backend. Set to 0 to render the figures in the main process.')
+    args = parser.parse_args()
+
+    assert args.report_path is not None, 'Structured report path not specified.'
+
+    # Create output directory to store visualizations
+    os.makedirs('output', exist_ok=True)
+
+    structured_report = load_structured_report(args.report_path)
+    rendered_sections = render_structured_report(structured_report, savefig=True, num_workers=args.render_workers)
+    print(f"Rendered {rendered_sections} report sections from '{os.path.basename(args.report_path)}' to the output directory")
+
+
+if __name__ == "__main__":
+    main()